@@ -1,17 +1,45 @@
+import logging
 import sys
 from PyQt6.QtWidgets import QApplication
+from config import settings
+from core.metrics import configure_logging, start_exporter
 from ui.main_window import ChatWindow
 
+logger = logging.getLogger(__name__)
+
+def create_event_loop(app):
+    """创建运行在 Qt 事件循环上的 asyncio 循环（需要 qasync），不可用时返回 None"""
+    if not settings.ASYNC_UI:
+        return None
+    try:
+        import qasync
+    except ImportError:
+        logger.info("未安装 qasync，请求在后台线程中处理")
+        return None
+    import asyncio
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
+
 def main():
+    configure_logging()
+    start_exporter()  # 设置了 LOCAL_LLM_METRICS_FILE 时定期导出各阶段耗时
     app = QApplication(sys.argv)
     
     # 设置全局样式
     with open('resources/styles/main.qss', 'r') as f:
         app.setStyleSheet(f.read())
     
-    window = ChatWindow()
+    loop = create_event_loop(app)
+    window = ChatWindow(async_ui=loop is not None)
     window.show()
-    sys.exit(app.exec())
+    if loop is None:
+        sys.exit(app.exec())
+    import asyncio
+    closed = asyncio.Event()
+    app.aboutToQuit.connect(closed.set)
+    with loop:
+        loop.run_until_complete(closed.wait())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""批量检索问答：从 JSONL 读取问题，经过与界面相同的检索、上下文打包和生成流程，结果逐行写入 JSONL
+
+用法：python batch_query.py questions.jsonl results.jsonl [--workers 4] [--model gemma3n]
+
+输入每行是 {"id": ..., "query": ...}（id 可省略，默认为行号）或一个 JSON 字符串。
+输出每行对应一个问题（按完成顺序）：
+  {"id", "query", "answer", "retrieved_chunk_ids", "context_chunk_ids",
+   "timings": {"retrieve", "pack", "prompt", "queue", "first_token", "generate", "total"}（秒）, "error"}
+运行可以中断后继续：输出文件中已有的问题会被跳过（--retry-errors 时重新运行出错的问题）。
+同时发往 Ollama 的生成请求数由请求调度器限制（SCHEDULER_LLM_CONCURRENCY），多出的线程排队等待。
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core.langchain_ollama_client import LangchainOllamaAPI
+from core.metrics import configure_logging
+from core.scheduler import Cancelled
+
+
+def read_queries(path):
+    """返回 [(id, query)]；id 统一转为字符串，便于和输出文件中的记录比较"""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"query": item}
+            queries.append((str(item.get("id", line_no)), item["query"]))
+    return queries
+
+
+def read_finished(path, retry_errors=False):
+    """输出文件中已完成的问题 ID
+
+    中断时写了一半的行、以及 retry_errors 时出错的记录会从文件中删除（重写文件），
+    重新运行的结果追加在后面，每个 ID 只保留一条记录。
+    """
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    kept, dropped = [], 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                dropped += 1
+                continue
+            if retry_errors and record.get("error"):
+                dropped += 1
+                continue
+            finished.add(record["id"])
+            kept.append(line if line.endswith("\n") else line + "\n")
+    if dropped:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp_path, path)
+    return finished
+
+
+def answer_query(api, query_id, query, cancel_event):
+    """用与界面相同的 process_query 回答一个问题，返回结果记录"""
+    record = {"id": query_id, "query": query, "answer": "", "retrieved_chunk_ids": [],
+              "context_chunk_ids": [], "timings": {}, "error": None}
+    trace = {}
+    try:
+        for answer in api.process_query(query, cancel_event, raise_errors=True, trace=trace):
+            record["answer"] = answer
+    except Exception as e:
+        record["error"] = str(e)
+    if cancel_event.is_set():
+        raise Cancelled()  # 中断时停止的问题不写入结果，下次运行重新处理
+    record.update(trace)
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量检索问答（JSONL 输入/输出，可中断后继续）")
+    parser.add_argument("input", help="问题 JSONL 文件")
+    parser.add_argument("output", help="结果 JSONL 文件（已存在时追加并跳过已完成的问题）")
+    parser.add_argument("--workers", type=int, default=4, help="并行处理的问题数")
+    parser.add_argument("--model", default="gemma3n")
+    parser.add_argument("--retry-errors", action="store_true", help="重新运行之前出错的问题")
+    parser.add_argument("--no-index-update", action="store_true", help="直接使用现有索引，不检查文档变更")
+    args = parser.parse_args()
+    configure_logging()
+
+    queries = read_queries(args.input)
+    finished = read_finished(args.output, args.retry_errors)
+    pending = [(query_id, query) for query_id, query in queries if query_id not in finished]
+    print(f"共 {len(queries)} 个问题，已完成 {len(queries) - len(pending)} 个，待处理 {len(pending)} 个")
+    if not pending:
+        return
+
+    api = LangchainOllamaAPI(model=args.model, auto_index=False)
+    api.warm_up()
+    print(api.rebuild_index_and_chain(paths=[] if args.no_index_update else None))
+    if api.rag_chain is None:
+        print("错误：索引未就绪，无法处理问题")
+        return
+
+    cancel_event = threading.Event()
+    start = time.perf_counter()
+    done = errors = 0
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(answer_query, api, query_id, query, cancel_event) for query_id, query in pending]
+        try:
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Cancelled:
+                    continue
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()  # 每个结果立即落盘，中断后可以继续
+                done += 1
+                errors += record["error"] is not None
+                print(f"[{done}/{len(pending)}] {record['id']}：{record['timings']['total']:.2f}s"
+                      + (f"，错误: {record['error']}" if record["error"] else ""))
+        except KeyboardInterrupt:
+            print("已中断，正在停止进行中的请求；再次运行同一命令即可继续")
+            cancel_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"完成 {done} 个问题（错误 {errors} 个），耗时 {elapsed:.1f}s，"
+          f"{done / elapsed if elapsed else 0:.2f} 问题/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""RAG 流水线基准：在模拟的 Ollama 服务（benchmarks.fake_ollama）上测量索引吞吐量、检索延迟、
+首个 token 延迟和界面流式输出的开销，不需要 GPU、模型或本机的 Ollama，结果可复现
+
+各阶段：
+  load      load_documents 解析文档（文件/s、MB/s）
+  split     split_documents 分块（块/s）
+  index     rebuild_index_and_chain 全量建索引到临时目录（块/s，含嵌入请求）
+  open      get_vector_db 重新打开索引并完成首次查询
+  retrieve  retrieve 检索延迟（不命中缓存 / 命中缓存）
+  query     process_query 的首个 token 延迟和总耗时，与模拟服务设定的预填充+生成时间比较得到客户端开销
+  worker    StreamingWorker 把每个部分回答送到 Qt 主线程的延迟
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_rag --dir ./documents --queries 20 --tokens-per-second 200
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_ollama import FakeOllama
+from config import settings
+from core.document_loader import iter_document_files
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return "无数据"
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"p50 {statistics.median(values) * 1000:>8.1f} ms  p95 {p95 * 1000:>8.1f} ms"
+
+
+def bench_ingest(api, documents_dir):
+    files = [file_path for _, file_path, _ in iter_document_files(documents_dir)]
+    total_bytes = sum(os.path.getsize(file_path) for file_path in files)
+
+    start = time.perf_counter()
+    documents = [doc for _, docs in api.load_documents(files) if docs for doc in docs]
+    elapsed = time.perf_counter() - start
+    print(f"load      {len(files)} 个文件 {total_bytes / 1e6:.2f} MB  {elapsed:>7.2f} s  "
+          f"{len(files) / elapsed:>7.1f} 文件/s  {total_bytes / elapsed / 1e6:>6.2f} MB/s")
+
+    start = time.perf_counter()
+    chunks = api.split_documents(documents)
+    elapsed = time.perf_counter() - start
+    print(f"split     {len(chunks)} 块  {elapsed * 1000:>9.1f} ms  {len(chunks) / elapsed:>9.0f} 块/s")
+
+    start = time.perf_counter()
+    result = api.rebuild_index_and_chain()
+    elapsed = time.perf_counter() - start
+    print(f"index     {elapsed:>7.2f} s  {len(chunks) / elapsed:>7.1f} 块/s  （{result}）")
+
+    api.vector_db = None
+    start = time.perf_counter()
+    api.vector_db = api.get_vector_db()
+    api.vector_db.similarity_search(chunks[0].page_content[:50], k=api.search_k)
+    print(f"open      重新打开并首次查询 {(time.perf_counter() - start) * 1000:.1f} ms")
+    api.create_rag_chain(api.vector_db)
+    return chunks
+
+
+def make_queries(chunks, count, seed=0):
+    """从随机文档块中截取片段作为查询（确定性）"""
+    rng = random.Random(seed)
+    queries = []
+    for chunk in rng.sample(chunks, min(count, len(chunks))):
+        text = chunk.page_content
+        start = rng.randrange(max(1, len(text) - 30))
+        queries.append(text[start:start + 30])
+    return queries
+
+
+def bench_retrieve(api, queries):
+    uncached, cached = [], []
+    for query in queries:
+        api.query_cache.clear()
+        start = time.perf_counter()
+        api.retrieve(query)
+        uncached.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        api.retrieve(query)
+        cached.append(time.perf_counter() - start)
+    print(f"retrieve  不命中缓存 {percentiles(uncached)}")
+    print(f"          命中缓存   {percentiles(cached)}")
+
+
+def bench_query(api, queries, server):
+    """process_query 的首个 token 延迟和总耗时；开销 = 实测 - 模拟服务的预填充/生成时间"""
+    ttfts, totals, overheads = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        first = None
+        for _ in api.process_query(query):
+            if first is None:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        stats = api.last_turn_stats
+        decode = server.answer_tokens / server.tokens_per_second if server.tokens_per_second else 0.0
+        prefill = stats["estimated_prompt_tokens"] / server.prefill_rate
+        ttfts.append(first)
+        totals.append(total)
+        overheads.append(max(0.0, total - prefill - decode))
+    print(f"query     首个 token {percentiles(ttfts)}")
+    print(f"          总耗时     {percentiles(totals)}")
+    print(f"          客户端开销 {percentiles(overheads)}（检索、打包、HTTP 和 LangChain 处理）")
+
+
+def bench_worker(api, prompts):
+    """StreamingWorker：从生成器产出部分回答到主线程槽函数收到的延迟"""
+    from PyQt6.QtCore import QCoreApplication
+    from threads.streaming_worker import StreamingWorker
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    delays = []
+    for prompt in prompts:
+        yielded = {}
+
+        def stream_fn(prompt, cancel_event):
+            for answer in api.stream_generate_response(prompt, cancel_event):
+                yielded[answer] = time.perf_counter()
+                yield answer
+
+        worker = StreamingWorker(stream_fn, prompt)
+        worker.partial_response.connect(lambda answer: delays.append(time.perf_counter() - yielded[answer]))
+        worker.finished.connect(app.quit)
+        worker.error.connect(app.quit)
+        worker.start()
+        app.exec()
+        worker.wait()
+    print(f"worker    {len(delays)} 个部分回答送达主线程 {percentiles(delays)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default="./documents", help="文档目录")
+    parser.add_argument("--backend", default=settings.VECTOR_STORE_BACKEND, choices=["numpy", "chroma"])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="模拟服务的生成速度")
+    parser.add_argument("--prefill-rate", type=float, default=5000.0, help="模拟服务的预填充速度（tokens/s）")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--embed-latency", type=float, default=0.002)
+    parser.add_argument("--stages", default="ingest,retrieve,query,worker", help="逗号分隔要运行的阶段")
+    args = parser.parse_args()
+    stages = set(args.stages.split(","))
+
+    work_dir = tempfile.mkdtemp(prefix="bench_rag_")
+    server = FakeOllama(tokens_per_second=args.tokens_per_second, prefill_rate=args.prefill_rate,
+                        answer_tokens=args.answer_tokens, embed_latency=args.embed_latency).start()
+    try:
+        # 索引和嵌入缓存写到临时目录，不影响应用的数据；所有请求发往模拟服务
+        settings.VECTOR_STORE_BACKEND = args.backend
+        settings.VECTOR_STORE_DIRECTORIES = {name: os.path.join(work_dir, name) for name in ("chroma", "numpy")}
+        settings.EMBEDDING_CACHE_PATH = os.path.join(work_dir, "embeddings.sqlite")
+        settings.OLLAMA_WARMUP = False
+        from core.langchain_ollama_client import LangchainOllamaAPI
+        from core.ollama_client import OllamaAPI
+        OllamaAPI.BASE_URL = server.url
+
+        api = LangchainOllamaAPI(model="gemma3n", auto_index=False)
+        api.documentes_dir = args.dir
+        print(f"模拟 Ollama {server.url}：生成 {args.tokens_per_second:g} tokens/s，"
+              f"预填充 {args.prefill_rate:g} tokens/s，每个回答 {args.answer_tokens} tokens\n")
+
+        chunks = bench_ingest(api, args.dir)
+        queries = make_queries(chunks, args.queries)
+        if "retrieve" in stages:
+            bench_retrieve(api, queries)
+        if "query" in stages:
+            bench_query(api, queries, server)
+        if "worker" in stages:
+            bench_worker(api, queries[:5])
+        print(f"\n模拟服务请求数: {server.stats['requests']}，嵌入文本 {server.stats['embedded_texts']} 条")
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""流式回答渲染基准：在模拟的 Ollama 服务（benchmarks.fake_ollama）上生成长回答，测量主线程刷新回答的耗时和界面卡顿
+
+回答经 ChatWindow 的正常路径（StreamingWorker → _update_partial_response → 完成后 Markdown 渲染）显示。
+主线程上一个每 PROBE_INTERVAL 触发一次的定时器记录实际间隔：超出间隔的部分就是界面无法响应（重绘、输入）的时间，
+其分位数和最大值即帧时间。没有显示器时使用 offscreen 平台。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_render --tokens 4000 --tokens-per-second 400
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.fake_ollama import FakeOllama
+from config import settings
+
+PROBE_INTERVAL = 0.005  # 秒
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return "无数据"
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return (f"p50 {statistics.median(values) * 1000:>7.2f} ms  p99 {p99 * 1000:>7.2f} ms  "
+            f"max {values[-1] * 1000:>7.2f} ms")
+
+
+def stream_answer(app, window, prompt):
+    """发送一条生成模式的消息并等待回答显示完成，返回 (总耗时, 主线程各次卡顿时长)"""
+    from PyQt6.QtCore import QEventLoop, Qt, QTimer
+
+    stalls = []
+    last_tick = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        stalls.append(max(0.0, now - last_tick[0] - PROBE_INTERVAL))
+        last_tick[0] = now
+
+    loop = QEventLoop()
+    probe = QTimer()
+    probe.setTimerType(Qt.TimerType.PreciseTimer)
+    probe.timeout.connect(tick)
+    done = QTimer()
+    done.timeout.connect(lambda: window.worker is None and loop.quit())
+
+    window.input_box.setPlainText(prompt)
+    start = time.perf_counter()
+    window._send_generate_message()
+    probe.start(round(PROBE_INTERVAL * 1000))
+    done.start(20)
+    loop.exec()
+    elapsed = time.perf_counter() - start
+    probe.stop()
+    done.stop()
+    return elapsed, stalls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=4000, help="每个回答的 token 数")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="模拟服务的生成速度")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    server = FakeOllama(tokens_per_second=args.tokens_per_second, answer_tokens=args.tokens).start()
+    try:
+        settings.OLLAMA_WARMUP = False
+        from PyQt6.QtWidgets import QApplication
+        from core.metrics import get_metrics
+        from core.ollama_client import OllamaAPI
+        OllamaAPI.BASE_URL = server.url
+
+        app = QApplication.instance() or QApplication(sys.argv)
+        from ui.main_window import ChatWindow
+        window = ChatWindow(async_ui=False)
+        window._services_started = True  # 不加载模型列表、不建索引，只测渲染
+        window.show()
+        print(f"模拟 Ollama {server.url}：每个回答 {args.tokens} tokens，{args.tokens_per_second:g} tokens/s\n")
+
+        for i in range(args.repeat):
+            window.output_area.clear()
+            before = get_metrics().snapshot().get("render", {"count": 0, "sum": 0.0})
+            elapsed, stalls = stream_answer(app, window, f"第 {i} 个问题")
+            after = get_metrics().snapshot()["render"]
+            renders, render_time = after["count"] - before["count"], after["sum"] - before["sum"]
+            print(f"回答 {i + 1}  总耗时 {elapsed:>6.2f} s  刷新 {renders:>5} 次，共 {render_time * 1000:>8.1f} ms "
+                  f"（主线程占比 {render_time / elapsed:>5.1%}）")
+            print(f"         界面卡顿 {percentiles(stalls)}")
+        window.close()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""启动时间基准：各依赖模块的导入耗时，以及快速启动开/关时窗口首次绘制的时间
+
+每项测量都在新的子进程中进行（模块缓存不会互相影响）。首次绘制时间从启动子进程算起，
+包括解释器启动、导入、创建 ChatWindow 和第一次 Paint 事件；没有显示器时使用 offscreen 平台。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_startup --repeat 3
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+# 应用启动路径上涉及的模块，按依赖从底层到上层排列
+MODULES = [
+    "PyQt6.QtWidgets",
+    "numpy",
+    "markdown",
+    "pyttsx3",
+    "vosk",
+    "pyaudio",
+    "ollama",
+    "langsmith",
+    "langchain_core.retrievers",
+    "langchain.chains.combine_documents",
+    "langchain_community.document_loaders",
+    "langchain_ollama",
+    "chromadb",
+    "langchain_chroma",
+    "core.langchain_ollama_client",
+    "ui.main_window",
+]
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)")
+
+
+def import_cost(module):
+    """在新进程中导入模块，返回累计导入耗时（秒），未安装时返回错误信息"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None, proc.stderr.strip().splitlines()[-1]
+    for line in reversed(proc.stderr.splitlines()):
+        m = _IMPORTTIME_RE.match(line)
+        if m and m.group(2) == module:
+            return int(m.group(1)) / 1e6, None
+    return None, "未找到导入记录"
+
+
+def child_first_paint():
+    """子进程：创建窗口并在第一次 Paint 事件时输出各阶段的时间戳"""
+    marks = {"start": float(os.environ["BENCH_START_TIME"])}
+    from PyQt6.QtCore import QEvent, QObject
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+    with open('resources/styles/main.qss', 'r') as f:
+        app.setStyleSheet(f.read())
+    marks["qt_ready"] = time.time()
+    from ui.main_window import ChatWindow
+    marks["imported"] = time.time()
+    window = ChatWindow()
+    marks["constructed"] = time.time()
+
+    class PaintFilter(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint and "first_paint" not in marks:
+                marks["first_paint"] = time.time()
+                print(json.dumps(marks), flush=True)
+                # 后台索引线程可能仍在运行，直接退出，不等待清理
+                os._exit(0)
+            return False
+
+    paint_filter = PaintFilter()
+    window.installEventFilter(paint_filter)
+    window.show()
+    app.exec()
+
+
+def first_paint(fast_start):
+    env = dict(os.environ, LOCAL_LLM_FAST_START="1" if fast_start else "0",
+               BENCH_START_TIME=repr(time.time()))
+    if sys.platform.startswith("linux") and not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+                          capture_output=True, text=True, env=env, timeout=300)
+    for line in proc.stdout.splitlines():
+        if line.startswith("{"):
+            marks = json.loads(line)
+            return {name: marks[name] - marks["start"] for name in marks if name != "start"}, None
+    return None, (proc.stderr.strip().splitlines() or ["子进程没有输出"])[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="首次绘制测量次数（取中位数）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child_first_paint()
+        return
+
+    print("模块导入耗时（新进程，含依赖）:")
+    for module in MODULES:
+        cost, error = import_cost(module)
+        if error:
+            print(f"  {module:<40} 失败: {error}")
+        else:
+            print(f"  {module:<40} {cost * 1000:>8.1f} ms")
+
+    print("\n首次绘制时间（从启动子进程算起，中位数）:")
+    for fast_start in (True, False):
+        runs, error = [], None
+        for _ in range(args.repeat):
+            timings, error = first_paint(fast_start)
+            if timings is None:
+                break
+            runs.append(timings)
+        label = "快速启动" if fast_start else "启动时全部初始化"
+        if not runs:
+            print(f"  {label:<16} 失败: {error}")
+            continue
+        stages = "  ".join(f"{name} {statistics.median(run[name] for run in runs) * 1000:>7.0f} ms"
+                           for name in ("qt_ready", "imported", "constructed", "first_paint"))
+        print(f"  {label:<16} {stages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""向量库基准：比较 NumpyVectorStore（含 int8/binary 量化）与 Chroma 的写入/加载时间、查询延迟和召回率
+
+使用随机生成的聚簇向量（不需要 Ollama），召回率以暴力精确检索的 top-k 为基准。
+加载时间为重新打开持久化目录并完成第一次查询的时间（对应应用启动后的首次检索）。
+量化后端另外报告查询扫描阶段每个向量读取的字节数（相对 float32 的内存节省）。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_vector_store --n 20000 --dim 768 --queries 200 --k 10
+    python -m benchmarks.bench_vector_store --backends numpy,numpy-int8,numpy-binary --rerank-factor 16
+"""
+import argparse
+import gc
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from core.vector_store import NumpyVectorStore
+
+
+class MatrixEmbeddings(Embeddings):
+    """把 "doc-<i>" / "q-<i>" 映射到预先生成的向量，避免基准受嵌入模型影响"""
+
+    def __init__(self, docs, queries):
+        self.docs = docs
+        self.queries = queries
+
+    def _lookup(self, text):
+        kind, i = text.split("-")
+        return (self.docs if kind == "doc" else self.queries)[int(i)].tolist()
+
+    def embed_documents(self, texts):
+        return [self._lookup(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._lookup(text)
+
+
+def make_vectors(n, n_queries, dim, seed=0):
+    """在若干簇中心附近生成归一化的文档向量和查询向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(n // 200, 1), dim)).astype(np.float32)
+
+    def sample(count):
+        vectors = centers[rng.integers(len(centers), size=count)]
+        vectors = vectors + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return sample(n), sample(n_queries)
+
+
+def open_store(backend, directory, embeddings, rerank_factor):
+    if backend.startswith("numpy"):
+        quantization = backend.partition("-")[2] or None
+        return NumpyVectorStore(directory, embeddings, quantization=quantization, rerank_factor=rerank_factor)
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=directory, embedding_function=embeddings)
+
+
+def recall(results, truth):
+    return float(np.mean([len(set(got) & set(want)) / len(want) for got, want in zip(results, truth)]))
+
+
+def bench(backend, docs, queries, truth, k, batch_size, rerank_factor):
+    embeddings = MatrixEmbeddings(docs, queries)
+    directory = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+    try:
+        store = open_store(backend, directory, embeddings, rerank_factor)
+        start = time.perf_counter()
+        for i in range(0, len(docs), batch_size):
+            ids = [f"doc-{j}" for j in range(i, min(i + batch_size, len(docs)))]
+            store.add_texts(ids, [{"row": j} for j in range(i, i + len(ids))], ids=ids)
+        build = time.perf_counter() - start
+        del store
+        gc.collect()
+
+        # 重新打开并完成首次查询
+        start = time.perf_counter()
+        store = open_store(backend, directory, embeddings, rerank_factor)
+        store.similarity_search_by_vector(queries[0].tolist(), k=k)
+        load = time.perf_counter() - start
+
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            found = store.similarity_search_by_vector(query.tolist(), k=k)
+            latencies.append(time.perf_counter() - start)
+            results.append([int(doc.id.split("-")[1]) for doc in found])
+        latencies = np.array(latencies) * 1000
+        print(f"{backend:<8} 写入 {build:>7.2f} s  加载+首次查询 {load * 1000:>8.1f} ms  "
+              f"p50 {np.percentile(latencies, 50):>6.2f} ms  p95 {np.percentile(latencies, 95):>6.2f} ms  "
+              f"recall@{k} {recall(results, truth):.4f}")
+
+        if isinstance(store, NumpyVectorStore):
+            full_bytes, code_bytes = store.memory_usage()
+            if code_bytes:
+                print(f"{'':<8} 扫描 {code_bytes} 字节/向量（float32 为 {full_bytes}，节省 "
+                      f"{1 - code_bytes / full_bytes:.1%}），重排候选 {k * store.rerank_factor} 个")
+            start = time.perf_counter()
+            store.search_by_vectors(queries, k=k)
+            elapsed = time.perf_counter() - start
+            print(f"{'':<8} 批量查询 {len(queries)} 条: {elapsed * 1000:.1f} ms "
+                  f"（{elapsed / len(queries) * 1000:.3f} ms/条，仅返回 ID）")
+        del store
+        gc.collect()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000, help="文档向量数")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度（nomic-embed-text 为 768）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1000, help="每次 add_texts 写入的向量数")
+    parser.add_argument("--backends", default="numpy,numpy-int8,numpy-binary,chroma",
+                        help="逗号分隔：numpy、numpy-int8、numpy-binary、chroma")
+    parser.add_argument("--rerank-factor", type=int, default=None,
+                        help="量化后端重排的候选数为 k 的倍数（默认按量化方式：int8 为 4，binary 为 32）")
+    args = parser.parse_args()
+
+    docs, queries = make_vectors(args.n, args.queries, args.dim)
+    scores = queries @ docs.T
+    truth = np.argsort(-scores, axis=1)[:, :args.k].tolist()
+    print(f"{args.n} 个 {args.dim} 维向量，{args.queries} 条查询，k={args.k}\n")
+    for backend in args.backends.split(","):
+        bench(backend.strip(), docs, queries, truth, args.k, args.batch_size, args.rerank_factor)
+
+
+if __name__ == "__main__":
+    main()
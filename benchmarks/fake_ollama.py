@@ -0,0 +1,294 @@
+"""模拟 Ollama 的本地 HTTP 服务：确定性的嵌入和回答，可配置的加载/预填充/生成速度
+
+不需要 GPU 和模型即可复现地运行基准（以及在没有 Ollama 的机器上调试界面）。实现的接口：
+  POST /api/generate, /api/chat     流式（NDJSON）和非流式，done 块带 prompt_eval_count/eval_count 等统计；
+                                    不在 models 中的模型返回 404
+  POST /api/embed, /api/embeddings  字符 n-gram 哈希嵌入（相同文本得到相同向量，字面相近的文本向量相近）
+  GET  /api/tags, /api/ps, /api/version；POST /api/show
+
+时间模型：每个模型第一次请求时等待 load_latency（冷加载）；预填充按 prefill_rate tokens/s，
+生成按 tokens_per_second 逐个 token 输出；嵌入每个请求 embed_latency 秒加上按 embed_rate tokens/s 计算的时间。
+parallel 限制同时处理的生成请求数（对应 OLLAMA_NUM_PARALLEL），0 表示不限制。
+
+用法：
+    python -m benchmarks.fake_ollama --port 11434 --tokens-per-second 30
+或在代码中（在导入 config.settings 之前设置 OLLAMA_HOST）：
+    with FakeOllama(tokens_per_second=200) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+"""
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.utils import estimate_tokens
+
+# 生成回答时循环使用的 token
+ANSWER_TOKENS = ["根据", "文档", "的", "内容", "，", "合同", "在", "依法", "成立", "时", "生效", "。",
+                 "当事人", "应当", "按照", "约定", "全面", "履行", "自己", "的", "义务", "。"]
+
+
+def fake_embedding(text, dim=768):
+    """字符一元和二元组哈希到 dim 维并归一化：确定、无需模型，字面相近的文本余弦相似度高"""
+    vector = [0.0] * dim
+    features = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+    for feature in features:
+        if feature.isspace():
+            continue
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOllama:
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_second=50.0, prefill_rate=2000.0,
+                 load_latency=0.0, embed_latency=0.002, embed_rate=50000.0, answer_tokens=64,
+                 dim=768, parallel=0, models=("gemma3n", "nomic-embed-text")):
+        self.tokens_per_second = tokens_per_second
+        self.prefill_rate = prefill_rate
+        self.load_latency = load_latency
+        self.embed_latency = embed_latency
+        self.embed_rate = embed_rate
+        self.answer_tokens = answer_tokens
+        self.dim = dim
+        self.models = list(models)
+        self._loaded = set()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(parallel) if parallel else None
+        # 请求计数：各接口的请求数、客户端中途断开的流
+        self.stats = {"requests": {}, "disconnects": 0, "embedded_texts": 0}
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, path):
+        with self._lock:
+            self.stats["requests"][path] = self.stats["requests"].get(path, 0) + 1
+
+    def load(self, model):
+        """第一次使用模型时模拟冷加载，返回加载耗时（秒）"""
+        with self._lock:
+            if model in self._loaded:
+                return 0.0
+            self._loaded.add(model)
+        time.sleep(self.load_latency)
+        return self.load_latency
+
+    def answer(self, prompt, num_predict=None):
+        """按提示的哈希选择起点，循环输出 ANSWER_TOKENS（相同提示得到相同回答）"""
+        count = num_predict if num_predict and num_predict > 0 else self.answer_tokens
+        offset = int(hashlib.md5(prompt.encode("utf-8")).hexdigest(), 16) % len(ANSWER_TOKENS)
+        return [ANSWER_TOKENS[(offset + i) % len(ANSWER_TOKENS)] for i in range(count)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # 响应头和响应体分开写入，否则会被 Nagle + 延迟 ACK 拖慢约 40 ms
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def do_GET(self):
+        self.fake.count(self.path)
+        if self.path == "/api/tags":
+            self._send_json({"models": [self._model_entry(name) for name in self.fake.models]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [self._model_entry(name) for name in sorted(self.fake._loaded)]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def do_POST(self):
+        self.fake.count(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path in ("/api/generate", "/api/chat"):
+            self._generate(body, chat=self.path == "/api/chat")
+        elif self.path in ("/api/embed", "/api/embeddings"):
+            self._embed(body, legacy=self.path == "/api/embeddings")
+        elif self.path == "/api/show":
+            self._send_json({"modelfile": "", "parameters": "", "template": "{{ .Prompt }}",
+                             "details": self._model_entry(body.get("model", ""))["details"],
+                             "model_info": {"general.architecture": "fake", "fake.context_length": 32768,
+                                            "fake.embedding_length": self.fake.dim},
+                             "capabilities": ["completion", "embedding"]})
+        else:
+            self._send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def _model_entry(self, name):
+        return {"name": name, "model": name, "modified_at": "2024-01-01T00:00:00Z", "size": 0,
+                "digest": hashlib.sha256(name.encode()).hexdigest(),
+                "details": {"format": "gguf", "family": "fake", "parameter_size": "0B",
+                            "quantization_level": "none"}}
+
+    def _generate(self, body, chat):
+        fake = self.fake
+        model = body.get("model", "")
+        if chat:
+            prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+        else:
+            prompt = (body.get("system") or "") + body.get("prompt", "")
+        stream = body.get("stream", True)
+        start = time.perf_counter()
+        if model.removesuffix(":latest") not in [name.removesuffix(":latest") for name in fake.models]:
+            self._send_json({"error": f"model '{model}' not found"}, status=404)  # 与 Ollama 相同
+            return
+
+        if fake._slots is not None:
+            fake._slots.acquire()
+        try:
+            load_duration = fake.load(model)
+            if not prompt:
+                # 空提示只加载模型（客户端的预加载请求）
+                self._send_json(dict(self._chunk(model, chat, ""), done=True, done_reason="load",
+                                     load_duration=int(load_duration * 1e9),
+                                     total_duration=int((time.perf_counter() - start) * 1e9)))
+                return
+            prompt_tokens = estimate_tokens(prompt)
+            prefill = prompt_tokens / fake.prefill_rate
+            time.sleep(prefill)
+            tokens = fake.answer(prompt, (body.get("options") or {}).get("num_predict"))
+            decode_start = time.perf_counter()
+            delay = 1.0 / fake.tokens_per_second if fake.tokens_per_second else 0.0
+
+            def final():
+                return dict(self._chunk(model, chat, ""), done=True, done_reason="stop",
+                            total_duration=int((time.perf_counter() - start) * 1e9),
+                            load_duration=int(load_duration * 1e9),
+                            prompt_eval_count=prompt_tokens, prompt_eval_duration=int(prefill * 1e9),
+                            eval_count=len(tokens),
+                            eval_duration=int((time.perf_counter() - decode_start) * 1e9))
+
+            if not stream:
+                time.sleep(delay * len(tokens))
+                result = final()
+                text = "".join(tokens)
+                if chat:
+                    result["message"]["content"] = text
+                else:
+                    result["response"] = text
+                self._send_json(result)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, token in enumerate(tokens):
+                    # 按目标速度输出：按累计时间补足延迟，避免 sleep 的误差累积
+                    wait = decode_start + (i + 1) * delay - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                    self._write_chunk(self._chunk(model, chat, token))
+                self._write_chunk(final())
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                with fake._lock:
+                    fake.stats["disconnects"] += 1
+                self.close_connection = True
+        finally:
+            if fake._slots is not None:
+                fake._slots.release()
+
+    def _embed(self, body, legacy):
+        fake = self.fake
+        model = body.get("model", "")
+        texts = body.get("prompt", "") if legacy else body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        start = time.perf_counter()
+        load_duration = fake.load(model)
+        tokens = sum(estimate_tokens(text) for text in texts)
+        time.sleep(fake.embed_latency + tokens / fake.embed_rate)
+        embeddings = [fake_embedding(text, fake.dim) for text in texts]
+        with fake._lock:
+            fake.stats["embedded_texts"] += len(texts)
+        if legacy:
+            self._send_json({"embedding": embeddings[0] if embeddings else []})
+            return
+        self._send_json({"model": model, "embeddings": embeddings,
+                         "total_duration": int((time.perf_counter() - start) * 1e9),
+                         "load_duration": int(load_duration * 1e9), "prompt_eval_count": tokens})
+
+    @staticmethod
+    def _chunk(model, chat, text):
+        chunk = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": False}
+        if chat:
+            chunk["message"] = {"role": "assistant", "content": text}
+        else:
+            chunk["response"] = text
+        return chunk
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="生成速度（0 表示不延迟）")
+    parser.add_argument("--prefill-rate", type=float, default=2000.0, help="预填充速度（tokens/s）")
+    parser.add_argument("--load-latency", type=float, default=0.0, help="每个模型第一次请求的加载时间（秒）")
+    parser.add_argument("--embed-latency", type=float, default=0.002, help="每个嵌入请求的固定延迟（秒）")
+    parser.add_argument("--embed-rate", type=float, default=50000.0, help="嵌入速度（tokens/s）")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="每个回答的 token 数")
+    parser.add_argument("--dim", type=int, default=768, help="嵌入维度")
+    parser.add_argument("--parallel", type=int, default=0, help="同时处理的生成请求数（0 表示不限制）")
+    args = parser.parse_args()
+
+    server = FakeOllama(args.host, args.port, args.tokens_per_second, args.prefill_rate, args.load_latency,
+                        args.embed_latency, args.embed_rate, args.answer_tokens, args.dim, args.parallel)
+    print(f"模拟 Ollama 服务: {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
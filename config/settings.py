@@ -0,0 +1,126 @@
+import os
+
+# ===== 启动 =====
+# 快速启动：窗口先显示，模型列表、索引和目录监视在首次绘制后启动，
+# 语音合成等重量级依赖在第一次使用时才导入（LOCAL_LLM_FAST_START=0 恢复启动时全部初始化）
+FAST_START = os.environ.get("LOCAL_LLM_FAST_START", "1") != "0"
+# 安装了 qasync 时在 Qt 事件循环上运行 asyncio，各模式的请求以协程交错执行，不再每条消息一个线程
+# （LOCAL_LLM_ASYNC_UI=0 或未安装 qasync 时使用线程）
+ASYNC_UI = os.environ.get("LOCAL_LLM_ASYNC_UI", "1") != "0"
+# 流式回答每秒最多刷新几次：两次刷新之间到达的 token 合并，只把新增的文本追加到回答末尾
+UI_RENDER_FPS = 30
+
+# ===== 日志与指标 =====
+# 日志级别：DEBUG 时输出检索到的文档块、各阶段耗时等调试信息
+LOG_LEVEL = os.environ.get("LOCAL_LLM_LOG_LEVEL", "INFO")
+# 每个阶段保留最近多少次耗时用于计算分位数
+METRICS_WINDOW = 500
+# 设置后定期把各阶段耗时写入该文件：.prom 为 Prometheus 文本格式，其他扩展名为 JSON
+METRICS_FILE = os.environ.get("LOCAL_LLM_METRICS_FILE")
+METRICS_EXPORT_INTERVAL = 15
+
+# ===== Ollama 服务 =====
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+# 请求结束后模型在内存/显存中保留的秒数（Ollama keep_alive，-1 表示一直保留）
+# 使用整数：langchain_ollama 的 OllamaEmbeddings 只接受秒数
+OLLAMA_KEEP_ALIVE = 30 * 60
+# 启动和切换模型时在后台预加载模型（以及 RAG 用的嵌入模型）
+OLLAMA_WARMUP = True
+# 每个 host 共享的 HTTP 连接池大小
+OLLAMA_MAX_CONNECTIONS = 8
+
+# ===== 请求调度 =====
+# 同时发往 Ollama 的生成/嵌入请求数上限（建议与 Ollama 的 OLLAMA_NUM_PARALLEL 一致），
+# 超出的请求排队，用户的问题和查询嵌入优先于后台索引和对话摘要
+SCHEDULER_LLM_CONCURRENCY = 2
+SCHEDULER_EMBEDDING_CONCURRENCY = 2
+# 等待时间统计（平均、p95）使用最近多少次请求
+SCHEDULER_STATS_WINDOW = 200
+
+# ===== 模型 =====
+# 模型上下文长度（token），生成/对话/RAG 请求都使用此值，历史和检索上下文的预算由此推算
+NUM_CTX = 4096
+
+# ===== 对话记忆 =====
+# 为回答预留的 token 数：生成/对话模式的历史（摘要 + 最近轮次）不超过 NUM_CTX - 预留
+MEMORY_ANSWER_RESERVE = 768
+# 移出窗口的轮次在后台合并为摘要，摘要的最大字数
+MEMORY_SUMMARY_CHARS = 300
+
+# ===== 文档加载 =====
+# 并行解析文档的进程数（1 表示在当前进程中顺序解析）
+LOAD_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+# 等待单个文件解析结果的最长秒数，超时的文件会被跳过
+LOAD_TIMEOUT = 300
+# 解析进程池在多次索引之间复用，空闲超过这么多秒后关闭（None 表示一直保留）
+LOAD_POOL_IDLE_TIMEOUT = 600
+
+# ===== 嵌入 =====
+EMBEDDING_MODEL = "nomic-embed-text"
+# 持久化嵌入缓存（SQLite），与向量库分开存放，删除向量库后重建无需重新嵌入
+EMBEDDING_CACHE_PATH = "./embedding_cache/embeddings.sqlite"
+# 缓存条目上限（768 维约 3KB/条），超过后淘汰最久未使用的条目
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+
+# ===== 索引流水线 =====
+# 每批嵌入并写入向量库的块数，每批写入后提交一次索引清单
+INGEST_BATCH_SIZE = 64
+# 加载/分割阶段之间有界队列的长度（以文件为单位）
+INGEST_QUEUE_SIZE = 4
+
+# ===== 文档目录监视 =====
+# 是否监视文档目录并在变更后自动增量索引（安装 watchdog 时使用系统通知，否则轮询）
+WATCH_DOCUMENTS = True
+# 最后一次变更后等待多少秒再触发索引，用于合并批量写入
+WATCH_QUIET_PERIOD = 2.0
+# 轮询模式下两次扫描的间隔（秒）
+WATCH_POLL_INTERVAL = 5.0
+
+# ===== 向量库 =====
+# 向量库后端："chroma"（HNSW 近似检索）或 "numpy"（内存映射矩阵 + 精确检索，
+# 几万个块以内启动和查询都更快）。两种后端各自使用独立的持久化目录和索引清单
+VECTOR_STORE_BACKEND = "chroma"
+VECTOR_STORE_DIRECTORIES = {"chroma": "./chroma_db", "numpy": "./numpy_db"}
+# numpy 后端的向量量化：None（只用 float32）、"int8"（编码为原来的 1/4）或 "binary"（1/32），
+# 量化时先扫描紧凑编码取 search_k * VECTOR_RERANK_FACTOR 个候选，再用完整向量重排
+VECTOR_QUANTIZATION = None
+# None 表示按量化方式取默认值（int8 为 4，binary 为 32）
+VECTOR_RERANK_FACTOR = None
+
+# ===== 检索 =====
+# 启用 BM25 词项检索并与向量检索结果做倒数排名融合（RRF）
+HYBRID_SEARCH = True
+# RRF 融合常数，越大排名靠后的结果权重衰减越慢
+RRF_K = 60
+# 只由法条编号构成的查询（如"第1077条"）只走 BM25，不调用嵌入模型
+LEXICAL_FAST_PATH = True
+# 检索结果 LRU 缓存的条目数（0 表示禁用）
+QUERY_CACHE_SIZE = 128
+# 设置环境变量 LOCAL_LLM_DEBUG_RETRIEVAL=1 时打印每次检索到的文档
+RETRIEVAL_DEBUG = os.environ.get("LOCAL_LLM_DEBUG_RETRIEVAL") == "1"
+
+# ===== 上下文打包 =====
+# 合并重叠块、按 MMR 去冗余，并按 token 预算裁剪送入提示词的检索结果
+CONTEXT_PACKING = True
+# 为回答预留的 token 数：上下文预算 = NUM_CTX - 预留 - 问题和提示模板
+CONTEXT_ANSWER_RESERVE = 768
+# MMR 中相关性的权重（1 表示只按检索排名，越小越偏向多样性）
+CONTEXT_MMR_LAMBDA = 0.7
+
+# ===== HTTP 服务（server.py）=====
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+# 设置后客户端需要发送 Authorization: Bearer <密钥>
+SERVER_API_KEY = os.environ.get("LOCAL_LLM_API_KEY")
+# 服务端保存的会话数上限（超出时淘汰最久未使用的）和会话空闲过期时间（秒）
+SERVER_MAX_SESSIONS = 256
+SERVER_SESSION_TTL = 3600
+
+# ===== 性能分析 =====
+# 对哪些运行做 cProfile + tracemalloc 分析：query（检索问答）、index（重建索引），逗号分隔；
+# 1/all 表示全部。界面上的“性能分析”按钮也可以随时开关
+PROFILE = os.environ.get("LOCAL_LLM_PROFILE", "")
+# 报告目录：每次运行写入 <时间>-<对象>.txt（热点函数和内存峰值）和同名 .prof（pstats 格式）
+PROFILE_DIR = "./profiles"
+# 报告中列出的函数和分配位置数
+PROFILE_TOP_N = 30
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+import weakref
+from contextlib import aclosing
+
+from config import settings
+from core.langchain_ollama_client import LangchainOllamaAPI, format_docs, generation_info_handler
+from core.metrics import get_metrics
+from core.ollama_client import client_options
+from core.profiler import profile
+from core.scheduler import get_scheduler
+from core.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 事件循环 → {host: AsyncClient}；httpx 的异步连接池只能在创建它的事件循环中使用
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(host):
+    """返回当前事件循环中该 host 共享的 ollama AsyncClient"""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(host)
+    if client is None:
+        from ollama import AsyncClient
+        client = clients[host] = AsyncClient(host=host, **client_options())
+    return client
+
+
+async def _aconsume_stream(chunks, text_of, result):
+    """OllamaAPI._consume_stream 的异步版本：逐块产出累积的回答文本
+
+    异步生成器不能返回值，最后一块、首个 token 的时间和完整回答写入 result。
+    任务被取消或生成器被关闭时关闭 HTTP 流，Ollama 随即停止生成。
+    """
+    result.update(last=None, first_token_at=None, answer="")
+    try:
+        async for chunk in chunks:
+            result["last"] = chunk
+            text = text_of(chunk)
+            if text:
+                if result["first_token_at"] is None:
+                    result["first_token_at"] = time.perf_counter()
+                result["answer"] += text
+                yield result["answer"]
+    finally:
+        await chunks.aclose()
+
+
+class AsyncLangchainOllamaAPI(LangchainOllamaAPI):
+    """LangchainOllamaAPI 的 asyncio 接口：astream_* 为异步生成器，产出逐步累积的回答
+
+    查询嵌入、检索和生成的网络 I/O 都在事件循环中异步等待，多个请求可以在同一个线程中交错进行；
+    BM25、向量扫描和上下文打包是短小的本地计算，直接执行。取消任务即停止请求（关闭 HTTP 流）。
+    索引、对话记忆和后台摘要与同步版本共用（索引仍由后台线程构建）。
+    """
+
+    def _async_client(self):
+        return get_async_client(self.BASE_URL)
+
+    async def astream_generate_response(self, prompt):
+        system, full_prompt = self.generate_memory.prompt(prompt)
+        estimated_tokens = self.generate_memory.token_count() + estimate_tokens(prompt)
+        start = time.perf_counter()
+        result = {}
+        try:
+            async with get_scheduler().aslot("llm") as ticket:
+                chunks = await self._async_client().generate(model=self.model,
+                                                             prompt=full_prompt,
+                                                             system=system,
+                                                             stream=True,
+                                                             options=self._options(),
+                                                             keep_alive=settings.OLLAMA_KEEP_ALIVE)
+                async with aclosing(_aconsume_stream(chunks, lambda chunk: chunk.response, result)) as answers:
+                    async for answer in answers:
+                        yield answer
+        except Exception as e:
+            yield f"错误: {str(e)}"
+            return
+        if result["last"] is None or not result["last"].done:
+            logger.info("[generate] 流在完成前结束，这一轮不计入对话记忆")
+            return
+
+        self.generate_memory.add("user", prompt)
+        self.generate_memory.add("assistant", result["answer"])
+        self._record_turn("generate", self.generate_memory, result["last"], estimated_tokens, start,
+                          result["first_token_at"], ticket.wait)
+
+    async def astream_chat_response(self, prompt):
+        self.chat_memory.add("user", prompt)
+        messages = self.chat_memory.messages()
+        estimated_tokens = self.chat_memory.token_count()
+        start = time.perf_counter()
+        result = {}
+        try:
+            async with get_scheduler().aslot("llm") as ticket:
+                chunks = await self._async_client().chat(model=self.model,
+                                                         messages=messages,
+                                                         stream=True,
+                                                         options=self._options(),
+                                                         keep_alive=settings.OLLAMA_KEEP_ALIVE)
+                async with aclosing(_aconsume_stream(chunks, lambda chunk: chunk.message.content,
+                                                     result)) as answers:
+                    async for answer in answers:
+                        yield answer
+        except Exception as e:
+            self.chat_memory.discard_last()
+            yield f"错误: {str(e)}"
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            self.chat_memory.discard_last()  # 中途停止：不完整的一轮不留在历史中
+            raise
+        if result["last"] is None or not result["last"].done:
+            self.chat_memory.discard_last()
+            logger.info("[chat] 流在完成前结束，这一轮不计入对话记忆")
+            return
+
+        self.chat_memory.add("assistant", result["answer"])
+        self._record_turn("chat", self.chat_memory, result["last"], estimated_tokens, start,
+                          result["first_token_at"], ticket.wait)
+
+    async def aretrieve(self, query):
+        """retrieve 的异步版本（共用查询缓存）"""
+        rag_chain = self.rag_chain
+        start = time.perf_counter()
+        key = self._query_cache_key(query)
+        docs = self.query_cache.get(key)
+        cached = docs is not None
+        if not cached:
+            docs = await rag_chain.retriever.ainvoke(query)
+            self.query_cache.put(key, docs)
+        get_metrics().observe("retrieve", time.perf_counter() - start)
+        if self.retrieval_trace_sink is not None:
+            self.retrieval_trace_sink(query, docs, time.perf_counter() - start, cached)
+        return docs
+
+    async def astream_rag_response(self, query):
+        # 分析期间事件循环上的其他任务也会计入报告
+        with profile("query", query):
+            async with aclosing(self._astream_rag_response(query)) as answers:
+                async for answer in answers:
+                    yield answer
+
+    async def _astream_rag_response(self, query):
+        rag_chain = self.rag_chain
+        if rag_chain is None:
+            yield "错误：RAG 链未初始化。"
+            return
+
+        try:
+            start = time.perf_counter()
+            docs = self.pack_context(query, await self.aretrieve(query))
+            with get_metrics().span("prompt"):
+                prompt_value = await rag_chain.prompt.ainvoke({"input": query, "context": format_docs(docs)})
+            full_answer, first_token_at = "", None
+            stats_handler = generation_info_handler()
+            async with get_scheduler().aslot("llm") as ticket:
+                response_stream = self.llm.astream(prompt_value, config={"callbacks": [stats_handler]})
+                try:
+                    async for answer_part in response_stream:
+                        if answer_part:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            full_answer += answer_part
+                            yield full_answer
+                finally:
+                    await response_stream.aclose()
+
+            if not full_answer:
+                yield "抱歉，未能生成回答。"
+            else:
+                self._record_rag_turn(query, docs, full_answer, start, first_token_at, ticket.wait,
+                                      stats_handler.info)
+        except Exception as e:
+            logger.exception("处理查询时发生错误: %s", e)
+            yield f"处理查询时发生错误: {e}"
@@ -0,0 +1,185 @@
+import json
+import logging
+import math
+import os
+import threading
+from array import array
+
+import numpy as np
+
+from core.utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class BM25Index:
+    """进程内 BM25 倒排索引
+
+    每个词项的倒排表是两个 array('I')（文档序号、词频），新文档追加在末尾；
+    删除的文档只做标记，标记过多时压缩重建。持久化为 meta.json + postings.npz（CSR 格式）。
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+        if path and os.path.exists(os.path.join(path, "meta.json")):
+            self.load()
+
+    def _reset(self):
+        self._doc_ids = []           # 文档序号 -> 块 ID
+        self._doc_index = {}         # 块 ID -> 文档序号
+        self._doc_lens = array('I')
+        self._deleted = bytearray()
+        self._n_deleted = 0
+        self._total_len = 0
+        self._postings = {}          # 词项 -> (array('I') 文档序号, array('I') 词频)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._doc_ids) - self._n_deleted
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._doc_index
+
+    def ids(self):
+        with self._lock:
+            return list(self._doc_index)
+
+    def add(self, chunk_ids, texts):
+        """添加（或替换同 ID 的）文档"""
+        with self._lock:
+            self.delete([cid for cid in chunk_ids if cid in self._doc_index])
+            for chunk_id, text in zip(chunk_ids, texts):
+                doc = len(self._doc_ids)
+                self._doc_ids.append(chunk_id)
+                self._doc_index[chunk_id] = doc
+                self._deleted.append(0)
+                counts = {}
+                for token in tokenize(text):
+                    counts[token] = counts.get(token, 0) + 1
+                length = sum(counts.values())
+                self._doc_lens.append(length)
+                self._total_len += length
+                for token, tf in counts.items():
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        postings = self._postings[token] = (array('I'), array('I'))
+                    postings[0].append(doc)
+                    postings[1].append(tf)
+            self.dirty = True
+
+    def delete(self, chunk_ids):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                doc = self._doc_index.pop(chunk_id, None)
+                if doc is None:
+                    continue
+                self._deleted[doc] = 1
+                self._n_deleted += 1
+                self._total_len -= self._doc_lens[doc]
+                self.dirty = True
+            if self._n_deleted > 1000 and self._n_deleted > len(self._doc_ids) // 4:
+                self._compact()
+
+    def _compact(self):
+        """去掉已删除文档，重新编号"""
+        remap = array('I', [0]) * len(self._doc_ids)
+        doc_ids, doc_lens = [], array('I')
+        for doc, chunk_id in enumerate(self._doc_ids):
+            if not self._deleted[doc]:
+                remap[doc] = len(doc_ids)
+                doc_ids.append(chunk_id)
+                doc_lens.append(self._doc_lens[doc])
+        postings = {}
+        for token, (docs, tfs) in self._postings.items():
+            new_docs, new_tfs = array('I'), array('I')
+            for doc, tf in zip(docs, tfs):
+                if not self._deleted[doc]:
+                    new_docs.append(remap[doc])
+                    new_tfs.append(tf)
+            if new_docs:
+                postings[token] = (new_docs, new_tfs)
+        self._doc_ids = doc_ids
+        self._doc_index = {chunk_id: doc for doc, chunk_id in enumerate(doc_ids)}
+        self._doc_lens = doc_lens
+        self._deleted = bytearray(len(doc_ids))
+        self._n_deleted = 0
+        self._postings = postings
+
+    def search(self, query, k=10):
+        """返回按 BM25 分数排序的 [(块 ID, 分数)]"""
+        with self._lock:
+            n_live = len(self)
+            if not n_live:
+                return []
+            terms = set(tokenize(query))
+            avgdl = self._total_len / n_live or 1.0
+            doc_lens = np.frombuffer(self._doc_lens, dtype=np.uint32)
+            scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint32).astype(np.float32)
+                df = len(docs)
+                idf = math.log(1.0 + (n_live - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * doc_lens[docs] / avgdl)
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+            if self._n_deleted:
+                scores[np.frombuffer(bytes(self._deleted), dtype=np.uint8).astype(bool)] = 0.0
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._doc_ids[doc], float(scores[doc])) for doc in top if scores[doc] > 0]
+
+    def save(self):
+        """以 CSR 格式原子写入磁盘"""
+        if not self.path:
+            return
+        with self._lock:
+            if self._n_deleted:
+                self._compact()
+            terms = list(self._postings)
+            offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+            offsets[1:] = np.cumsum([len(self._postings[t][0]) for t in terms], dtype=np.uint64)
+            docs = np.concatenate([np.frombuffer(self._postings[t][0], dtype=np.uint32) for t in terms]) \
+                if terms else np.zeros(0, dtype=np.uint32)
+            tfs = np.concatenate([np.frombuffer(self._postings[t][1], dtype=np.uint32) for t in terms]) \
+                if terms else np.zeros(0, dtype=np.uint32)
+            os.makedirs(self.path, exist_ok=True)
+            tmp_npz = os.path.join(self.path, "postings.tmp.npz")
+            np.savez(tmp_npz, offsets=offsets, docs=docs, tfs=tfs,
+                     doc_lens=np.frombuffer(self._doc_lens, dtype=np.uint32))
+            tmp_meta = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp_meta, 'w', encoding='utf-8') as f:
+                json.dump({"k1": self.k1, "b": self.b, "doc_ids": self._doc_ids, "terms": terms},
+                          f, ensure_ascii=False)
+            os.replace(tmp_npz, os.path.join(self.path, "postings.npz"))
+            os.replace(tmp_meta, os.path.join(self.path, "meta.json"))
+            self.dirty = False
+
+    def load(self):
+        with self._lock:
+            self._reset()
+            try:
+                with open(os.path.join(self.path, "meta.json"), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                data = np.load(os.path.join(self.path, "postings.npz"))
+            except (OSError, ValueError) as e:
+                logger.warning("加载 BM25 索引失败，将重新构建: %s", e)
+                return
+            self.k1, self.b = meta["k1"], meta["b"]
+            self._doc_ids = meta["doc_ids"]
+            self._doc_index = {chunk_id: doc for doc, chunk_id in enumerate(self._doc_ids)}
+            self._doc_lens = array('I', data["doc_lens"].astype(np.uint32).tobytes())
+            self._deleted = bytearray(len(self._doc_ids))
+            self._total_len = int(data["doc_lens"].sum())
+            offsets, docs, tfs = data["offsets"], data["docs"], data["tfs"]
+            for i, term in enumerate(meta["terms"]):
+                start, end = int(offsets[i]), int(offsets[i + 1])
+                self._postings[term] = (array('I', docs[start:end].tobytes()),
+                                        array('I', tfs[start:end].tobytes()))
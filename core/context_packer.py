@@ -0,0 +1,137 @@
+import math
+from collections import Counter
+
+from core.utils import estimate_tokens, tokenize
+
+
+def merge_adjacent(docs, max_gap=2, max_tokens=None):
+    """合并同一文档中重叠或相邻的块（按 source + page + start_index 判断）
+
+    start_index 是块在加载出的那个 Document 中的偏移，PDF 每页是一个 Document，
+    所以不同页的块即使偏移重叠也不合并。
+
+    块之间的重叠部分只保留一份；合并后的块排在其中排名最靠前的块的位置，
+    metadata["chunk_ids"] 记录被合并的块 ID。没有位置信息的块原样保留。
+    max_tokens 限制合并后单段的大小，避免连续命中的一串块合成一段放不进预算。
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        source, start = doc.metadata.get("source"), doc.metadata.get("start_index")
+        if source is None or start is None:
+            groups[(None, rank)] = [(rank, start, doc)]
+        else:
+            groups.setdefault((source, doc.metadata.get("page")), []).append((rank, start, doc))
+
+    merged = []
+    for items in groups.values():
+        items.sort(key=lambda item: item[1] or 0)
+        rank, start, doc = items[0]
+        text, end, chunk_ids = doc.page_content, (start or 0) + len(doc.page_content), [doc.id]
+        for next_rank, next_start, next_doc in items[1:]:
+            next_end = next_start + len(next_doc.page_content)
+            addition = "" if next_end <= end else next_doc.page_content[end - next_start:] \
+                if next_start <= end else "\n" + next_doc.page_content
+            if next_start > end + max_gap or \
+                    (max_tokens is not None and estimate_tokens(text) + estimate_tokens(addition) > max_tokens):
+                merged.append((rank, _merged_document(doc, text, start, chunk_ids)))
+                rank, start, doc = next_rank, next_start, next_doc
+                text, end, chunk_ids = doc.page_content, start + len(doc.page_content), [doc.id]
+                continue
+            # 重叠部分（end - next_start 个字符）只保留一份，相邻时补一个换行
+            text += addition
+            end = max(end, next_end)
+            rank = min(rank, next_rank)
+            chunk_ids.append(next_doc.id)
+        merged.append((rank, _merged_document(doc, text, start, chunk_ids)))
+    merged.sort(key=lambda item: item[0])
+    return [doc for _, doc in merged]
+
+
+def _merged_document(doc, text, start, chunk_ids):
+    if len(chunk_ids) == 1:
+        return doc
+    metadata = dict(doc.metadata, start_index=start, chunk_ids=chunk_ids)
+    return type(doc)(id=chunk_ids[0], page_content=text, metadata=metadata)
+
+
+def _term_vector(text):
+    counts = Counter(tokenize(text))
+    norm = math.sqrt(sum(tf * tf for tf in counts.values())) or 1.0
+    return counts, norm
+
+
+def _cosine(a, b):
+    (counts_a, norm_a), (counts_b, norm_b) = a, b
+    if len(counts_a) > len(counts_b):
+        counts_a, counts_b = counts_b, counts_a
+    return sum(tf * counts_b.get(term, 0) for term, tf in counts_a.items()) / (norm_a * norm_b)
+
+
+class ContextPacker:
+    """检索结果与提示词之间的上下文打包
+
+    1. 合并同一来源中重叠/相邻的块，去掉重复的重叠文本；
+    2. 按 MMR 选择：相关性取检索排名，冗余度取与已选块的词项（二元组）余弦相似度，
+       与已选块几乎相同的块直接丢弃；
+    3. 在 token 预算内装入尽量多的块，装不下的块跳过，继续尝试后面更短的块。
+    """
+
+    def __init__(self, token_budget, mmr_lambda=0.7, duplicate_threshold=0.9):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+
+    def pack(self, docs, token_budget=None):
+        """返回 (打包后的文档列表, 统计字典)"""
+        budget = self.token_budget if token_budget is None else token_budget
+        tokens_in = sum(estimate_tokens(doc.page_content) for doc in docs)
+        candidates = merge_adjacent(docs, max_tokens=budget // 2)
+        n = len(candidates)
+        vectors = [_term_vector(doc.page_content) for doc in candidates]
+        costs = [estimate_tokens(doc.page_content) for doc in candidates]
+        # 排名越靠前相关性越高，归一化到 (0, 1]
+        relevance = [1.0 - i / n for i in range(n)]
+        max_sim = [0.0] * n
+        remaining = set(range(n))
+        selected, used, duplicates = [], 0, 0
+
+        while remaining:
+            best = max(remaining, key=lambda i: self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * max_sim[i])
+            remaining.discard(best)
+            if max_sim[best] >= self.duplicate_threshold:
+                duplicates += 1
+                continue
+            if used + costs[best] > budget:
+                continue
+            selected.append(best)
+            used += costs[best]
+            for i in remaining:
+                max_sim[i] = max(max_sim[i], _cosine(vectors[best], vectors[i]))
+
+        packed = [candidates[i] for i in selected]
+        if not packed and candidates and budget > 0:
+            # 排名第一的块本身超出预算：截断后放入，保证上下文不为空
+            packed = [self._truncate(candidates[0], budget)]
+            used = estimate_tokens(packed[0].page_content)
+        stats = {
+            "chunks_in": len(docs),
+            "merged": len(docs) - n,
+            "duplicates": duplicates,
+            "chunks_out": len(packed),
+            "tokens_in": tokens_in,
+            "tokens_out": used,
+            "budget": budget,
+        }
+        return packed, stats
+
+    @staticmethod
+    def _truncate(doc, budget):
+        text = doc.page_content
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if estimate_tokens(text[:mid]) <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        return type(doc)(id=doc.id, page_content=text[:lo], metadata=doc.metadata)
@@ -0,0 +1,138 @@
+import logging
+import threading
+
+from core.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 每条消息在模板中的额外开销（角色标记、换行等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ConversationMemory:
+    """按 token 计数的对话记忆：保留最近若干轮原文，更早的轮次在后台线程中压缩为摘要
+
+    历史（摘要 + 最近轮次）超过 max_tokens 时，从最早的一轮开始移出窗口，直到降到
+    max_tokens 的一半；移出的轮次交给 summarize_fn(旧摘要, [(role, content)]) 合并进摘要。
+    摘要完成前请求中只是暂时缺少这几轮，每次请求都不会超出预算。最后一轮始终保留。
+    """
+
+    def __init__(self, max_tokens, summarize_fn=None):
+        self.max_tokens = max_tokens
+        self.summarize_fn = summarize_fn
+        self.summary = ""
+        self.summarized_turns = 0  # 已并入摘要的消息数
+        self._messages = []        # [(role, content, tokens)]
+        self._pending = []         # 等待并入摘要的消息
+        self._epoch = 0            # clear() 后丢弃仍在进行中的摘要结果
+        self._lock = threading.Lock()
+        self._summarizer = None
+        self._summarizing = False
+
+    def add(self, role, content):
+        with self._lock:
+            self._messages.append((role, content, estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS))
+            self._trim()
+
+    def discard_last(self):
+        """撤销最后一条消息（请求失败时移除未得到回答的用户消息）"""
+        with self._lock:
+            if self._messages:
+                self._messages.pop()
+
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+            self._pending.clear()
+            self.summary = ""
+            self.summarized_turns = 0
+            self._epoch += 1
+
+    def token_count(self):
+        """摘要和窗口内消息的估计 token 数"""
+        with self._lock:
+            return self._token_count()
+
+    def _token_count(self):
+        summary_tokens = estimate_tokens(self.summary) + MESSAGE_OVERHEAD_TOKENS if self.summary else 0
+        return summary_tokens + sum(tokens for _, _, tokens in self._messages)
+
+    def messages(self):
+        """对话模式的消息列表：摘要作为 system 消息放在最前面"""
+        with self._lock:
+            messages = [{"role": role, "content": content} for role, content, _ in self._messages]
+            if self.summary:
+                messages.insert(0, {"role": "system", "content": f"以下是之前对话的摘要：\n{self.summary}"})
+            return messages
+
+    def prompt(self, prompt):
+        """生成模式的 (system, prompt)：历史轮次以文本形式拼接在问题之前
+
+        这一轮的问题还不在窗口中，也计入 max_tokens：放不下的较早轮次（最后是摘要）这次不发送，
+        但仍留在窗口中。
+        """
+        with self._lock:
+            budget = self.max_tokens - estimate_tokens(prompt) - MESSAGE_OVERHEAD_TOKENS
+            recent = []
+            for role, content, tokens in reversed(self._messages):
+                if tokens > budget:
+                    break
+                recent.append((role, content))
+                budget -= tokens
+            system = None
+            if self.summary and estimate_tokens(self.summary) + MESSAGE_OVERHEAD_TOKENS <= budget:
+                system = f"以下是之前对话的摘要：\n{self.summary}"
+            history = "\n\n".join(f"{'用户' if role == 'user' else '助手'}：{content}"
+                                  for role, content in reversed(recent))
+        if not history:
+            return system, prompt
+        return system, f"{history}\n\n用户：{prompt}\n助手："
+
+    def stats(self):
+        with self._lock:
+            return {
+                "history_tokens": self._token_count(),
+                "window_messages": len(self._messages),
+                "summarized_messages": self.summarized_turns,
+                "pending_summary": len(self._pending),
+            }
+
+    def _trim(self):
+        if self._token_count() <= self.max_tokens or len(self._messages) <= 1:
+            return
+        evicted = []
+        while len(self._messages) > 1 and self._token_count() > self.max_tokens // 2:
+            role, content, _ = self._messages.pop(0)
+            evicted.append((role, content))
+        logger.info("对话历史超出 %d tokens，%d 条消息移出窗口并在后台摘要", self.max_tokens, len(evicted))
+        if self.summarize_fn is None:
+            return
+        self._pending.extend(evicted)
+        if not self._summarizing:
+            self._summarizing = True
+            self._summarizer = threading.Thread(target=self._summarize_loop, daemon=True)
+            self._summarizer.start()
+
+    def _summarize_loop(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._summarizing = False
+                    return
+                turns, self._pending = self._pending, []
+                summary, epoch = self.summary, self._epoch
+            try:
+                new_summary = self.summarize_fn(summary, turns)
+            except Exception as e:
+                logger.warning("对话摘要失败，移出的消息将被丢弃: %s", e)
+                continue
+            with self._lock:
+                if epoch == self._epoch:
+                    self.summary = new_summary
+                    self.summarized_turns += len(turns)
+
+    def wait(self, timeout=None):
+        """等待后台摘要完成"""
+        summarizer = self._summarizer
+        if summarizer is not None:
+            summarizer.join(timeout)
@@ -0,0 +1,194 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+from config import settings
+from core.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 支持的文档类型
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.docx', '.doc')
+
+# 常驻解析进程池：多次索引（如逐个上传文件）之间复用，省去每次启动子进程和导入解析库的时间
+_pool_lock = threading.Lock()  # 同一时间只有一个 iter_load_files 使用进程池
+_pool = None
+_pool_processes = 0
+_pool_last_used = 0.0
+
+
+def iter_document_files(documents_dir, rel_path=""):
+    """递归扫描目录（os.scandir），按路径顺序产出 (相对路径, 绝对路径, stat)
+
+    rel_path 指定只扫描的子目录或单个文件（相对 documents_dir，使用 / 分隔）；
+    跳过隐藏文件/目录和不支持的文件类型，不跟随目录符号链接以避免循环。
+    """
+    top = os.path.join(documents_dir, rel_path) if rel_path else documents_dir
+    if os.path.isfile(top):
+        if top.endswith(SUPPORTED_EXTENSIONS):
+            yield rel_path, top, os.stat(top)
+        return
+
+    stack = [(top, rel_path)]
+    while stack:
+        dir_path, dir_rel = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            entry_rel = f"{dir_rel}/{entry.name}" if dir_rel else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((entry.path, entry_rel))
+                elif entry.is_file() and entry.name.endswith(SUPPORTED_EXTENSIONS):
+                    yield entry_rel, entry.path, entry.stat()
+            except OSError:
+                continue  # 扫描期间被删除的文件
+        # 逆序入栈，保证按名称顺序遍历子目录
+        stack.extend(reversed(subdirs))
+
+
+def load_file(file_path):
+    """解析单个文件，返回 Document 列表（不支持的类型返回空列表）"""
+    # 在函数内导入，扫描目录等轻量操作不需要加载 langchain
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader, UnstructuredWordDocumentLoader
+
+    if file_path.endswith('.pdf'):
+        loader = PyPDFLoader(file_path)
+    elif file_path.endswith('.txt'):
+        loader = TextLoader(file_path)
+    elif file_path.endswith('.docx'):
+        loader = Docx2txtLoader(file_path)
+    elif file_path.endswith('.doc'):
+        loader = UnstructuredWordDocumentLoader(file_path)
+    else:
+        return []
+    return loader.load()
+
+
+def _load_file_safely(file_path):
+    """在子进程中执行：捕获所有异常，返回 (documents, error, 解析耗时)"""
+    start = time.perf_counter()
+    try:
+        return load_file(file_path), None, time.perf_counter() - start
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}\n{traceback.format_exc()}", time.perf_counter() - start
+
+
+def _acquire_pool(processes):
+    """返回至少有 processes 个进程的常驻进程池，进程数不够时换一个更大的（调用方持有 _pool_lock）"""
+    global _pool, _pool_processes
+    if _pool is None or _pool_processes < processes:
+        _shutdown_pool()
+        # 使用 spawn 避免在带有 Qt 线程的进程中 fork
+        _pool = multiprocessing.get_context("spawn").Pool(processes=processes)
+        _pool_processes = processes
+    return _pool
+
+
+def _shutdown_pool():
+    """结束常驻进程池：terminate 会结束仍卡在超时文件上的子进程"""
+    global _pool, _pool_processes
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool, _pool_processes = None, 0
+
+
+def _release_pool():
+    """一批文件解析完后保留进程池，空闲 LOAD_POOL_IDLE_TIMEOUT 秒后关闭"""
+    global _pool_last_used
+    _pool_last_used = time.monotonic()
+    if _pool is not None and settings.LOAD_POOL_IDLE_TIMEOUT is not None:
+        timer = threading.Timer(settings.LOAD_POOL_IDLE_TIMEOUT, _shutdown_idle_pool)
+        timer.daemon = True
+        timer.start()
+
+
+def _shutdown_idle_pool():
+    with _pool_lock:
+        # 计时期间进程池又被使用过：由那一次之后启动的计时器负责关闭
+        if time.monotonic() - _pool_last_used >= settings.LOAD_POOL_IDLE_TIMEOUT:
+            _shutdown_pool()
+
+
+def iter_load_files(file_paths, max_workers=1, timeout=None):
+    """按输入顺序逐个产出 (file_path, documents)
+
+    max_workers > 1 时在进程池中并行解析；timeout 为等待单个文件结果的最长秒数。
+    设置了 timeout 时即使只有一个文件或 max_workers <= 1 也在子进程中解析，卡住的文件不会阻塞索引。
+    子进程来自常驻进程池，多次调用之间复用；有文件超时或提前停止时进程池被结束，下次调用重新创建。
+    解析失败或超时的文件会记录日志并产出 documents=None，不会中断整批处理。
+    每个文件的解析耗时（子进程中测得，不含排队）计入 load 指标。
+    """
+    file_paths = list(file_paths)
+    if not file_paths:
+        return
+    if not timeout and (max_workers <= 1 or len(file_paths) <= 1):
+        # 没有超时要求时顺序解析，省去启动子进程的开销
+        for file_path in file_paths:
+            logger.info("加载文档: %s", file_path)
+            documents, error, elapsed = _load_file_safely(file_path)
+            get_metrics().observe("load", elapsed)
+            if error:
+                logger.warning("解析文件失败，已跳过: %s\n%s", file_path, error)
+            yield file_path, documents
+        return
+
+    processes = max(1, min(max_workers, len(file_paths)))
+    # 限制已提交但未取走的任务数量，避免结果在内存中堆积
+    prefetch = processes * 2
+    pending = deque()
+    remaining = iter(file_paths)
+    with _pool_lock:
+        pool = _acquire_pool(processes)
+        try:
+            while True:
+                while len(pending) < prefetch:
+                    file_path = next(remaining, None)
+                    if file_path is None:
+                        break
+                    pending.append((file_path, pool.apply_async(_load_file_safely, (file_path,))))
+                if not pending:
+                    break
+
+                file_path, async_result = pending.popleft()
+                logger.info("加载文档: %s", file_path)
+                try:
+                    documents, error, elapsed = async_result.get(timeout=timeout)
+                    get_metrics().observe("load", elapsed)
+                except multiprocessing.TimeoutError:
+                    documents, error = None, f"超过 {timeout} 秒未完成"
+                    # 卡住的子进程会一直占着进程池的位置：换一个新进程池，重新提交还没取走的文件
+                    _shutdown_pool()
+                    pool = _acquire_pool(processes)
+                    pending = deque((path, pool.apply_async(_load_file_safely, (path,))) for path, _ in pending)
+                except Exception as e:
+                    documents, error = None, f"{type(e).__name__}: {e}"
+                if error:
+                    logger.warning("解析文件失败，已跳过: %s\n%s", file_path, error)
+                yield file_path, documents
+        finally:
+            if pending:
+                # 提前停止：已提交的文件可能仍在解析（或卡住），结束进程池
+                _shutdown_pool()
+            else:
+                _release_pool()
+
+
+def load_files(file_paths, max_workers=1, timeout=None):
+    """并行解析多个文件，按输入顺序返回合并后的 Document 列表"""
+    documents = []
+    for _, docs in iter_load_files(file_paths, max_workers, timeout):
+        if docs:
+            documents.extend(docs)
+    return documents
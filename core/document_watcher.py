@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+
+from core.document_loader import SUPPORTED_EXTENSIONS, iter_document_files
+
+logger = logging.getLogger(__name__)
+
+try:
+    # 可选依赖：安装 watchdog 后使用 inotify/FSEvents 等系统通知，否则退回轮询
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        paths = [event.src_path]
+        if getattr(event, "dest_path", None):
+            paths.append(event.dest_path)
+        rel_paths = []
+        for path in paths:
+            rel_path = self.watcher.relative_path(path, event.is_directory)
+            if rel_path is not None:
+                rel_paths.append(rel_path)
+        if rel_paths:
+            self.watcher.notify(rel_paths)
+
+
+class DocumentWatcher:
+    """监视文档目录（递归），将文件系统事件合并后在静默期结束时回调
+
+    callback 在后台线程中以变更的相对路径列表调用，可直接传给增量索引只扫描这些路径。
+    未安装 watchdog 时每 poll_interval 秒比较一次文件的 mtime/大小（不读取文件内容）。
+    """
+
+    def __init__(self, documents_dir, callback, quiet_period=2.0, poll_interval=5.0):
+        self.documents_dir = os.path.abspath(documents_dir)
+        self.callback = callback
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+        self._pending = set()
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._observer = None
+        self._threads = []
+
+    @property
+    def backend(self):
+        return "watchdog" if Observer is not None else "polling"
+
+    def start(self):
+        os.makedirs(self.documents_dir, exist_ok=True)
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.documents_dir, recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            self._start_thread(self._poll_loop)
+        self._start_thread(self._debounce_loop)
+        logger.info("开始监视文档目录: %s（%s）", self.documents_dir, self.backend)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for thread in self._threads:
+            thread.join()
+
+    def relative_path(self, path, is_directory=False):
+        """转换为相对文档目录的路径；忽略目录外、隐藏和不支持类型的文件"""
+        rel_path = os.path.relpath(os.path.abspath(path), self.documents_dir)
+        if rel_path.startswith(".."):
+            return None
+        rel_path = "" if rel_path == "." else rel_path.replace(os.sep, "/")
+        if any(part.startswith(".") for part in rel_path.split("/") if part):
+            return None
+        if not is_directory and not rel_path.endswith(SUPPORTED_EXTENSIONS):
+            return None
+        return rel_path
+
+    def notify(self, rel_paths):
+        """记录变更路径，并推迟回调直到静默期结束"""
+        with self._cond:
+            self._pending.update(rel_paths)
+            self._last_event = time.monotonic()
+            self._cond.notify_all()
+
+    def _start_thread(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _debounce_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                remaining = self._last_event + self.quiet_period - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = sorted(self._pending)
+                self._pending.clear()
+            try:
+                self.callback(batch)
+            except Exception as e:
+                logger.exception("文档变更回调出错: %s", e)
+
+    def _snapshot(self):
+        return {rel_path: (stat.st_mtime_ns, stat.st_size)
+                for rel_path, _, stat in iter_document_files(self.documents_dir)}
+
+    def _poll_loop(self):
+        snapshot = self._snapshot()
+        while True:
+            with self._cond:
+                if self._cond.wait_for(lambda: self._stopped, self.poll_interval):
+                    return
+            current = self._snapshot()
+            changed = [rel for rel in current.keys() | snapshot.keys() if current.get(rel) != snapshot.get(rel)]
+            snapshot = current
+            if changed:
+                self.notify(changed)
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from core.metrics import get_metrics
+from core.scheduler import BACKGROUND, INTERACTIVE, get_scheduler
+from core.utils import normalize_text
+
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """基于 SQLite 的持久化嵌入缓存，键为 (嵌入模型, 规范化文本哈希)，向量以 float32 存储
+
+    条目数超过 max_entries 时按最近使用时间淘汰最旧的条目。
+    """
+
+    def __init__(self, path, max_entries=200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """批量查询，返回与 texts 对应的向量列表（未命中为 None）"""
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite 单条语句的参数数量有限，分批查询
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, blob in self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used=? WHERE key=?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model, texts, vectors):
+        """批量写入向量，必要时淘汰最久未使用的条目"""
+        now = time.time()
+        rows = [(cache_key(model, text), array('f', vector).tobytes(), now)
+                for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._count > self.max_entries:
+                # 一次多淘汰 10%，避免每次写入都触发淘汰
+                n_evict = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (n_evict,))
+                self._count -= n_evict
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """在底层嵌入模型前加一层持久化缓存，只有未命中的文本才会发送给模型
+
+    OllamaEmbeddings 对文档和查询使用同一个接口，因此两者共享缓存条目。
+    对模型的调用经过请求调度器：查询嵌入为交互优先级，文档（索引）嵌入为后台优先级。
+    """
+
+    def __init__(self, embeddings, model, cache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model, texts)
+        # 同一批次中重复的文本只嵌入一次
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            with get_scheduler().slot("embedding", priority=BACKGROUND), get_metrics().span("embed"):
+                computed = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            self.cache.put_many(self.model, missing, [computed[text] for text in missing])
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text):
+        vector = self.cache.get_many(self.model, [text])[0]
+        if vector is None:
+            with get_scheduler().slot("embedding", priority=INTERACTIVE):
+                vector = self.embeddings.embed_query(text)
+            self.cache.put_many(self.model, [text], [vector])
+        return vector
+
+    async def aembed_documents(self, texts):
+        vectors = self.cache.get_many(self.model, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            async with get_scheduler().aslot("embedding", priority=BACKGROUND):
+                with get_metrics().span("embed"):
+                    computed = dict(zip(missing, await self.embeddings.aembed_documents(missing)))
+            self.cache.put_many(self.model, missing, [computed[text] for text in missing])
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors
+
+    async def aembed_query(self, text):
+        vector = self.cache.get_many(self.model, [text])[0]
+        if vector is None:
+            async with get_scheduler().aslot("embedding", priority=INTERACTIVE):
+                vector = await self.embeddings.aembed_query(text)
+            self.cache.put_many(self.model, [text], [vector])
+        return vector
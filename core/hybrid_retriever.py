@@ -0,0 +1,143 @@
+import re
+from typing import Any, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# 法条编号（"第1077条"、"第三编第二章"）和引号内的短语
+_ARTICLE_RE = re.compile(r"第[零〇一二三四五六七八九十百千万两\d]+[编章节条款项]")
+_QUOTED_RE = re.compile(r"“([^”]+)”|\"([^\"]+)\"")
+# 法条编号中的阿拉伯数字（"第1077条"的 1077）
+_ARABIC_ARTICLE_NUMBER_RE = re.compile(r"(?<=第)\d+(?=[编章节条款项])")
+# 判断查询是否只是法条编号时忽略的标点、空白和套话
+_LOOKUP_FILLER_RE = re.compile(r"[\W_]|请问|查询|查看|是什么|什么|内容|全文|原文|条文|规定|的")
+
+_CHINESE_DIGITS = "零一二三四五六七八九"
+
+
+def _chinese_numeral(n):
+    """1 到 9999 的整数按法规条文的写法转成中文数字（1077 -> 一千零七十七，10 -> 十），其他返回 None"""
+    if not 0 < n < 10000:
+        return None
+    text, zero = "", False
+    for digit, unit in zip(f"{n:04d}", ("千", "百", "十", "")):
+        if digit == "0":
+            zero = bool(text)  # 中间的零（一个或多个）只写一个"零"，末尾的零不写
+            continue
+        if zero:
+            text, zero = text + "零", False
+        text += _CHINESE_DIGITS[int(digit)] + unit
+    return text[1:] if text.startswith("一十") else text
+
+
+def _article_terms(query):
+    """查询中的法条编号；用阿拉伯数字写的编号再补上中文数字写法（民法典等法规原文使用中文数字）"""
+    terms = []
+    for term in _ARTICLE_RE.findall(query):
+        terms.append(term)
+        alias = _ARABIC_ARTICLE_NUMBER_RE.sub(lambda m: _chinese_numeral(int(m.group())) or m.group(), term)
+        if alias != term:
+            terms.append(alias)
+    return terms
+
+
+def lexical_query(query):
+    """词项检索使用的查询：末尾追加法条编号的中文数字写法，两种写法的原文都能命中"""
+    aliases = [term for term in _article_terms(query) if term not in query]
+    return " ".join([query] + aliases)
+
+
+def lookup_terms(query):
+    """查询中的法条编号和引号内的短语：融合时提升原文包含它们的块"""
+    return _article_terms(query) + [a or b for a, b in _QUOTED_RE.findall(query)]
+
+
+def exact_lookup_terms(query, max_extra=4):
+    """查询基本上只是法条编号时（如"第1077条"、"《民法典》第三编第二章的内容"）返回这些编号，否则返回空列表
+
+    编号之外最多允许 max_extra 个其他字（如法规简称），带有其他内容的问题仍需要向量检索。
+    """
+    terms = _article_terms(query)
+    if not terms:
+        return []
+    rest = _LOOKUP_FILLER_RE.sub("", _ARTICLE_RE.sub("", query))
+    return terms if len(rest) <= max_extra else []
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """倒数排名融合：rankings 为若干按相关性排序的 ID 列表，返回融合后的 [(ID, 分数)]"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 词项检索与向量检索的混合检索器（RRF 融合）
+
+    只由法条编号构成的查询（如"第1040条"、"第一千零四十条"）走纯词项检索快速路径，
+    不需要调用嵌入模型；词项检索没有结果时退回混合检索。其他带法条编号或引号短语的问题
+    仍做混合检索，原文包含这些词的候选块作为第三路排名参与融合。阿拉伯数字的法条编号
+    同时按中文数字写法检索和匹配。
+    异步接口（ainvoke）只异步等待查询嵌入，词项检索和向量扫描是短小的本地计算，直接执行。
+    """
+
+    vector_store: Any
+    lexical_index: Any
+    k: int = 10
+    fetch_k: int = 20  # 每一路召回的候选数
+    rrf_k: int = 60
+    lexical_fast_path: bool = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        lexical_hits = self.lexical_index.search(lexical_query(query), self.fetch_k)
+        docs = self._exact_lookup(query, lexical_hits)
+        if docs is not None:
+            return docs
+        vector_docs = self.vector_store.similarity_search(query, k=self.fetch_k)
+        return self._fuse(query, vector_docs, lexical_hits)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        lexical_hits = self.lexical_index.search(lexical_query(query), self.fetch_k)
+        docs = self._exact_lookup(query, lexical_hits)
+        if docs is not None:
+            return docs
+        embedding = await self.vector_store.embeddings.aembed_query(query)
+        vector_docs = self.vector_store.similarity_search_by_vector(embedding, k=self.fetch_k)
+        return self._fuse(query, vector_docs, lexical_hits)
+
+    def _exact_lookup(self, query, lexical_hits):
+        """精确查找快速路径，不适用时返回 None"""
+        exact_terms = exact_lookup_terms(query) if self.lexical_fast_path else []
+        if not (exact_terms and lexical_hits):
+            return None
+        # 二元组 BM25 不区分"第一千二百六十条"和"第一千二百五十条"，
+        # 按原文是否包含查找词重排（稳定排序，保留 BM25 顺序）
+        docs = self._fetch([chunk_id for chunk_id, _ in lexical_hits])
+        docs.sort(key=lambda doc: -sum(term in doc.page_content for term in exact_terms))
+        return docs[:self.k]
+
+    def _fuse(self, query, vector_docs, lexical_hits):
+        by_id = {doc.id: doc for doc in vector_docs if doc.id}
+        rankings = [[doc.id for doc in vector_docs if doc.id], [chunk_id for chunk_id, _ in lexical_hits]]
+        terms = lookup_terms(query)
+        if terms:
+            # 两路候选中原文包含法条编号/引号短语的块，按包含的词数排序（稳定排序，先向量后词项）
+            by_id.update((doc.id, doc) for doc in self._fetch([i for i in rankings[1] if i not in by_id]))
+            candidates = [by_id[doc_id] for doc_id in dict.fromkeys(rankings[0] + rankings[1]) if doc_id in by_id]
+            matches = [(sum(term in doc.page_content for term in terms), doc.id) for doc in candidates]
+            rankings.append([doc_id for count, doc_id in sorted(matches, key=lambda m: -m[0]) if count])
+        fused = reciprocal_rank_fusion(rankings, k=self.rrf_k)[:self.k]
+        # 只有词项检索命中的块需要从向量库按 ID 取回（不涉及嵌入计算）
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing:
+            by_id.update((doc.id, doc) for doc in self._fetch(missing))
+        return [by_id[doc_id] for doc_id, _ in fused if doc_id in by_id]
+
+    def _fetch(self, chunk_ids):
+        """按 ID 取回文档并保持给定顺序"""
+        docs = {doc.id: doc for doc in self.vector_store.get_by_ids(chunk_ids)}
+        return [docs[chunk_id] for chunk_id in chunk_ids if chunk_id in docs]
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+from collections import namedtuple
+
+from core.document_loader import iter_document_files
+
+logger = logging.getLogger(__name__)
+
+# 需要重新索引的文件：相对路径、绝对路径、内容哈希、修改时间、大小
+FileChange = namedtuple("FileChange", ["rel_path", "path", "content_hash", "mtime", "size"])
+
+
+def file_content_hash(file_path, block_size=1 << 20):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text):
+    """计算文本内容的 SHA-256"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_ids_for(rel_path, texts):
+    """为同一文件的文本块生成稳定 ID
+
+    ID 只由文件路径、块内容和相同内容在文件内出现的序号决定，
+    因此文件其他位置的修改不会改变未变化块的 ID。
+    """
+    seen = {}
+    ids = []
+    for text in texts:
+        h = text_hash(text)
+        ordinal = seen.get(h, 0)
+        seen[h] = ordinal + 1
+        ids.append(hashlib.sha256(f"{rel_path}\0{h}\0{ordinal}".encode('utf-8')).hexdigest()[:32])
+    return ids
+
+
+def _is_under(rel_path, root):
+    return not root or rel_path == root or rel_path.startswith(root + "/")
+
+
+def _collapse_paths(paths):
+    """规范化相对路径并去掉已被上级目录覆盖的路径，"" 表示整个目录"""
+    if paths is None:
+        return [""]
+    roots = []
+    for path in sorted({os.path.normpath(p).replace(os.sep, "/").strip("/") for p in paths}):
+        path = "" if path == "." else path
+        if not any(_is_under(path, root) for root in roots):
+            roots.append(path)
+    return roots
+
+
+class IndexManifest:
+    """已索引文件清单：{相对路径: {内容哈希, mtime, 大小, 块 ID 列表}}"""
+    VERSION = 1
+
+    def __init__(self, path, chunking=None):
+        self.path = path
+        self.chunking = chunking or {}  # 分块/嵌入参数，变化时需要全部重建
+        self.files = {}
+        self.loaded = False  # 清单文件是否已存在
+        self.invalidated = False  # 加载时发现版本或分块参数已变化，旧向量需要清空
+        self.generation = 0  # 每次提交递增，用作索引版本号（查询缓存失效）
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.loaded = True
+        if data.get("version") != self.VERSION or data.get("chunking") != self.chunking:
+            # 版本或分块参数变化：保留旧块 ID 以便删除，但强制所有文件重新索引
+            logger.info("索引清单版本或分块参数已变化，将重新索引所有文件。")
+            self.invalidated = True
+            self.files = {
+                rel: {"hash": None, "mtime": None, "size": None, "chunks": entry.get("chunks", [])}
+                for rel, entry in data.get("files", {}).items()
+            }
+        else:
+            self.files = data.get("files", {})
+
+    def save(self):
+        """原子写入清单文件"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.VERSION, "chunking": self.chunking, "files": self.files},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.loaded = True
+        self.generation += 1
+
+    def scan(self, documents_dir, paths=None):
+        """递归扫描文档目录，返回 (变更文件列表, 已删除文件的相对路径列表)
+
+        paths 为需要检查的相对路径（文件或子目录）列表，None 表示整个目录；
+        只有这些路径下的已删除文件会被报告。
+        mtime 和大小都未变化的文件直接跳过；否则比较内容哈希，
+        仅修改时间变化（touch）的文件只更新记录，不需要重新索引。
+        """
+        roots = _collapse_paths(paths)
+        changed = []
+        present = set()
+        for root in roots:
+            for rel_path, file_path, stat in iter_document_files(documents_dir, root):
+                present.add(rel_path)
+                entry = self.files.get(rel_path)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    continue
+                try:
+                    content_hash = file_content_hash(file_path)
+                except OSError:
+                    present.discard(rel_path)  # 扫描期间被删除
+                    continue
+                if entry and entry["hash"] == content_hash:
+                    entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+                    continue
+                changed.append(FileChange(rel_path, file_path, content_hash, stat.st_mtime, stat.st_size))
+
+        deleted = sorted(rel for rel in self.files
+                         if rel not in present and any(_is_under(rel, root) for root in roots))
+        return changed, deleted
+
+    def chunk_ids(self, rel_path):
+        entry = self.files.get(rel_path)
+        return list(entry["chunks"]) if entry else []
+
+    def embedded_chunk_ids(self, rel_path):
+        """已按当前分块/嵌入参数写入向量库的块 ID
+
+        参数变化后作废的记录（内容哈希为 None）返回空列表：块 ID 不含这些参数，
+        ID 相同的块也必须重新嵌入。
+        """
+        entry = self.files.get(rel_path)
+        return list(entry["chunks"]) if entry and entry["hash"] is not None else []
+
+    def update(self, change, chunk_ids):
+        self.files[change.rel_path] = {
+            "hash": change.content_hash,
+            "mtime": change.mtime,
+            "size": change.size,
+            "chunks": list(chunk_ids),
+        }
+
+    def remove(self, rel_path):
+        self.files.pop(rel_path, None)
+
+    def all_chunk_ids(self):
+        return [cid for entry in self.files.values() for cid in entry["chunks"]]
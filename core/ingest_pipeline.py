@@ -0,0 +1,233 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from core.index_manifest import chunk_ids_for
+from core.metrics import get_metrics
+
+# 分割阶段的输出：一个文件的变更记录、全部块 ID、需要新写入的 (ID, 块)、需要删除的旧块 ID
+FileChunks = namedtuple("FileChunks", ["change", "chunk_ids", "new_chunks", "stale_ids"])
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def threaded_stage(iterable, maxsize):
+    """在后台线程中迭代 iterable，通过有界队列按顺序产出元素
+
+    队列满时生产者阻塞，因此各阶段之间最多缓存 maxsize 个元素。
+    消费者提前停止时，生产者线程会关闭 iterable（例如结束进程池）。
+    """
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    break
+        except BaseException as e:
+            put(_StageError(e))
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        # 不等待生产者线程：它会在下一次 put 时发现停止标志并自行退出
+        stop.set()
+
+
+class IngestStats:
+    def __init__(self, files_total=0):
+        self.files_total = files_total
+        self.files_parsed = 0  # 已解析（含失败）的文件数
+        self.files_indexed = 0
+        self.files_failed = 0
+        self.chunks_added = 0
+        self.chunks_removed = 0
+        self.cancelled = False
+        self.started = time.monotonic()
+
+    def progress(self):
+        """当前进度，ETA 按已解析文件的平均耗时估算"""
+        elapsed = time.monotonic() - self.started
+        eta = None
+        if self.files_parsed:
+            eta = elapsed / self.files_parsed * (self.files_total - self.files_parsed)
+        return {
+            "files_total": self.files_total,
+            "files_parsed": self.files_parsed,
+            "files_failed": self.files_failed,
+            "chunks_embedded": self.chunks_added,
+            "chunks_removed": self.chunks_removed,
+            "elapsed": elapsed,
+            "eta": eta,
+        }
+
+    def __str__(self):
+        text = (f"新增 {self.chunks_added} 个块，删除 {self.chunks_removed} 个块，"
+                f"{self.files_failed} 个文件解析失败")
+        if self.cancelled:
+            text += f"（已取消，完成 {self.files_indexed}/{self.files_total} 个文件）"
+        return text
+
+
+class IngestPipeline:
+    """流式增量索引：加载 → 分割 → 嵌入/写入
+
+    加载和分割各自运行在后台线程中，阶段之间通过有界队列连接；
+    新块按批次写入向量库，每批写入后提交清单，峰值内存与语料总量无关，
+    长时间索引过程中已写入的内容即可被检索。
+    progress_callback 在每个文件和每批写入后收到进度字典；cancel_event 置位后在
+    下一个文件或批次边界停止，已提交的文件保持一致，中途停止的文件已写入的块会被删除。
+    """
+
+    def __init__(self, load_fn, split_fn, vector_db, manifest, batch_size=64, queue_size=4,
+                 progress_callback=None, cancel_event=None, lexical_index=None):
+        self.load_fn = load_fn  # file_paths -> 迭代 (file_path, documents)
+        self.split_fn = split_fn  # documents -> chunks
+        self.vector_db = vector_db
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.lexical_index = lexical_index  # 可选的 BM25 索引，与向量库同步增删
+        self.stats = IngestStats()
+
+    def _cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self.stats.cancelled = True
+        return self.stats.cancelled
+
+    def _report(self):
+        if self.progress_callback is not None:
+            self.progress_callback(self.stats.progress())
+
+    def _split_stage(self, changes):
+        changes_by_path = {change.path: change for change in changes}
+        loaded = threaded_stage(self.load_fn(list(changes_by_path)), self.queue_size)
+        try:
+            for file_path, documents in loaded:
+                self.stats.files_parsed += 1
+                if documents is None:
+                    self.stats.files_failed += 1  # 解析失败：保留旧记录，下次扫描时重试
+                    continue
+                change = changes_by_path[file_path]
+                with get_metrics().span("split"):
+                    chunks = self.split_fn(documents) if documents else []
+                chunk_ids = chunk_ids_for(change.rel_path, [chunk.page_content for chunk in chunks])
+                old_ids = set(self.manifest.chunk_ids(change.rel_path))
+                embedded = set(self.manifest.embedded_chunk_ids(change.rel_path))
+                new_chunks = [(cid, chunk) for cid, chunk in zip(chunk_ids, chunks) if cid not in embedded]
+                stale_ids = list(old_ids.difference(chunk_ids))
+                yield FileChunks(change, chunk_ids, new_chunks, stale_ids)
+        finally:
+            loaded.close()
+
+    def run(self, changes, deleted):
+        """执行增量索引，返回 IngestStats"""
+        self.stats = IngestStats(files_total=len(changes))
+        try:
+            return self._run(changes, deleted)
+        finally:
+            # BM25 索引只在结束时落盘；中途退出时缺失的部分在下次打开时按清单补齐
+            if self.lexical_index is not None and self.lexical_index.dirty:
+                self.lexical_index.save()
+
+    def _run(self, changes, deleted):
+        # 已删除文件的块不需要嵌入，先行删除
+        for rel_path in deleted:
+            self._delete(self.manifest.chunk_ids(rel_path))
+            self.manifest.remove(rel_path)
+        if deleted:
+            self.manifest.save()
+
+        buffer = []  # 待写入的 (ID, 块)
+        pending = []  # 所有块都已进入 buffer、等待提交的文件
+        split = threaded_stage(self._split_stage(changes), self.queue_size)
+        try:
+            for file_chunks in split:
+                for written, item in enumerate(file_chunks.new_chunks, 1):
+                    buffer.append(item)
+                    if len(buffer) >= self.batch_size:
+                        self._flush(buffer, pending)
+                        if self._cancelled():
+                            self._rollback(file_chunks, written)
+                            return self.stats
+                pending.append(file_chunks)
+                if not buffer:
+                    self._commit(pending)
+                self._report()
+                if self._cancelled():
+                    break
+            # 取消时也写入已进入缓冲区的块，使已完整处理的文件得以提交
+            self._flush(buffer, pending)
+            self._report()
+        finally:
+            split.close()
+        return self.stats
+
+    def _flush(self, buffer, pending):
+        """写入一批新块，并提交所有块都已写入的文件"""
+        if buffer:
+            with get_metrics().span("upsert"):  # 包含其中的嵌入请求（embed）
+                self.vector_db.add_documents([chunk for _, chunk in buffer], ids=[cid for cid, _ in buffer])
+                if self.lexical_index is not None:
+                    self.lexical_index.add([cid for cid, _ in buffer], [chunk.page_content for _, chunk in buffer])
+            self.stats.chunks_added += len(buffer)
+            buffer.clear()
+            self._report()
+        self._commit(pending)
+
+    def _commit(self, pending):
+        if not pending:
+            return
+        for file_chunks in pending:
+            # 新块写入后再删除旧块，更新过程中文件始终可被检索
+            self._delete(file_chunks.stale_ids)
+            self.manifest.update(file_chunks.change, file_chunks.chunk_ids)
+            self.stats.files_indexed += 1
+        pending.clear()
+        self.manifest.save()
+
+    def _rollback(self, file_chunks, written):
+        """在文件中途取消时删除该文件已写入的前 written 个新块：清单没有记录它们，之后的增量索引不会清理"""
+        chunk_ids = [cid for cid, _ in file_chunks.new_chunks[:written]]
+        if chunk_ids:
+            self.vector_db.delete(ids=chunk_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete(chunk_ids)
+            self.stats.chunks_added -= len(chunk_ids)
+
+    def _delete(self, chunk_ids):
+        if chunk_ids:
+            self.vector_db.delete(ids=chunk_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete(chunk_ids)
+            self.stats.chunks_removed += len(chunk_ids)
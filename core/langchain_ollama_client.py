@@ -1,163 +1,187 @@
-import requests
-import json
-import ollama
-from ollama import chat
-import langchain
-import langsmith
-
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader,UnstructuredWordDocumentLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_ollama import OllamaEmbeddings, ChatOllama, OllamaLLM
-
-from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder,PromptTemplate 
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+# langchain / chroma / ollama 等重量级依赖在首次使用时才导入（见各方法内的 import），
+# 窗口可以在几百毫秒内显示，RAG 相关模块由后台索引线程首先加载
 from typing import List, Union, Annotated
-from pydantic import Field
 
+import logging
 import os
+import threading
+import time
+from collections import namedtuple
+from config import settings
+from core.metrics import get_metrics
+from core.profiler import profile
 from core.ollama_client import OllamaAPI
+from core.utils import LRUCache, normalize_text, estimate_tokens
+from core.document_loader import iter_load_files
+from core.index_manifest import IndexManifest
+from core.text_splitter import ChineseTextSplitter
+from core.context_packer import ContextPacker
+from core.scheduler import Cancelled, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# RAG 链的两个部分：检索器和提示模板（生成时直接流式调用 LLM，见 process_query）
+RagChain = namedtuple("RagChain", ["retriever", "prompt"])
+
+# 离线提示模板中系统说明和格式部分的 token 数（估计值，含余量）
+PROMPT_OVERHEAD_TOKENS = 64
+
+
+def format_docs(docs):
+    """把文档块拼接为提示中的上下文（与 create_stuff_documents_chain 的默认格式相同）"""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def print_retrieval_trace(query, docs, elapsed, cached):
+    """调试用的检索结果输出"""
+    lines = [f"--- Retrieved Documents for query: '{query}' ({elapsed * 1000:.1f} ms{', cached' if cached else ''}) ---"]
+    for i, doc in enumerate(docs):
+        lines.append(f"Doc {i+1} [{doc.id}]: {doc.page_content[:200]}...")
+        lines.append(f"Metadata: {doc.metadata}")
+    lines.append("--- End Retrieved Documents ---")
+    logger.info("\n".join(lines))
+
+
+def generation_info_handler():
+    """返回 LangChain 回调：LLM 的流正常结束后 handler.info 为 Ollama 最后一块中的统计
+    （prompt_eval_count、prompt_eval_duration、eval_count、eval_duration，单位纳秒）"""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class GenerationInfoHandler(BaseCallbackHandler):
+        run_inline = True  # 异步流中也直接在当前协程中调用
+
+        def __init__(self):
+            self.info = {}
+
+        def on_llm_end(self, response, **kwargs):
+            self.info = response.generations[0][0].generation_info or {}
+
+    return GenerationInfoHandler()
+
+
 class LangchainOllamaAPI(OllamaAPI):
-    BASE_URL = "http://localhost:11434"
     
-    def __init__(self, model="gemma3n"):
-        self.model = model
-        self.llm = OllamaLLM(model=self.model)
-        self.generate_context = []  # 生成模式上下文
-        self.chat_context = []  # 对话上下文
+    def __init__(self, model="gemma3n", auto_index=True):
+        super().__init__(model)  # 生成/对话模式的对话记忆
+        self._llm = None  # OllamaLLM，首次使用时创建
         self.vector_db = None  # 向量存储
-        self.embeddings = OllamaEmbeddings(model="nomic-embed-text")  # 嵌入模型
+        # 嵌入模型（文档和查询嵌入都经过持久化缓存），首次使用时创建
+        self.embedding_cache = None
+        self._embeddings = None
         self.rag_chain = None  # RAG链
         self.chunk_size = 1000  # 文本分割大小
         self.chunk_overlap = 200  # 文本分割重叠大小
-        self.persist_directory = "./chroma_db"   # 向量数据库持久化目录
+        self.vector_store_backend = settings.VECTOR_STORE_BACKEND  # 向量库后端：chroma 或 numpy
+        self.persist_directory = settings.VECTOR_STORE_DIRECTORIES[self.vector_store_backend]   # 向量数据库持久化目录
         self.documentes_dir = "./documents" # 文档目录
         self.LANGSMITH_API_KEY = ""  # LangSmith API Key
         self.search_k = 10  # 检索时返回的文档数量
-        self.rebuild_index_and_chain()  # 初始化时重建索引和RAG链
+        self.load_workers = settings.LOAD_WORKERS  # 并行解析文档的进程数
+        self.load_timeout = settings.LOAD_TIMEOUT  # 单个文件解析超时（秒）
+        self.ingest_batch_size = settings.INGEST_BATCH_SIZE  # 每批嵌入并写入的块数
+        self.ingest_queue_size = settings.INGEST_QUEUE_SIZE  # 索引流水线各阶段之间的队列长度
+        # 索引清单：记录每个文件的内容哈希和块 ID，用于增量更新
+        self.manifest = IndexManifest(
+            os.path.join(self.persist_directory, "index_manifest.json"),
+            chunking={"splitter": "chinese-v1", "chunk_size": self.chunk_size, "chunk_overlap": self.chunk_overlap,
+                      "embedding_model": settings.EMBEDDING_MODEL}
+        )
+        # BM25 词项索引（与向量库同步增删），用于混合检索；与向量库一起在首次索引时打开
+        self.lexical_index = None
+        # 检索结果缓存，键为 (规范化查询, 索引版本, k)，索引每次提交后自动失效
+        self.query_cache = LRUCache(settings.QUERY_CACHE_SIZE)
+        # 检索结果的上下文打包（合并重叠块、MMR 去冗余、按 token 预算裁剪）
+        self.context_packer = ContextPacker(
+            settings.NUM_CTX - settings.CONTEXT_ANSWER_RESERVE - PROMPT_OVERHEAD_TOKENS,
+            mmr_lambda=settings.CONTEXT_MMR_LAMBDA
+        ) if settings.CONTEXT_PACKING else None
+        # 可选的检索调试输出：callable(query, docs, elapsed, cached)
+        self.retrieval_trace_sink = print_retrieval_trace if settings.RETRIEVAL_DEBUG else None
+        self._index_lock = threading.Lock()  # 同一时间只允许一个索引任务
+        if auto_index:
+            self.rebuild_index_and_chain()  # 初始化时重建索引和RAG链（GUI 中改由后台线程执行）
     
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_ollama import OllamaLLM
+            self._llm = OllamaLLM(model=self.model, num_ctx=settings.NUM_CTX, base_url=self.BASE_URL,
+                                  keep_alive=settings.OLLAMA_KEEP_ALIVE)
+        return self._llm
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from langchain_ollama import OllamaEmbeddings
+            from core.embedding_cache import EmbeddingCache, CachedEmbeddings
+            self.embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH,
+                                                  max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES)
+            ollama_embeddings = OllamaEmbeddings(model=settings.EMBEDDING_MODEL, base_url=self.BASE_URL,
+                                                 keep_alive=settings.OLLAMA_KEEP_ALIVE)
+            self._embeddings = CachedEmbeddings(ollama_embeddings,
+                                                settings.EMBEDDING_MODEL, self.embedding_cache)
+        return self._embeddings
+
+    def _warm_up(self, model):
+        super()._warm_up(model)
+        try:
+            # RAG 查询还需要嵌入模型，一并预加载
+            self._client().embed(model=settings.EMBEDDING_MODEL, input="", keep_alive=settings.OLLAMA_KEEP_ALIVE)
+        except Exception as e:
+            logger.warning("预加载嵌入模型 %s 失败: %s", settings.EMBEDDING_MODEL, e)
+
     def get_documentes_dir(self):
         """获取文档目录"""
         return self.documentes_dir
     # 新增方法：检测需要更新的文件
-    def get_changed_files(self):
-        processed_info_path = os.path.join(self.persist_directory, "processed_files.json")
-    
+    def get_changed_files(self, paths=None):
+        """递归扫描并对比索引清单（内容哈希），返回 (需要重新索引的文件, 已删除文件的相对路径)
+
+        paths 为相对文档目录的文件/子目录列表（例如目录监视器报告的变更），None 表示全部扫描。
+        """
         # 确保向量库目录存在
         os.makedirs(self.persist_directory, exist_ok=True)
-        # 读取已处理文件记录（格式：{文件名: 最后修改时间})
-        if os.path.exists(processed_info_path):
-            with open(processed_info_path, 'r') as f:
-                processed_files = json.load(f)
-        else:
-            processed_files = {}
-        
-        # 扫描文档目录，检查变更
-        changed_files = []
-        for file in os.listdir(self.documentes_dir):
-            file_path = os.path.join(self.documentes_dir, file)
-            mtime = os.path.getmtime(file_path)
-            
-            # 如果是新文件或修改过的文件
-            if file not in processed_files or processed_files[file] != mtime:
-                changed_files.append(file_path)
-                processed_files[file] = mtime  # 更新记录
-        
-        # 保存处理记录
-        with open(processed_info_path, 'w') as f:
-            json.dump(processed_files, f)
-            
-        return changed_files
+        return self.manifest.scan(self.documentes_dir, paths)
     
-    # 1. 定义文档加载函数，支持PDF, TXT, DOCX等格式
-    def load_documents(self):
-        changed_files = self.get_changed_files()
-        documents = []
-
-        for file_path in changed_files:
-
-            if file_path.endswith('.pdf'):
-                loader = PyPDFLoader(file_path)
-                print(f"加载 PDF 文档: {file_path}")
-                documents.extend(loader.load())
-            elif file_path.endswith('.txt'):
-                loader = TextLoader(file_path)
-                documents.extend(loader.load())
-            elif file_path.endswith('.docx'):
-                print(f"加载 Docx 文档: {file_path}")
-                loader = Docx2txtLoader(file_path)
-                documents.extend(loader.load())
-            elif file_path.endswith('.doc'):
-                print(f"加载 Doc 文档: {file_path}")
-                loader = UnstructuredWordDocumentLoader(file_path)
-                documents.extend(loader.load())
-
-        return documents
-    # 2. 文本分割
+    # 1. 定义文档加载函数，支持PDF, TXT, DOCX等格式（进程池并行解析，结果顺序与文件顺序一致）
+    def load_documents(self, file_paths):
+        """按文件顺序产出 (file_path, documents)，解析失败的文件 documents 为 None"""
+        return iter_load_files(file_paths, max_workers=self.load_workers, timeout=self.load_timeout)
+
+    # 2. 文本分割（单次扫描，识别中文标点和 第X条 标题）
     def split_documents(self, documents):
-        text_splitter = RecursiveCharacterTextSplitter(
+        text_splitter = ChineseTextSplitter(
             chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len,
-            separators=[
-                "\n\n",  # Split by double newlines (paragraphs)
-                "\n",    # Split by single newlines
-                ". ",    # Split by period followed by space (ensure space to avoid splitting mid-sentence e.g. Mr. Smith)
-                "? ",    # Split by question mark followed by space
-                "! ",    # Split by exclamation mark followed by space
-                "。 ",   # Chinese period followed by space (if applicable)
-                "？ ",   # Chinese question mark followed by space (if applicable)
-                "！ ",   # Chinese exclamation mark followed by space (if applicable)
-                "。\n",  # Chinese period followed by newline
-                "？\n",  # Chinese question mark followed by newline
-                "！\n",  # Chinese exclamation mark followed by newline
-                " ",     # Split by space as a fallback
-                ""       # Finally, split by character if no other separator is found
-            ],
-            is_separator_regex=False
+            chunk_overlap=self.chunk_overlap
         )
         return text_splitter.split_documents(documents)
 
     # 3. 创建或加载向量数据库
-    def get_vector_db(self, chunks):
-        """Creates a new vector DB or loads an existing one."""
-        if os.path.exists(self.persist_directory) and os.listdir(self.persist_directory):
-            print(f"Loading existing vector database from {self.persist_directory}...")
-            try:
-                # When loading, ChromaDB will check for dimension compatibility.
-                # If EMBEDDING_MODEL_PATH changed leading to a dimension mismatch, this will fail.
-                return Chroma(persist_directory=self.persist_directory, embedding_function=self.embeddings)
-            except Exception as e:
-                print(f"Error loading existing vector database: {e}.")
-                print(f"This might be due to a change in the embedding model and a dimension mismatch.")
-                # If loading fails, proceed as if it doesn't exist, but only create if chunks are given later.
-                return None # Indicate loading failed or DB doesn't exist in a usable state
-        else:
-            # Directory doesn't exist or is empty
-            if chunks:
-                print(f"Creating new vector database in {self.persist_directory}...")
-                print(f"Creating Chroma DB with {len(chunks)} chunks...")
-                try:
-                    vector_db = Chroma.from_documents(
-                        documents=chunks,
-                        embedding=self.embeddings,
-                        persist_directory=self.persist_directory
-                    )
-                    print("Vector database created and persisted.")
-                    return vector_db
-                except Exception as e:
-                    print(f"Error creating new vector database: {e}")
-                    raise  # Re-raise the exception if creation fails
-            else:
-                # No chunks provided and DB doesn't exist/is empty - cannot create.
-                print(f"Vector database directory {self.persist_directory} not found or empty, and no chunks provided to create a new one.")
-                return None # Indicate DB doesn't exist and cannot be created yet
+    def get_vector_db(self):
+        """Opens the persisted vector DB (created empty if missing); chunks are upserted incrementally."""
+        logger.info("Loading %s vector database from %s...", self.vector_store_backend, self.persist_directory)
+        try:
+            if self.vector_store_backend == "numpy":
+                from core.vector_store import NumpyVectorStore
+                return NumpyVectorStore(self.persist_directory, self.embeddings,
+                                        quantization=settings.VECTOR_QUANTIZATION,
+                                        rerank_factor=settings.VECTOR_RERANK_FACTOR)
+            from langchain_chroma import Chroma
+            # When loading, ChromaDB will check for dimension compatibility.
+            # If EMBEDDING_MODEL_PATH changed leading to a dimension mismatch, this will fail.
+            return Chroma(persist_directory=self.persist_directory, embedding_function=self.embeddings)
+        except Exception as e:
+            logger.error("Error loading existing vector database: %s. "
+                         "This might be due to a change in the embedding model and a dimension mismatch.", e)
+            return None # Indicate loading failed or DB is not in a usable state
             
     def create_offline_retrieval_qa_prompt(self):
         """创建离线版本的 retrieval-qa-chat 提示模板"""
-        
+        from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, \
+            HumanMessagePromptTemplate, MessagesPlaceholder, PromptTemplate
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+        from pydantic import Field
+
         # 定义系统消息模板
         system_template = PromptTemplate(
             input_variables=['context'],
@@ -201,191 +225,283 @@ class LangchainOllamaAPI(OllamaAPI):
         # 尝试从 LangSmith 获取在线模板
         try:
             if hasattr(self, 'LANGSMITH_API_KEY') and self.LANGSMITH_API_KEY:
+                import langsmith
                 client = langsmith.Client(api_key=self.LANGSMITH_API_KEY)
                 prompt = client.pull_prompt(
                     "langchain-ai/retrieval-qa-chat", 
                     include_model=True
                 )
-                print("成功从 LangSmith 获取提示模板")
+                logger.info("成功从 LangSmith 获取提示模板")
                 return prompt
         except Exception as e:
-            print(f"从 LangSmith 获取提示模板失败: {str(e)}")
+            logger.warning("从 LangSmith 获取提示模板失败: %s", e)
             # 记录错误但不中断流程
         
         # 使用离线模板作为备选
-        print("使用离线提示模板")
+        logger.debug("使用离线提示模板")
         return self.create_offline_retrieval_qa_prompt()
     
     # 6. 创建RAG检索链（使用新方法）
     def create_rag_chain(self,vector_db):
+        from core.hybrid_retriever import HybridRetriever
         ChatPromptTemplate = self.get_prompt_template()
-        # 创建文档组合链
-        combine_docs_chain = create_stuff_documents_chain(self.llm, ChatPromptTemplate)
-        # 创建检索链
-        # Using default similarity search. If this fails, and embedding model is good,
-        # then advanced retrieval or query transformation might be needed.
-        retriever = vector_db.as_retriever(search_kwargs={"k": self.search_k})
-        rag_chain = langchain.chains.create_retrieval_chain(retriever, combine_docs_chain)
-
-        return rag_chain
+        # 创建检索链：启用 BM25 时使用混合检索（RRF 融合），否则为纯向量相似度检索
+        if self.lexical_index is not None:
+            retriever = HybridRetriever(
+                vector_store=vector_db,
+                lexical_index=self.lexical_index,
+                k=self.search_k,
+                fetch_k=self.search_k * 2,
+                rrf_k=settings.RRF_K,
+                lexical_fast_path=settings.LEXICAL_FAST_PATH
+            )
+        else:
+            retriever = vector_db.as_retriever(search_kwargs={"k": self.search_k})
+        # 检索与生成分开保存：process_query 只检索一次，结果同时用于生成和调试输出
+        return RagChain(retriever, ChatPromptTemplate)
     
-    def rebuild_index_and_chain(self):
-        """Loads documents, creates/updates vector DB by adding new content, and rebuilds the RAG chain."""
+    def _migrate_legacy_index(self):
+        """旧版本按 mtime 记录且没有块 ID，无法定位旧块，需要清空集合后重建"""
+        legacy_path = os.path.join(self.persist_directory, "processed_files.json")
+        if self.manifest.loaded or not os.path.exists(legacy_path):
+            return
+        logger.info("检测到旧版索引记录（无块 ID），清空向量集合后重新索引...")
+        self.vector_db.reset_collection()
+        os.remove(legacy_path)
+
+    def _reset_invalidated_index(self):
+        """分块或嵌入参数变化后旧向量全部作废（换嵌入模型时维度也可能不同），清空集合后按清单全部重新嵌入"""
+        if not self.manifest.invalidated:
+            return
+        logger.info("分块或嵌入参数已变化，清空向量集合后重新索引...")
+        self.vector_db.reset_collection()
+        self.manifest.invalidated = False
+
+    def _sync_lexical_index(self):
+        """按清单补齐/清理 BM25 索引（首次启用或上次索引中途退出时），只读取文本，不需要嵌入"""
+        if self.lexical_index is None:
+            return
+        expected = set(self.manifest.all_chunk_ids())
+        indexed = set(self.lexical_index.ids())
+        missing = sorted(expected - indexed)
+        extra = list(indexed - expected)
+        if not missing and not extra:
+            return
+        logger.info("同步 BM25 索引：补充 %d 个块，删除 %d 个块...", len(missing), len(extra))
+        self.lexical_index.delete(extra)
+        for i in range(0, len(missing), 500):
+            docs = self.vector_db.get_by_ids(missing[i:i + 500])
+            self.lexical_index.add([doc.id for doc in docs], [doc.page_content for doc in docs])
+        self.lexical_index.save()
+
+    def rebuild_index_and_chain(self, paths=None, progress_callback=None, cancel_event=None):
+        """按内容哈希增量更新向量数据库（新增/修改/删除的文件），并重建 RAG 链。
+
+        paths 限定只检查文档目录下的这些相对路径，None 表示扫描整个目录。
+        progress_callback 接收进度字典（已解析文件数、已嵌入块数、ETA 等），
+        cancel_event 置位后在下一个文件或批次边界停止。索引期间查询继续使用已提交的数据。
+        """
 
         if self.embeddings is None or self.llm is None:
             return "错误：Embeddings 或 LLM 未初始化。"
 
+        if not self._index_lock.acquire(blocking=False):
+            return "索引任务正在进行中，请稍后再试。"
+        try:
+            with profile("index", f"paths={paths}" if paths is not None else "全部文档"):
+                return self._rebuild_index_and_chain(paths, progress_callback, cancel_event)
+        finally:
+            self._index_lock.release()
+
+    def _rebuild_index_and_chain(self, paths, progress_callback, cancel_event):
         # Ensure documents directory exists
         if not os.path.exists(self.documentes_dir):
             os.makedirs(self.documentes_dir)
-            print(f"创建文档目录: {self.documentes_dir}")
-
-        # Step 1: Load documents
-        print("加载文档...")
-        documents = self.load_documents()
-        if not documents:
-            print(f"在 {self.documentes_dir} 中未找到文档。")
-            # Try to load existing DB even if no new documents are found
-            print("尝试加载现有向量数据库...")
-            # Pass None for chunks as we are just trying to load
-            self.vector_db = self.get_vector_db(None)
-            if self.vector_db:
-                print("没有新文档加载，将使用现有的向量数据库。重新创建 RAG 链...")
-                self.rag_chain = self.create_rag_chain(self.vector_db)
-                return "没有找到新文档，已使用现有数据重新加载 RAG 链。"
-            else:
-                # No documents AND no existing DB
-                return "错误：没有文档可加载，且没有现有的向量数据库。"
-
-        # Step 2: Split text
-        print("分割文本...")
-        chunks = self.split_documents(documents)
-        if not chunks:
-            print("分割后未生成文本块。")
-            # Try loading existing DB if splitting yielded nothing
-            print("尝试加载现有向量数据库...")
-            self.vector_db = self.get_vector_db(None)
-            if self.vector_db:
-                print("警告：新加载的文档分割后未产生任何文本块。使用现有数据库。")
-                self.rag_chain = self.create_rag_chain(self.vector_db) # Ensure chain is recreated
-                return "警告：文档分割后未产生任何文本块。RAG 链已使用现有数据重新加载。"
-            else:
-                # No chunks AND no existing DB
-                return "错误：文档分割后未产生任何文本块，且无现有数据库。"
-
-        # Step 3: Load or Create/Update vector database
-        print("加载或更新向量数据库...")
-        # Try loading first, even if we have chunks (in case we want to add to it)
-        vector_db_loaded = self.get_vector_db(None)
-
-        if vector_db_loaded:
-            print(f"向现有向量数据库添加 {len(chunks)} 个块...")
-            self.vector_db = vector_db_loaded # Use the loaded DB
-            try:
-                # Consider adding only new chunks if implementing duplicate detection later
-                self.vector_db.add_documents(chunks)
-                print("块添加成功。")
-                # Persisting might be needed depending on Chroma version/setup, often automatic.
-                # vector_db.persist() # Uncomment if persistence issues occur
-            except Exception as e:
-                print(f"添加文档到 Chroma 时出错: {e}")
-                # If adding fails, proceed with the DB as it was before adding
-                self.rag_chain = self.create_rag_chain(self.vector_db)
-                return f"错误：向向量数据库添加文档时出错: {e}。RAG链可能使用旧数据。"
-        else:
-            # Database didn't exist or couldn't be loaded, create a new one with the current chunks
-            print(f"创建新的向量数据库并添加 {len(chunks)} 个块...")
-            try:
-                # Call get_vector_db again, this time *with* chunks to trigger creation
-                self.vector_db = self.get_vector_db(chunks)
-                if self.vector_db is None: # Check if creation failed within get_vector_db
-                    raise RuntimeError("get_vector_db failed to create a new database.")
-                print("新的向量数据库已创建并持久化。")
-            except Exception as e:
-                print(f"创建新的向量数据库时出错: {e}")
-                return f"错误：创建向量数据库失败: {e}"
+            logger.info("创建文档目录: %s", self.documentes_dir)
 
+        # Step 1: 打开向量数据库（不存在时创建空集合），已打开时复用同一实例
         if self.vector_db is None:
-            # This should ideally not be reached if error handling above is correct
-            return "错误：未能加载或创建向量数据库。"
+            os.makedirs(self.persist_directory, exist_ok=True)
+            self.vector_db = self.get_vector_db()
+            if self.vector_db is None:
+                return "错误：未能加载或创建向量数据库。"
+            if settings.HYBRID_SEARCH:
+                from core.bm25_index import BM25Index
+                self.lexical_index = BM25Index(os.path.join(self.persist_directory, "bm25"))
+            self._migrate_legacy_index()
+            self._reset_invalidated_index()
+            self._sync_lexical_index()
 
-        # Step 4: Create RAG chain
-        print("创建 RAG 链...")
-        self.rag_chain = self.create_rag_chain(self.vector_db)
-        print("索引和 RAG 链已成功更新。")
-        return "文档处理完成，索引和 RAG 链已更新。"
+        # Step 2: 对比清单，找出变更和删除的文件
+        logger.info("检查文档变更...")
+        changed, deleted = self.get_changed_files(paths)
+        if not changed and not deleted:
+            self.manifest.save()  # 保存仅修改时间变化的文件记录
+            if self.rag_chain is None:
+                logger.info("没有文档变更，将使用现有的向量数据库。创建 RAG 链...")
+                self.rag_chain = self.create_rag_chain(self.vector_db)
+            return "没有找到新文档，已使用现有数据重新加载 RAG 链。"
 
-    # 7. Function to process query using the RAG chain (Modified for Streaming)
-    def process_query(self, query):
-        """Processes a user query using the RAG chain and streams the answer."""
+        # Step 3: 先基于现有数据创建 RAG 链，索引过程中已写入的块即可被检索
         if self.rag_chain is None:
+            self.rag_chain = self.create_rag_chain(self.vector_db)
+
+        # Step 4: 流式加载、分割、嵌入并分批写入变更文件，删除过期块
+        from core.ingest_pipeline import IngestPipeline
+        pipeline = IngestPipeline(self.load_documents, self.split_documents, self.vector_db, self.manifest,
+                                  batch_size=self.ingest_batch_size, queue_size=self.ingest_queue_size,
+                                  progress_callback=progress_callback, cancel_event=cancel_event,
+                                  lexical_index=self.lexical_index)
+        try:
+            stats = pipeline.run(changed, deleted)
+        except Exception as e:
+            logger.exception("更新向量数据库时出错: %s", e)
+            # 出错前已提交的文件记录在清单中，不会重复嵌入
+            return f"错误：向量数据库更新中断: {e}。已写入 {pipeline.stats}。"
+
+        logger.info("%s。", stats)
+        logger.info("嵌入缓存: %s", self.embedding_cache.stats())
+        if stats.cancelled:
+            return f"索引已取消，{stats}。"
+        logger.info("索引和 RAG 链已成功更新。")
+        return f"文档处理完成，{stats}，索引和 RAG 链已更新。"
+
+    def retrieve(self, query):
+        """检索与查询相关的文档块（每个问题只检索一次，重复问题命中 LRU 缓存）"""
+        rag_chain = self.rag_chain
+        start = time.perf_counter()
+        key = self._query_cache_key(query)
+        docs = self.query_cache.get(key)
+        cached = docs is not None
+        if not cached:
+            docs = rag_chain.retriever.invoke(query)
+            self.query_cache.put(key, docs)
+        get_metrics().observe("retrieve", time.perf_counter() - start)
+        if self.retrieval_trace_sink is not None:
+            self.retrieval_trace_sink(query, docs, time.perf_counter() - start, cached)
+        return docs
+
+    def _query_cache_key(self, query):
+        # 索引每次提交后 generation 递增，旧的缓存条目自然失效
+        return normalize_text(query), self.manifest.generation, self.search_k
+
+    def pack_context(self, query, docs):
+        """把检索结果打包进上下文预算（预算扣除问题本身的 token 数）"""
+        if self.context_packer is None:
+            return docs
+        budget = self.context_packer.token_budget - estimate_tokens(query)
+        with get_metrics().span("pack"):
+            packed, stats = self.context_packer.pack(docs, token_budget=budget)
+        logger.debug("上下文打包: %d 块 → %d 段（合并 %d，去重 %d），约 %d → %d tokens，预算 %d",
+                     stats['chunks_in'], stats['chunks_out'], stats['merged'], stats['duplicates'],
+                     stats['tokens_in'], stats['tokens_out'], stats['budget'])
+        return packed
+
+    # 7. Function to process query using the RAG chain (Modified for Streaming)
+    def process_query(self, query, cancel_event=None, raise_errors=False, trace=None):
+        """Processes a user query using the RAG chain and streams the answer.
+
+        cancel_event 置位后在检索、打包之后或下一个 token 处停止，并关闭生成的 HTTP 流。
+        raise_errors 为 True 时出错抛出异常，而不是产出错误提示文本。
+        trace 为字典时写入这次查询的 retrieved_chunk_ids、context_chunk_ids 和各阶段耗时 timings
+        （retrieve/pack/prompt/queue/first_token/generate/total，秒；first_token 从开始生成算起），
+        供批量问答的结果记录使用。
+        """
+        with profile("query", query):
+            yield from self._process_query(query, cancel_event, raise_errors, trace)
+
+    def _process_query(self, query, cancel_event, raise_errors=False, trace=None):
+        cancelled = lambda: cancel_event is not None and cancel_event.is_set()
+        rag_chain = self.rag_chain
+        if rag_chain is None:
             yield "错误：RAG 链未初始化。"
             return
 
-        # --- For Debugging Retrieval ---
-        # Uncomment the block below to see what documents are retrieved by the vector DB
-        if self.vector_db:
-            try:
-                retrieved_docs = self.vector_db.similarity_search(query, k=self.search_k)
-                print(f"\n--- Retrieved Documents for query: '{query}' ---")
-                for i, doc in enumerate(retrieved_docs):
-                    # Attempt to get score if retriever supports it (Chroma's similarity_search_with_score)
-                    # For basic similarity_search, score might not be directly in metadata.
-                    # If using retriever.get_relevant_documents(), score might be present.
-                    score = doc.metadata.get('score', 'N/A') # Placeholder, actual score retrieval might differ
-                    if hasattr(doc, 'score'): # Check if score attribute exists directly
-                        score = doc.score
-                    
-                    print(f"Doc {i+1} (Score: {score}):")
-                    print(f"Content: {doc.page_content[:500]}...") # Print first 500 chars
-                    print(f"Metadata: {doc.metadata}")
-                print("--- End Retrieved Documents ---\n")
-            except Exception as e:
-                print(f"Error during debug similarity_search: {e}")
-        else:
-            print("Vector DB not initialized, skipping debug retrieval.")
-        # --- End Debugging Retrieval ---
-
+        timings = {}
+        if trace is not None:
+            trace.update(retrieved_chunk_ids=[], context_chunk_ids=[], timings=timings)
+        start = time.perf_counter()
         try:
-            print(f"开始处理流式查询: {query}")
+            logger.info("开始处理流式查询: %s", query)
+            docs = self.retrieve(query)
+            timings["retrieve"] = time.perf_counter() - start
+            if trace is not None:
+                trace["retrieved_chunk_ids"] = [doc.id for doc in docs]
+            if cancelled():
+                logger.info("检索完成时查询已取消，不再生成回答")
+                return
+            stage = time.perf_counter()
+            docs = self.pack_context(query, docs)
+            timings["pack"] = time.perf_counter() - stage
+            if trace is not None:
+                trace["context_chunk_ids"] = [chunk_id for doc in docs
+                                              for chunk_id in doc.metadata.get("chunk_ids", [doc.id])]
 
-            # Directly stream from the RAG chain runnable
-            # The input format for create_retrieval_chain is typically {"input": query}
-            # The output chunks often contain 'answer' and 'context' keys
-            response_stream = self.rag_chain.stream({"input": query})
+            # 直接用检索结果填充提示模板，避免检索链再检索一次。LLM 的流直接交给调用方：
+            # 组合链（prompt | llm | parser）中的解析器在被关闭时会读完整个输入流，无法中途停止生成
+            stage = time.perf_counter()
+            with get_metrics().span("prompt"):
+                prompt_value = rag_chain.prompt.invoke({"input": query, "context": format_docs(docs)})
+            timings["prompt"] = time.perf_counter() - stage
 
             full_answer = ""
-            # Yield chunks as they arrive. Gradio Textbox updates incrementally.
-            print("开始流式生成回答...")
-            for chunk in response_stream:
-                # Check if the 'answer' key exists in the chunk and append it
-                answer_part = chunk.get("answer", "")
-                if answer_part:
-                    full_answer += answer_part
-                    # Debugging output
-                    # print(f"Raw answer_part from LLM: '{answer_part}'")
-                    # print(f"Yielding to Gradio: '{full_answer}'")
-                    yield full_answer # Yield the progressively built answer
+            first_token_at = None
+            stats_handler = generation_info_handler()
+            # Yield chunks as they arrive.
+            logger.debug("开始流式生成回答...")
+            with get_scheduler().slot("llm", cancel_event=cancel_event) as ticket:
+                timings["queue"] = ticket.wait
+                stage = time.perf_counter()
+                response_stream = self.llm.stream(prompt_value, config={"callbacks": [stats_handler]})
+                try:
+                    for answer_part in response_stream:
+                        if cancelled():
+                            logger.info("查询已取消，停止生成")
+                            return
+                        if answer_part:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()  # 首个 token 延迟包含检索和打包
+                                timings["first_token"] = first_token_at - stage
+                            full_answer += answer_part
+                            yield full_answer # Yield the progressively built answer
+                finally:
+                    response_stream.close()  # 关闭 LLM 流及其下的 HTTP 流，Ollama 随即停止生成
+                timings["generate"] = time.perf_counter() - stage
 
             if not full_answer:
                 yield "抱歉，未能生成回答。" # Handle cases where stream completes without answer
+            else:
+                self._record_rag_turn(query, docs, full_answer, start, first_token_at, ticket.wait,
+                                      stats_handler.info)
 
-            print(f"流式处理完成。最终回答: {full_answer}")
+            logger.debug("流式处理完成。最终回答: %s", full_answer)
 
+        except Cancelled:
+            logger.info("排队等待生成时查询已取消")
         except Exception as e:
-            print(f"处理查询时发生错误: {e}")
-            import traceback
-            traceback.print_exc() # Print stack trace for debugging
+            logger.exception("处理查询时发生错误: %s", e)  # 带堆栈，便于调试
+            if raise_errors:
+                raise
             yield f"处理查询时发生错误: {e}"
+        finally:
+            timings["total"] = time.perf_counter() - start
 
-    def stream_rag_response(self, prompt):
+    def _record_rag_turn(self, query, docs, answer, start, first_token_at, queue_wait, info=None):
+        """info 为 generation_info_handler 收集的 Ollama 统计；没有时（例如回调未触发）使用估计值"""
+        info = info or {}
+        estimated_prompt = PROMPT_OVERHEAD_TOKENS + estimate_tokens(query) + \
+            sum(estimate_tokens(doc.page_content) for doc in docs)
+        eval_duration = (info.get("eval_duration") or 0) / 1e9 or time.perf_counter() - first_token_at
+        self._set_turn_stats("rag", info.get("prompt_eval_count"), estimated_prompt,
+                             info.get("eval_count") or estimate_tokens(answer), eval_duration,
+                             start, first_token_at, queue_wait=queue_wait,
+                             prompt_eval_duration=(info.get("prompt_eval_duration") or 0) / 1e9)
 
-        for stream_chunk in self.process_query(prompt): # process_query yields full accumulated answer
-            # print(f"Stream chunk received: {stream_chunk}")  # Debugging output
-            yield stream_chunk
+    def stream_rag_response(self, prompt, cancel_event=None, raise_errors=False):
+        # process_query yields full accumulated answer；yield from 使关闭本生成器时一并关闭 process_query
+        yield from self.process_query(prompt, cancel_event, raise_errors)
     
     
     def change_model(self, model_name):
-        self.model = model_name
-        self.llm = OllamaLLM(model=self.model)
-        self.reset_context()
\ No newline at end of file
+        super().change_model(model_name)  # 清空对话记忆并预加载新模型
+        self._llm = None  # 下次使用时按新模型创建（RAG 链只包含检索器和提示模板，不需要重建）
\ No newline at end of file
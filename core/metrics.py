@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 记录的阶段（秒）。span 可以嵌套：upsert 包含其中的 embed，retrieve 包含查询嵌入
+STAGE_NAMES = {
+    "load": "解析文件（子进程中的耗时）",
+    "split": "分块（每个文件）",
+    "embed": "文档嵌入请求（每批未命中缓存的块）",
+    "upsert": "写入向量库和 BM25 索引（每批，含嵌入）",
+    "retrieve": "检索（含查询嵌入，命中缓存时接近 0）",
+    "pack": "上下文打包",
+    "prompt": "构建提示",
+    "queue": "等待调度器的生成位置",
+    "prefill": "Ollama 处理提示（prompt_eval_duration）",
+    "decode": "Ollama 生成回答（eval_duration）",
+    "ttft": "从提交问题到首个 token",
+    "render": "界面刷新一帧部分回答（追加新增的文本）",
+}
+
+# 状态栏摘要显示的阶段和标签
+STATUS_STAGES = (("retrieve", "检索"), ("ttft", "首 token"), ("decode", "生成"), ("render", "渲染"))
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class RollingHistogram:
+    """最近 window 个观测值的分位数，以及启动以来的累计次数和总和"""
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def summary(self):
+        values = sorted(self.values)
+        result = {"count": self.count, "sum": self.sum}
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+        result["max"] = values[-1] if values else 0.0
+        return result
+
+
+class Metrics:
+    """各阶段耗时的滚动直方图：span() 计时一段代码，observe() 记录已知的耗时（如 Ollama 返回的统计）
+
+    snapshot() 返回各阶段的次数、总和与分位数；write() 按文件扩展名导出为 Prometheus 文本（.prom）或 JSON。
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        if seconds is None:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = RollingHistogram(self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(stage, elapsed)
+            logger.debug("%s 耗时 %.1f ms", stage, elapsed * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: histogram.summary() for stage, histogram in self._histograms.items()}
+
+    def status_summary(self):
+        """状态栏的一行摘要：主要阶段最近的中位数"""
+        snapshot = self.snapshot()
+        parts = []
+        for stage, label in STATUS_STAGES:
+            if stage in snapshot:
+                p50 = snapshot[stage]["p50"]
+                parts.append(f"{label} {p50 * 1000:.0f}ms" if p50 < 1 else f"{label} {p50:.1f}s")
+        return " · ".join(parts)
+
+    def to_json(self):
+        from core.scheduler import get_scheduler
+        stages = {stage: dict(summary, description=STAGE_NAMES.get(stage, ""))
+                  for stage, summary in self.snapshot().items()}
+        return json.dumps({"timestamp": time.time(), "window": self.window, "stages": stages,
+                           "scheduler": get_scheduler().stats()}, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        from core.scheduler import get_scheduler
+        lines = [f"# HELP local_llm_stage_seconds 各阶段耗时（分位数为最近 {self.window} 次）",
+                 "# TYPE local_llm_stage_seconds summary"]
+        for stage, summary in sorted(self.snapshot().items()):
+            for q in QUANTILES:
+                lines.append(f'local_llm_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{summary[f"p{round(q * 100)}"]:.6f}')
+            lines.append(f'local_llm_stage_seconds_sum{{stage="{stage}"}} {summary["sum"]:.6f}')
+            lines.append(f'local_llm_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        gauges = (("active", "正在执行的请求数"), ("queued", "排队的请求数"), ("capacity", "并发上限"))
+        scheduler_stats = get_scheduler().stats()
+        for key, help_text in gauges:
+            lines.append(f"# HELP local_llm_scheduler_{key} {help_text}")
+            lines.append(f"# TYPE local_llm_scheduler_{key} gauge")
+            for resource, stats in sorted(scheduler_stats.items()):
+                lines.append(f'local_llm_scheduler_{key}{{resource="{resource}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """写入指标文件（先写临时文件再替换，读取方不会读到写了一半的内容）"""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+def configure_logging(level=None):
+    """由入口脚本调用：按 settings.LOG_LEVEL 配置日志格式和级别"""
+    logging.basicConfig(level=(level or settings.LOG_LEVEL).upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if logging.getLogger().level > logging.DEBUG:
+        logging.getLogger("httpx").setLevel(logging.WARNING)  # 每个 HTTP 请求一行，只在 DEBUG 时输出
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+_exporter = None
+
+
+def get_metrics():
+    """进程内共享的指标"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(window=settings.METRICS_WINDOW)
+        return _metrics
+
+
+def start_exporter(path=None, interval=None):
+    """在后台线程中每隔 interval 秒把指标写入 path（默认 settings.METRICS_FILE，未设置时不导出）"""
+    global _exporter
+    path = path or settings.METRICS_FILE
+    interval = interval or settings.METRICS_EXPORT_INTERVAL
+    if not path or _exporter is not None:
+        return
+
+    def export():
+        while True:
+            time.sleep(interval)
+            try:
+                get_metrics().write(path)
+            except OSError as e:
+                logger.warning("写入指标文件 %s 失败: %s", path, e)
+
+    _exporter = threading.Thread(target=export, daemon=True)
+    _exporter.start()
+    logger.info("每 %s 秒导出指标到 %s", interval, path)
@@ -1,67 +1,302 @@
-import requests
-import json
-import ollama
-from ollama import chat
-from ollama import Client
+import logging
+import threading
+import time
+
+from config import settings
+from core.conversation_memory import ConversationMemory
+from core.metrics import get_metrics
+from core.scheduler import BACKGROUND, Cancelled, get_scheduler
+from core.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# ollama（含 httpx/pydantic）导入较慢，在第一次请求时才导入（见 get_client）
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_options():
+    """同步/异步 ollama 客户端共用的 httpx 参数"""
+    import httpx
+    return dict(
+        headers={'x-some-header': 'some-value'},
+        limits=httpx.Limits(max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                            max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS)
+    )
+
+
+def get_client(host):
+    """返回该 host 共享的 ollama Client
+
+    httpx 客户端自带连接池且线程安全，所有请求复用同一组长连接，不再每次请求都重新建立连接。
+    """
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            from ollama import Client
+            client = _clients[host] = Client(host=host, **client_options())
+        return client
+
+# 后台摘要被移出窗口的对话轮次时使用的提示
+SUMMARY_PROMPT = """请把下面的对话合并进已有摘要，保留用户的问题、结论、关键事实和约定，不超过 {limit} 字。
+
+已有摘要：
+{summary}
+
+新的对话：
+{transcript}
+
+合并后的摘要："""
+
 
 class OllamaAPI:
-    BASE_URL = "http://localhost:11434"
+    BASE_URL = settings.OLLAMA_HOST
     
     def __init__(self, model="gemma3n"):
         self.model = model
-        self.generate_context = []  # 对话上下文
-        self.chat_context = []  # 对话上下文
-        
+        # 生成/对话模式的上下文：按 token 计数的滑动窗口，更早的轮次在后台摘要
+        history_tokens = settings.NUM_CTX - settings.MEMORY_ANSWER_RESERVE
+        self.generate_memory = ConversationMemory(history_tokens, summarize_fn=self._summarize)
+        self.chat_memory = ConversationMemory(history_tokens, summarize_fn=self._summarize)
+        self.last_turn_stats = None  # 最近一轮的提示长度、延迟、生成速度
+        self._warming = set()  # 正在预加载的模型
+        self._warming_lock = threading.Lock()
+
+    def _client(self):
+        return get_client(self.BASE_URL)
+
+    def warm_up(self, model=None):
+        """在后台线程中预加载模型，使第一个问题不必等待模型加载"""
+        model = model or self.model
+        if not settings.OLLAMA_WARMUP:
+            return
+        with self._warming_lock:
+            if model in self._warming:
+                return
+            self._warming.add(model)
+        threading.Thread(target=self._warm_up, args=(model,), daemon=True).start()
+
+    def _warm_up(self, model):
+        start = time.perf_counter()
+        try:
+            # 空提示的 generate 只加载模型，不生成内容
+            self._client().generate(model=model, prompt="", keep_alive=settings.OLLAMA_KEEP_ALIVE)
+            logger.info("模型 %s 已预加载（%.1fs）", model, time.perf_counter() - start)
+        except Exception as e:
+            logger.warning("预加载模型 %s 失败: %s", model, e)
+        finally:
+            with self._warming_lock:
+                self._warming.discard(model)
+
+    def _options(self, **overrides):
+        return dict({"temperature": 0.7, "num_ctx": settings.NUM_CTX}, **overrides)
+
+    def _record_turn(self, mode, memory, response, estimated_tokens, start, first_token_at=None, queue_wait=0.0):
+        """记录一轮请求的统计（prompt_eval_count/eval_count/eval_duration 等来自 Ollama）"""
+        self._set_turn_stats(mode, response.prompt_eval_count, estimated_tokens, response.eval_count or 0,
+                             (response.eval_duration or 0) / 1e9, start, first_token_at, memory, queue_wait,
+                             prompt_eval_duration=(response.prompt_eval_duration or 0) / 1e9)
+
+    def _set_turn_stats(self, mode, prompt_tokens, estimated_tokens, completion_tokens, eval_duration,
+                        start, first_token_at=None, memory=None, queue_wait=0.0, prompt_eval_duration=None):
+        """记录并输出提示长度、总耗时（含排队）、排队时间、首个 token 延迟（仅流式）和生成速度
+
+        排队、首个 token、预填充（prompt_eval_duration）和生成（eval_duration）的耗时同时计入指标。
+        """
+        latency = time.perf_counter() - start
+        history = memory.stats() if memory is not None else {}
+        ttft = first_token_at - start if first_token_at is not None else None
+        self.last_turn_stats = dict(
+            mode=mode,
+            prompt_tokens=prompt_tokens,
+            estimated_prompt_tokens=estimated_tokens,
+            completion_tokens=completion_tokens,
+            latency=latency,
+            queue_wait=queue_wait,
+            time_to_first_token=ttft,
+            tokens_per_second=completion_tokens / eval_duration if eval_duration else None,
+            **history
+        )
+        metrics = get_metrics()
+        metrics.observe("queue", queue_wait)
+        metrics.observe("ttft", ttft)
+        metrics.observe("prefill", prompt_eval_duration or None)
+        metrics.observe("decode", eval_duration or None)
+        logger.info("[%s] 提示 %s tokens（估计 %s），生成 %s tokens，耗时 %.2fs（排队 %.2fs）%s%s",
+                    mode, prompt_tokens, estimated_tokens, completion_tokens, latency, queue_wait,
+                    f"，首个 token {ttft:.2f}s" if ttft is not None else "",
+                    f"，历史 {history}" if history else "")
+
+    @staticmethod
+    def _consume_stream(chunks, text_of, cancel_event=None):
+        """逐块产出累积的回答文本；返回 (最后一块, 首个 token 的时间, 完整回答)
+
+        最后一块（done=True）带有 prompt_eval_count/eval_count 等统计。cancel_event 置位或
+        调用方关闭生成器时关闭 HTTP 流，Ollama 检测到连接断开后停止生成；此时最后一块不是 done。
+        """
+        answer, first_token_at, last = "", None, None
+        try:
+            for chunk in chunks:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                last = chunk
+                text = text_of(chunk)
+                if text:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    answer += text
+                    yield answer
+        finally:
+            chunks.close()
+        return last, first_token_at, answer
+
     def generate_response(self, prompt):
- 
+        system, full_prompt = self.generate_memory.prompt(prompt)
+        estimated_tokens = self.generate_memory.token_count() + estimate_tokens(prompt)
+        start = time.perf_counter()
         try:
-            client = Client(
-            host=self.BASE_URL,
-            headers={'x-some-header': 'some-value'}
-            )
-            response = client.generate(model=self.model,
-                                       prompt=prompt,
-                                       context=self.generate_context,
-                                       stream=False,
-                                       options={"temperature": 0.7, "num_ctx": 2048})
+            with get_scheduler().slot("llm") as ticket:
+                response = self._client().generate(model=self.model,
+                                                   prompt=full_prompt,
+                                                   system=system,
+                                                   stream=False,
+                                                   options=self._options(),
+                                                   keep_alive=settings.OLLAMA_KEEP_ALIVE)
 
-            self.generate_context = response.context  # 更新上下文
+            # 更新上下文
+            self.generate_memory.add("user", prompt)
+            self.generate_memory.add("assistant", response.response)
+            self._record_turn("generate", self.generate_memory, response, estimated_tokens, start,
+                              queue_wait=ticket.wait)
             return response.response
             
         except Exception as e:
             return f"错误: {str(e)}"
     
+    def stream_generate_response(self, prompt, cancel_event=None, raise_errors=False):
+        """生成模式的流式版本：产出逐步累积的回答（与 stream_rag_response 一致）
+
+        cancel_event 置位后停止生成，这一轮不计入对话记忆。
+        出错时产出错误提示文本；raise_errors 为 True 时改为抛出异常（HTTP 服务据此返回错误状态码）。
+        """
+        system, full_prompt = self.generate_memory.prompt(prompt)
+        estimated_tokens = self.generate_memory.token_count() + estimate_tokens(prompt)
+        start = time.perf_counter()
+        try:
+            # 整个流式回答期间占用一个 LLM 位置
+            with get_scheduler().slot("llm", cancel_event=cancel_event) as ticket:
+                chunks = self._client().generate(model=self.model,
+                                                 prompt=full_prompt,
+                                                 system=system,
+                                                 stream=True,
+                                                 options=self._options(),
+                                                 keep_alive=settings.OLLAMA_KEEP_ALIVE)
+                last, first_token_at, answer = yield from self._consume_stream(chunks, lambda chunk: chunk.response,
+                                                                               cancel_event)
+        except Cancelled:
+            logger.info("[generate] 排队时已取消")
+            return
+        except Exception as e:
+            if raise_errors:
+                raise
+            yield f"错误: {str(e)}"
+            return
+        if last is None or not last.done:
+            logger.info("[generate] 已取消")
+            return
+
+        # 回答完整后才更新上下文
+        self.generate_memory.add("user", prompt)
+        self.generate_memory.add("assistant", answer)
+        self._record_turn("generate", self.generate_memory, last, estimated_tokens, start, first_token_at,
+                          ticket.wait)
+
     def chat_response(self, prompt):
-        self.chat_context.append({"role": "user", "content": prompt})
-        print(self.chat_context)  # 调试输出
+        self.chat_memory.add("user", prompt)
+        messages = self.chat_memory.messages()
+        estimated_tokens = self.chat_memory.token_count()
+        start = time.perf_counter()
         try:
-            client = Client(
-            host=self.BASE_URL,
-            headers={'x-some-header': 'some-value'}
-            )
-            response = client.chat(model=self.model,
-                                       messages=self.chat_context,
-                                       stream=False,
-                                       options={"temperature": 0.7, "num_ctx": 2048})
+            with get_scheduler().slot("llm") as ticket:
+                response = self._client().chat(model=self.model,
+                                               messages=messages,
+                                               stream=False,
+                                               options=self._options(),
+                                               keep_alive=settings.OLLAMA_KEEP_ALIVE)
 
-            print(f"Response: {response}")  # 调试输出
-            print(f"Response messages: {response.message}")  # 调试输出
-        
             # 更新上下文
-            self.chat_context.append({"role": response.message.role, "content": response.message.content})
-            print(self.chat_context)  # 调试输出
+            self.chat_memory.add(response.message.role, response.message.content)
+            self._record_turn("chat", self.chat_memory, response, estimated_tokens, start,
+                              queue_wait=ticket.wait)
             return response.message.content
             
         except Exception as e:
+            self.chat_memory.discard_last()  # 没有得到回答的问题不留在历史中
             return f"错误: {str(e)}"
+
+    def stream_chat_response(self, prompt, cancel_event=None, raise_errors=False):
+        """对话模式的流式版本：产出逐步累积的回答，cancel_event 置位后停止生成
+
+        raise_errors 与 stream_generate_response 相同。
+        """
+        self.chat_memory.add("user", prompt)
+        messages = self.chat_memory.messages()
+        estimated_tokens = self.chat_memory.token_count()
+        start = time.perf_counter()
+        try:
+            with get_scheduler().slot("llm", cancel_event=cancel_event) as ticket:
+                chunks = self._client().chat(model=self.model,
+                                             messages=messages,
+                                             stream=True,
+                                             options=self._options(),
+                                             keep_alive=settings.OLLAMA_KEEP_ALIVE)
+                last, first_token_at, answer = yield from self._consume_stream(chunks,
+                                                                               lambda chunk: chunk.message.content,
+                                                                               cancel_event)
+        except Cancelled:
+            self.chat_memory.discard_last()
+            logger.info("[chat] 排队时已取消")
+            return
+        except Exception as e:
+            self.chat_memory.discard_last()
+            if raise_errors:
+                raise
+            yield f"错误: {str(e)}"
+            return
+        except GeneratorExit:
+            self.chat_memory.discard_last()  # 中途停止读取：不完整的一轮不留在历史中
+            raise
+        if last is None or not last.done:
+            self.chat_memory.discard_last()
+            logger.info("[chat] 已取消")
+            return
+
+        self.chat_memory.add("assistant", answer)
+        self._record_turn("chat", self.chat_memory, last, estimated_tokens, start, first_token_at, ticket.wait)
+
+    def _summarize(self, summary, turns):
+        """把移出窗口的对话合并进摘要（在对话记忆的后台线程中调用）"""
+        transcript = "\n".join(f"{'用户' if role == 'user' else '助手'}：{content}" for role, content in turns)
+        with get_scheduler().slot("llm", priority=BACKGROUND):
+            response = self._client().generate(
+                model=self.model,
+                prompt=SUMMARY_PROMPT.format(limit=settings.MEMORY_SUMMARY_CHARS, summary=summary or "（无）",
+                                             transcript=transcript),
+                stream=False,
+                options=self._options(temperature=0.2, num_predict=settings.MEMORY_SUMMARY_CHARS * 2),
+                keep_alive=settings.OLLAMA_KEEP_ALIVE
+            )
+        return response.response.strip()
         
     def reset_context(self):
-        self.generate_context = []
-        self.chat_context = []
+        self.generate_memory.clear()
+        self.chat_memory.clear()
     
     def get_model_list(self):
-        return ollama.list()
+        return self._client().list()
     
     def change_model(self, model_name):
         self.model = model_name
-        self.reset_context()
\ No newline at end of file
+        self.reset_context()
+        self.warm_up()
\ No newline at end of file
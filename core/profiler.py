@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 可以单独开启分析的运行：query（一次检索问答，process_query / astream_rag_response）和
+# index（一次 rebuild_index_and_chain）
+PROFILE_TARGETS = ("query", "index")
+
+_enabled = set()
+_session_lock = threading.Lock()  # 同一时间只分析一次运行（tracemalloc 和线程钩子是全进程的）
+
+
+def _parse_targets(value):
+    value = (value or "").strip().lower()
+    if value in ("", "0", "off"):
+        return set()
+    if value in ("1", "all", "on"):
+        return set(PROFILE_TARGETS)
+    return {target.strip() for target in value.split(",") if target.strip() in PROFILE_TARGETS}
+
+
+_enabled.update(_parse_targets(settings.PROFILE))
+
+
+def profiling_enabled(target):
+    return target in _enabled
+
+
+def set_profiling(target, enabled):
+    """开启/关闭某类运行的分析（界面开关调用）"""
+    if enabled:
+        _enabled.add(target)
+    else:
+        _enabled.discard(target)
+
+
+class _Session:
+    """一次分析：调用线程和运行期间新启动的线程各用一个 cProfile，结束时合并；tracemalloc 记录内存"""
+
+    def __init__(self, target, label):
+        self.target = target
+        self.label = label
+        self.profilers = []
+        self._profilers_lock = threading.Lock()
+
+    def _new_profiler(self):
+        import cProfile
+        profiler = cProfile.Profile()
+        with self._profilers_lock:
+            self.profilers.append(profiler)
+        return profiler
+
+    def _thread_hook(self, *args):
+        # threading.setprofile 的函数在新线程的第一个事件时调用：换成该线程自己的 cProfile。
+        # 报告只包含截至运行结束的调用；运行期间启动的长驻线程（如后台摘要）之后仍带着这个 cProfile
+        import sys
+        sys.setprofile(None)
+        try:
+            self._new_profiler().enable()
+        except ValueError:  # Python 3.12+ 的 cProfile 基于 sys.monitoring，全进程只能有一个
+            pass
+
+    def start(self):
+        import tracemalloc
+        now = time.time()
+        self.started_at = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{now % 1:.3f}"[1:]  # 毫秒避免重名
+        self.trace_memory = not tracemalloc.is_tracing()
+        if self.trace_memory:
+            tracemalloc.start()
+        threading.setprofile(self._thread_hook)
+        self._start_time = time.perf_counter()
+        self.main_profiler = self._new_profiler()
+        self.main_profiler.enable()
+
+    def stop(self):
+        """停止分析并写入报告，返回报告路径"""
+        import pstats
+        import tracemalloc
+        self.main_profiler.disable()
+        threading.setprofile(None)
+        elapsed = time.perf_counter() - self._start_time
+        snapshot = peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ))
+            tracemalloc.stop()
+
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        base = os.path.join(settings.PROFILE_DIR, f"{self.started_at}-{self.target}")
+        with self._profilers_lock:
+            profilers = list(self.profilers)
+
+        report_path = f"{base}.txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(f"分析对象: {self.target}（{self.label}）\n")
+            f.write(f"耗时: {elapsed:.3f}s，分析的线程数: {len(profilers)}\n\n")
+            stats = pstats.Stats(profilers[0], stream=f)
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(f"{base}.prof")  # 可用 snakeviz 等工具查看
+            f.write(f"===== 累计耗时最多的函数（前 {settings.PROFILE_TOP_N}）=====\n")
+            stats.sort_stats("cumulative").print_stats(settings.PROFILE_TOP_N)
+            f.write(f"===== 自身耗时最多的函数（前 {settings.PROFILE_TOP_N}）=====\n")
+            stats.sort_stats("tottime").print_stats(settings.PROFILE_TOP_N)
+            if snapshot is not None:
+                f.write(f"===== 内存 =====\n峰值 {peak / 1e6:.1f} MB（运行期间新分配的 Python 对象）\n")
+                f.write(f"结束时仍占用内存最多的分配位置（前 {settings.PROFILE_TOP_N}）:\n")
+                for stat in snapshot.statistics("lineno")[:settings.PROFILE_TOP_N]:
+                    f.write(f"  {stat}\n")
+            else:
+                f.write("===== 内存 =====\ntracemalloc 已由其他代码启动，未记录内存\n")
+        logger.info("性能分析报告: %s（%.2fs）", report_path, elapsed)
+        return report_path
+
+
+@contextmanager
+def profile(target, label=""):
+    """开启了 target 的分析时，用 cProfile 和 tracemalloc 包住这段代码并写出报告；否则几乎没有开销
+
+    可以包住生成器的主体：分析覆盖从第一次取值到生成器结束（或被关闭）的整个过程。
+    已有分析在进行时这次运行不做分析。
+    """
+    if target not in _enabled or not _session_lock.acquire(blocking=False):
+        yield
+        return
+    session = _Session(target, label)
+    try:
+        session.start()
+        try:
+            yield
+        finally:
+            session.stop()
+    finally:
+        _session_lock.release()
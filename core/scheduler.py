@@ -0,0 +1,166 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import asynccontextmanager, contextmanager
+
+from config import settings
+
+# 优先级：数值越小越先获得空闲位置。交互请求（用户的问题、查询嵌入）优先于后台工作（索引嵌入、对话摘要）
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# 获得的位置：资源名、优先级、排队等待的秒数
+Ticket = namedtuple("Ticket", ["resource", "priority", "wait"])
+
+
+class Cancelled(Exception):
+    """请求在排队等待时被取消"""
+
+
+class _Pool:
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.active = 0
+        self.waiters = []  # 堆 [(优先级, 序号, 等待者)]，同优先级先到先得
+        self.acquired = 0
+        self.wait_times = deque(maxlen=window)
+
+
+class _Waiter:
+    def __init__(self, wake):
+        self.wake = wake  # 获得位置时调用（在持有调度器锁时调用，不能阻塞）
+        self.granted = False
+
+
+class RequestScheduler:
+    """按资源（LLM 生成、嵌入）分别限制同时发往 Ollama 的请求数，排队的请求按优先级获得位置
+
+    同步代码使用 slot()，asyncio 代码使用 aslot()，两者共用同一组计数。位置释放时直接交给
+    队列中优先级最高的等待者，后来的请求不能插队。stats() 返回各资源的并发数、队列长度和等待时间。
+    """
+
+    def __init__(self, limits, window=200):
+        self._lock = threading.Lock()
+        self._pools = {name: _Pool(capacity, window) for name, capacity in limits.items()}
+        self._seq = itertools.count()
+
+    def _enqueue(self, pool, priority, waiter):
+        """有空闲位置且没有人排队时立即获得，否则加入队列；返回是否立即获得"""
+        with self._lock:
+            if pool.active < pool.capacity and not pool.waiters:
+                pool.active += 1
+                waiter.granted = True
+                return True
+            heapq.heappush(pool.waiters, (priority, next(self._seq), waiter))
+            return False
+
+    def _withdraw(self, pool, waiter):
+        """放弃排队；返回 False 表示在此之前已经获得了位置（需要由调用方释放）"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            pool.waiters = [entry for entry in pool.waiters if entry[2] is not waiter]
+            heapq.heapify(pool.waiters)
+            return True
+
+    def _granted(self, resource, pool, priority, start):
+        wait = time.perf_counter() - start
+        with self._lock:
+            pool.acquired += 1
+            pool.wait_times.append(wait)
+        return Ticket(resource, priority, wait)
+
+    def release(self, resource):
+        pool = self._pools[resource]
+        with self._lock:
+            if pool.waiters:
+                _, _, waiter = heapq.heappop(pool.waiters)
+                waiter.granted = True  # 位置直接交给下一个等待者，active 不变
+                waiter.wake()
+            else:
+                pool.active -= 1
+
+    def acquire(self, resource, priority=INTERACTIVE, cancel_event=None):
+        """阻塞直到获得位置，返回 Ticket；cancel_event 在排队时置位则抛出 Cancelled"""
+        pool = self._pools[resource]
+        start = time.perf_counter()
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if not self._enqueue(pool, priority, waiter):
+            while not event.wait(None if cancel_event is None else 0.1):
+                if cancel_event.is_set() and self._withdraw(pool, waiter):
+                    raise Cancelled()
+        return self._granted(resource, pool, priority, start)
+
+    async def aacquire(self, resource, priority=INTERACTIVE):
+        """acquire 的异步版本：在事件循环中等待，任务被取消时退出队列"""
+        import asyncio
+        pool = self._pools[resource]
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def set_result():
+            if not future.done():
+                future.set_result(None)
+
+        waiter = _Waiter(lambda: loop.call_soon_threadsafe(set_result))
+        if not self._enqueue(pool, priority, waiter):
+            try:
+                await future
+            except asyncio.CancelledError:
+                if not self._withdraw(pool, waiter):
+                    self.release(resource)
+                raise
+        return self._granted(resource, pool, priority, start)
+
+    @contextmanager
+    def slot(self, resource, priority=INTERACTIVE, cancel_event=None):
+        ticket = self.acquire(resource, priority, cancel_event)
+        try:
+            yield ticket
+        finally:
+            self.release(resource)
+
+    @asynccontextmanager
+    async def aslot(self, resource, priority=INTERACTIVE):
+        ticket = await self.aacquire(resource, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(resource)
+
+    def stats(self):
+        """各资源的并发上限、正在执行数、排队数（按优先级）、累计请求数和最近的等待时间"""
+        with self._lock:
+            result = {}
+            for name, pool in self._pools.items():
+                waits = sorted(pool.wait_times)
+                result[name] = {
+                    "capacity": pool.capacity,
+                    "active": pool.active,
+                    "queued": len(pool.waiters),
+                    "queued_interactive": sum(1 for priority, _, _ in pool.waiters if priority <= INTERACTIVE),
+                    "acquired": pool.acquired,
+                    "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+                    "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    "wait_max": waits[-1] if waits else 0.0,
+                }
+            return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """进程内共享的调度器（所有客户端实例、界面和索引线程共用同一组并发限制）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler({"llm": settings.SCHEDULER_LLM_CONCURRENCY,
+                                           "embedding": settings.SCHEDULER_EMBEDDING_CONCURRENCY},
+                                          window=settings.SCHEDULER_STATS_WINDOW)
+        return _scheduler
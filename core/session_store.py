@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """按会话 ID 保存各客户端的状态（如各自的对话记忆）
+
+    最多保存 max_sessions 个会话，超出时淘汰最久未使用的；空闲超过 ttl 秒的会话在下次访问时丢弃。
+    factory() 创建新会话。线程安全。
+    """
+
+    def __init__(self, factory, max_sessions=256, ttl=3600):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # 会话 ID → (会话, 最近使用时间)，按最近使用排序
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """返回会话，不存在（或已过期）时创建"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.pop(session_id, None)
+            session = entry[0] if entry is not None else self.factory()
+            self._sessions[session_id] = (session, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def drop(self, session_id):
+        """删除会话，返回会话是否存在"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self, now):
+        while self._sessions:
+            _, last_used = next(iter(self._sessions.values()))
+            if now - last_used <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,134 @@
+import re
+from bisect import bisect_left, bisect_right
+
+# 边界级别：数值越小优先级越高，分块时优先在高级别边界处切分
+ARTICLE, PARAGRAPH, LINE, SENTENCE, CLAUSE, SPACE = range(6)
+
+# 结构性边界（法条标题、段落、换行）数量少，一次正则扫描全文即可全部找出；
+# 边界位置取匹配结束处（分隔符留在前一个块末尾）。
+# 公共前缀 \n 提到分组之外，正则引擎可以直接跳到下一个换行符
+_STRUCTURE_RE = re.compile(
+    r"\n(?:"
+    # 紧跟 第X编/章/节/条 标题：边界位于标题开头
+    r"(?P<article>(?:[ \t　]*\n)*[ \t　]*(?=第[零〇一二三四五六七八九十百千万两\d]+[编章节条]))"
+    r"|(?P<paragraph>[ \t　]*\n\s*)"
+    r"|(?P<line>))"
+)
+_STRUCTURE_LEVELS = {"article": ARTICLE, "paragraph": PARAGRAPH, "line": LINE}
+
+# 句子/分句/空白边界非常密集，只在需要时于当前窗口内用 str.rfind/find 查找，
+# 边界位于分隔符第一个字符之后；英文句号要求后面是空白，避免切开小数和缩写
+_INLINE_SEPARATORS = {
+    SENTENCE: ("。", "！", "？", "；", "!", "?", ";", ". ", ".\n"),
+    CLAUSE: ("，", "、", ",", "：", ":"),
+    SPACE: (" ", "\t", "　"),
+}
+
+
+class ChineseTextSplitter:
+    """识别中文标点和 第X条 等法条标题的文本分块器
+
+    一次正则扫描得到结构性边界的偏移量，每个块优先在窗口后半段中
+    级别最高的边界处切分，结构性边界不足时才在窗口内查找句子/分句/空白边界。
+    分块过程只处理偏移量，不复制中间字符串，最后才按 (start, end) 切出块文本。
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=200, min_fill=0.5):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap 必须小于 chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_fill = min_fill  # 块长度低于 chunk_size * min_fill 时才退而使用低级别边界
+
+    def find_boundaries(self, text):
+        """返回结构性边界（标题、段落、换行）各级别的有序偏移量列表"""
+        levels = [[] for _ in _STRUCTURE_LEVELS]
+        for m in _STRUCTURE_RE.finditer(text):
+            levels[_STRUCTURE_LEVELS[m.lastgroup]].append(m.end())
+        return levels
+
+    def split_offsets(self, text):
+        """返回块的 (start, end) 偏移量列表，块首尾的空白已去除"""
+        n = len(text)
+        levels = self.find_boundaries(text)
+        offsets = []
+        start = 0
+        while start < n:
+            limit = start + self.chunk_size
+            if limit >= n:
+                end, end_level = n, SPACE
+            else:
+                end, end_level = self._best_boundary(text, levels, start, limit)
+
+            chunk_start, chunk_end = start, end
+            while chunk_start < chunk_end and text[chunk_start].isspace():
+                chunk_start += 1
+            while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            if chunk_end > chunk_start:
+                offsets.append((chunk_start, chunk_end))
+            if end >= n:
+                break
+
+            next_start = self._overlap_start(text, levels, end, end_level)
+            start = next_start if next_start > start else end
+        return offsets
+
+    def _best_boundary(self, text, levels, start, limit):
+        """在 (start, limit] 中选择切分点，返回 (偏移量, 边界级别)"""
+        min_end = start + int(self.chunk_size * self.min_fill)
+        fallback = None
+        for level in range(SPACE + 1):
+            if level in _INLINE_SEPARATORS:
+                pos = max(text.rfind(sep, start, limit) for sep in _INLINE_SEPARATORS[level]) + 1
+                if pos <= start:
+                    continue
+            else:
+                level_positions = levels[level]
+                i = bisect_right(level_positions, limit) - 1
+                if i < 0 or level_positions[i] <= start:
+                    continue
+                pos = level_positions[i]
+            if pos >= min_end:
+                return pos, level
+            if fallback is None or pos > fallback[0]:
+                fallback = (pos, level)
+        # 窗口内没有足够靠后的边界：使用最靠后的任意边界，否则在 chunk_size 处硬切
+        return fallback if fallback is not None else (limit, SPACE)
+
+    def _overlap_start(self, text, levels, end, end_level):
+        """下一个块的起点：[end - overlap, end) 中最靠前的、级别不低于切分点的边界
+
+        与 RecursiveCharacterTextSplitter 只重叠完整片段的行为一致：在段落处切分时
+        重叠部分也从段落开头开始，找不到这样的边界则不重叠。
+        """
+        if not self.chunk_overlap:
+            return end
+        target = end - self.chunk_overlap
+        best = end
+        for level in range(end_level + 1):
+            if level in _INLINE_SEPARATORS:
+                for sep in _INLINE_SEPARATORS[level]:
+                    idx = text.find(sep, max(target - 1, 0), best - 1)
+                    if idx >= 0:
+                        best = idx + 1
+            else:
+                level_positions = levels[level]
+                i = bisect_left(level_positions, target)
+                if i < len(level_positions) and level_positions[i] < best:
+                    best = level_positions[i]
+        return best
+
+    def split_text(self, text):
+        return [text[start:end] for start, end in self.split_offsets(text)]
+
+    def split_documents(self, documents):
+        """分割 Document 列表，块的 metadata 复制原文档并记录 start_index"""
+        chunks = []
+        for doc in documents:
+            text = doc.page_content
+            for start, end in self.split_offsets(text):
+                metadata = dict(doc.metadata)
+                metadata["start_index"] = start
+                chunks.append(type(doc)(page_content=text[start:end], metadata=metadata))
+        return chunks
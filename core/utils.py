@@ -0,0 +1,72 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# 中日韩字符（含全角标点）大约每个字符一个 token，其余文本按约 4 个字符一个 token 估算
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def normalize_text(text):
+    """文本规范化（用于缓存键）：NFC + 合并空白"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def estimate_tokens(text):
+    """不加载分词器的 token 数粗略估计（偏保守），用于上下文预算"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+# CJK 连续片段按二元组切分，英文单词和数字整体作为词项
+_TOKEN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[A-Za-z]+|\d+")
+
+
+def tokenize(text):
+    """CJK 二元组分词：单个汉字保留为一元词，英文转小写"""
+    tokens = []
+    for m in _TOKEN_RE.finditer(text):
+        run = m.group()
+        if run[0].isascii():
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存"""
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = (None, "int8", "binary")
+# 各量化方式默认重排的候选倍数：二值编码损失更大，需要更多候选才能保持召回率
+DEFAULT_RERANK_FACTORS = {"int8": 4, "binary": 32}
+
+# numpy < 2.0 没有 bitwise_count，用查表代替
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(bits):
+    """按行统计置位数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[bits.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def _top_k(scores, k):
+    """对二维分数矩阵每行取 top-k，返回按分数降序的 (列号, 分数)"""
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class NumpyVectorStore(VectorStore):
+    """精确检索的向量库：向量存放在内存映射的 float32 矩阵中，文本和 metadata 存放在 SQLite
+
+    向量写入时归一化，查询为一次矩阵乘法（余弦相似度）加 argpartition 取 top-k，
+    结果与暴力检索完全一致。打开时只读取 ID 列表，不需要把向量读入内存或重建图索引。
+    删除的行记为空闲，下次写入时复用；容量不足时矩阵文件按倍数扩容。
+
+    quantization 为 "int8"（每维 1 字节 + 每行缩放系数）或 "binary"（每维 1 位）时，
+    另存一份紧凑编码：查询先扫描编码得到 k * rerank_factor 个候选，再用完整向量重排，
+    只有候选行的 float32 向量会被读入内存。编码由完整向量导出，切换模式时自动重建。
+    """
+
+    INITIAL_CAPACITY = 1024
+    BLOCK_ROWS = 2048  # 粗排和重建编码时每块处理的行数，块缓冲区可以留在 CPU 缓存中
+
+    def __init__(self, persist_directory, embedding_function, quantization=None, rerank_factor=None):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"不支持的量化方式: {quantization}")
+        self.persist_directory = persist_directory
+        self.embedding = embedding_function
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor or DEFAULT_RERANK_FACTORS.get(quantization, 1)
+        self._lock = threading.RLock()
+        os.makedirs(persist_directory, exist_ok=True)
+        self._vectors_path = os.path.join(persist_directory, "vectors.f32")
+        self._conn = sqlite3.connect(os.path.join(persist_directory, "store.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        row = self._conn.execute("SELECT value FROM info WHERE key='dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        self._row_of = {chunk_id: r for r, chunk_id in self._conn.execute("SELECT row, id FROM chunks")}
+        self._n_rows = max(self._row_of.values(), default=-1) + 1  # 已使用的行数（含空闲行）
+        self._id_at = [None] * self._n_rows  # 行号 -> 块 ID
+        for chunk_id, r in self._row_of.items():
+            self._id_at[r] = chunk_id
+        self._matrix = None
+        self._codes = []
+        self._valid = np.zeros(0, dtype=bool)
+        row = self._conn.execute("SELECT value FROM info WHERE key='quantization'").fetchone()
+        codes_stale = (row[0] if row else "none") != (self.quantization or "none") \
+            or not all(os.path.exists(path) for path, _, _ in self._code_files())
+        capacity = os.path.getsize(self._vectors_path) // (4 * self.dim) \
+            if self.dim is not None and os.path.exists(self._vectors_path) else 0
+        if capacity:
+            self._open_matrix(capacity)
+            self._valid[list(self._row_of.values())] = True
+            if codes_stale:
+                self._rebuild_codes()
+        self._conn.execute("INSERT OR REPLACE INTO info VALUES ('quantization', ?)", (self.quantization or "none",))
+        self._conn.commit()
+        self._free = sorted(set(range(self._n_rows)).difference(self._row_of.values()), reverse=True)
+
+    def _open_matrix(self, capacity):
+        """以 capacity 行打开（必要时扩展）矩阵文件"""
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(max(capacity * self.dim * 4, os.path.getsize(self._vectors_path)))
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._codes = []
+        for path, dtype, width in self._code_files():
+            shape = (capacity, width) if width else (capacity,)
+            with open(path, "ab") as f:
+                f.truncate(max(int(np.prod(shape)) * np.dtype(dtype).itemsize, os.path.getsize(path)))
+            self._codes.append(np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+        valid = np.zeros(capacity, dtype=bool)
+        valid[:len(self._valid)] = self._valid[:capacity]
+        self._valid = valid
+
+    def _code_files(self):
+        """量化编码文件：(路径, dtype, 每行宽度，None 表示每行一个标量)"""
+        if self.quantization == "int8":
+            return [(os.path.join(self.persist_directory, "codes.i8"), np.int8, self.dim),
+                    (os.path.join(self.persist_directory, "scales.f32"), np.float32, None)]
+        if self.quantization == "binary":
+            return [(os.path.join(self.persist_directory, "codes.bin"), np.uint8, ((self.dim or 0) + 7) // 8)]
+        return []
+
+    def _encode(self, vectors):
+        """将归一化向量编码为与 _code_files 对应的数组"""
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return [np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)]
+        if self.quantization == "binary":
+            return [np.packbits(vectors > 0, axis=1)]
+        return []
+
+    def _write_codes(self, rows, vectors):
+        for codes, encoded in zip(self._codes, self._encode(vectors)):
+            codes[rows] = encoded
+            codes.flush()
+
+    def _rebuild_codes(self):
+        if not self._codes:
+            return
+        logger.info("重建向量量化编码（%s），共 %d 行...", self.quantization, self._n_rows)
+        for start in range(0, self._n_rows, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, self._n_rows)
+            for codes, encoded in zip(self._codes, self._encode(np.asarray(self._matrix[start:end]))):
+                codes[start:end] = encoded
+        for codes in self._codes:
+            codes.flush()
+
+    def memory_usage(self):
+        """每个向量在查询扫描阶段需要读取的字节数：(完整向量, 量化编码)"""
+        if self.dim is None:
+            return 0, 0
+        code_bytes = sum(np.dtype(dtype).itemsize * (width or 1) for _, dtype, width in self._code_files())
+        return self.dim * 4, code_bytes
+
+    def _allocate_rows(self, count):
+        rows = [self._free.pop() for _ in range(min(count, len(self._free)))]
+        rows.extend(range(self._n_rows, self._n_rows + count - len(rows)))
+        self._n_rows = max(self._n_rows, max(rows, default=-1) + 1)
+        self._id_at.extend([None] * (self._n_rows - len(self._id_at)))
+        capacity = len(self._valid)
+        if self._n_rows > capacity:
+            while capacity < self._n_rows:
+                capacity = max(capacity * 2, self.INITIAL_CAPACITY)
+            self._open_matrix(capacity)
+        return rows
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        """添加文本；ids 已存在时原地覆盖（upsert）"""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1.0)
+        # 同一批次中重复的 ID 以最后一次为准
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        order = sorted(last.values())
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._conn.execute("INSERT OR REPLACE INTO info VALUES ('dim', ?)", (str(self.dim),))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"嵌入维度 {vectors.shape[1]} 与向量库维度 {self.dim} 不一致")
+            new_ids = [ids[i] for i in order if ids[i] not in self._row_of]
+            new_rows = iter(self._allocate_rows(len(new_ids)))
+            rows = [self._row_of[ids[i]] if ids[i] in self._row_of else next(new_rows) for i in order]
+            # 先写向量再提交 metadata：中途退出时 SQLite 中的行都有对应的向量
+            self._matrix[rows] = vectors[order]
+            self._matrix.flush()
+            self._write_codes(rows, vectors[order])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)",
+                [(row, ids[i], texts[i], json.dumps(metadatas[i], ensure_ascii=False))
+                 for row, i in zip(rows, order)]
+            )
+            self._conn.commit()
+            for row, i in zip(rows, order):
+                self._row_of[ids[i]] = row
+                self._id_at[row] = ids[i]
+            self._valid[rows] = True
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self._lock:
+            rows = [self._row_of.pop(chunk_id) for chunk_id in ids if chunk_id in self._row_of]
+            self._conn.executemany("DELETE FROM chunks WHERE row=?", [(row,) for row in rows])
+            self._conn.commit()
+            self._valid[rows] = False
+            for row in rows:
+                self._id_at[row] = None
+            self._free.extend(rows)
+            self._free.sort(reverse=True)
+        return True
+
+    def reset_collection(self):
+        """清空所有数据（保留矩阵文件以便复用空间）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+            self._row_of.clear()
+            self._valid[:] = False
+            self._n_rows = 0
+            self._id_at = []
+            self._free = []
+
+    def get_by_ids(self, ids, /):
+        ids = list(ids)
+        found = {}
+        with self._lock:
+            # SQLite 单条语句的参数数量有限，分批查询
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for chunk_id, text, metadata in self._conn.execute(
+                        f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", batch):
+                    found[chunk_id] = Document(id=chunk_id, page_content=text, metadata=json.loads(metadata))
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def search_by_vectors(self, vectors, k=4):
+        """批量检索：一次矩阵乘法对所有查询打分，返回每个查询的 [(块 ID, 余弦相似度)]
+
+        启用量化时先用紧凑编码粗排，再对候选用完整向量计算精确的余弦相似度。
+        """
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+        with self._lock:
+            if not self._row_of:
+                return [[] for _ in queries]
+            n_rows = self._n_rows
+            n_live = len(self._row_of)
+            k = min(k, n_live)
+            if self.quantization is None:
+                scores = queries @ self._matrix[:n_rows].T
+            else:
+                scores = self._coarse_scores(queries, n_rows)
+            if n_live < n_rows:
+                scores[:, ~self._valid[:n_rows]] = -np.inf
+            if self.quantization is None:
+                top, top_scores = _top_k(scores, k)
+            else:
+                n_candidates = min(k * self.rerank_factor, n_live)
+                # 候选行排序后按文件顺序读取完整向量
+                candidates = np.sort(np.argpartition(-scores, n_candidates - 1, axis=1)[:, :n_candidates], axis=1)
+                exact = np.stack([self._matrix[rows] @ query for rows, query in zip(candidates, queries)])
+                top, top_scores = _top_k(exact, k)
+                top = np.take_along_axis(candidates, top, axis=1)
+            return [[(self._id_at[row], float(score)) for row, score in zip(rows, row_scores)]
+                    for rows, row_scores in zip(top.tolist(), top_scores.tolist())]
+
+    def _coarse_scores(self, queries, n_rows):
+        """用量化编码近似打分（分数只用于排序候选）"""
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        if self.quantization == "binary":
+            query_bits = np.packbits(queries > 0, axis=1)
+            codes = self._codes[0]
+            word = np.uint64 if codes.shape[1] % 8 == 0 else np.uint8  # 按 64 位字异或更快
+            query_words = query_bits.view(word)
+        else:
+            codes, scales = self._codes
+            buffer = np.empty((self.BLOCK_ROWS, self.dim), dtype=np.float32)  # int8 块反量化的复用缓冲区
+        for start in range(0, n_rows, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, n_rows)
+            if self.quantization == "int8":
+                block = buffer[:end - start]
+                np.copyto(block, codes[start:end], casting="unsafe")
+                scores[:, start:end] = (queries @ block.T) * scales[start:end]
+            else:
+                block = np.ascontiguousarray(codes[start:end]).view(word)
+                for i, query in enumerate(query_words):
+                    # 汉明距离越小越相似
+                    scores[i, start:end] = -_popcount_rows(block ^ query)
+        return scores
+
+    def _hits_to_documents(self, hits):
+        docs = {doc.id: doc for doc in self.get_by_ids([chunk_id for chunk_id, _ in hits])}
+        return [(docs[chunk_id], score) for chunk_id, score in hits if chunk_id in docs]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        return self._hits_to_documents(self.search_by_vectors([embedding], k)[0])
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    # 异步检索只异步等待查询嵌入，矩阵扫描很快，直接在事件循环中执行（默认实现会放进线程池）
+    async def asimilarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(await self.embedding.aembed_query(query), k)
+
+    async def asimilarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # 余弦相似度 [-1, 1] 映射到 [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, persist_directory="./numpy_db",
+                   quantization=None, **kwargs):
+        store = cls(persist_directory, embedding, quantization=quantization)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def close(self):
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+            for codes in self._codes:
+                codes.flush()
+            self._conn.close()
@@ -0,0 +1,384 @@
+"""无界面的 HTTP 服务：通过 OpenAI 兼容接口提供生成、对话和检索问答
+
+用法：python server.py [--host 127.0.0.1] [--port 8000] [--model gemma3n]
+
+接口：
+  GET    /v1/models               Ollama 中可用的模型
+  POST   /v1/chat/completions     OpenAI 格式（支持 stream=true 的 SSE 流式输出）。
+                                  额外字段 mode: chat（默认）/ generate / rag。
+                                  带 X-Session-Id 请求头（或 session_id 字段）时服务端保存该会话的对话历史，
+                                  客户端只需发送新消息；否则使用请求中的 messages 作为历史。
+  POST   /v1/retrieve             {"query": ..., "k": 可选, "pack": 可选} → 检索到的文档块
+  DELETE /v1/sessions/<id>        清除会话
+  GET    /health                  服务状态和请求调度统计
+  GET    /metrics                 各阶段耗时和调度器状态（Prometheus 文本格式）
+
+所有请求共用一个索引（启动时增量更新，文档目录变化时自动重建）和一个 Ollama 连接池，
+并发请求数由请求调度器限制。
+"""
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import settings
+from core.document_watcher import DocumentWatcher
+from core.langchain_ollama_client import LangchainOllamaAPI
+from core.metrics import configure_logging, get_metrics, start_exporter
+from core.ollama_client import OllamaAPI
+from core.scheduler import get_scheduler
+from core.session_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+MODES = ("chat", "generate", "rag")
+
+
+class Session:
+    """一个会话：独立的对话记忆（生成/对话模式），同一会话的请求依次处理"""
+
+    def __init__(self, model):
+        self.api = OllamaAPI(model)
+        self.lock = threading.Lock()
+
+
+def upstream_error(e):
+    """生成过程中的异常 → (HTTP 状态码, OpenAI 错误类型, 错误码)"""
+    status = getattr(e, "status_code", None)  # ollama.ResponseError 带有 Ollama 返回的状态码
+    if status == 404:
+        return 404, "invalid_request_error", "model_not_found"
+    if isinstance(status, int) and 400 <= status < 500:
+        return 400, "invalid_request_error", None
+    return 502, "upstream_error", None
+
+
+def message_text(content):
+    """OpenAI 消息内容可以是字符串或 [{"type": "text", "text": ...}] 列表"""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class LocalLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rag_api, sessions, api_key=None):
+        super().__init__(address, RequestHandler)
+        self.rag_api = rag_api      # 共享的索引、检索和 RAG 生成
+        self.sessions = sessions
+        self.api_key = api_key
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "LocalLLM/1.0"
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/v1/models":
+            try:
+                models = self.server.rag_api.get_model_list().models
+            except Exception as e:
+                self._send_error(502, f"获取模型列表失败: {e}")
+                return
+            self._send_json(200, {"object": "list",
+                                  "data": [{"id": m.model, "object": "model", "owned_by": "ollama"}
+                                           for m in models]})
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok",
+                                  "index_ready": self.server.rag_api.rag_chain is not None,
+                                  "sessions": len(self.server.sessions),
+                                  "scheduler": get_scheduler().stats()})
+        elif self.path == "/metrics":
+            data = get_metrics().to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_error(404, f"未知路径: {self.path}")
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            body = self._read_json()
+        except ValueError as e:
+            self._send_error(400, f"请求体不是有效的 JSON: {e}")
+            return
+        if self.path == "/v1/chat/completions":
+            self._chat_completions(body)
+        elif self.path == "/v1/retrieve":
+            self._retrieve(body)
+        else:
+            self._send_error(404, f"未知路径: {self.path}")
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        prefix = "/v1/sessions/"
+        if not self.path.startswith(prefix):
+            self._send_error(404, f"未知路径: {self.path}")
+            return
+        session_id = self.path[len(prefix):]
+        if self.server.sessions.drop(session_id):
+            self._send_json(200, {"id": session_id, "deleted": True})
+        else:
+            self._send_error(404, f"会话不存在: {session_id}")
+
+    def _chat_completions(self, body):
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages or messages[-1].get("role") != "user":
+            self._send_error(400, "messages 必须是以 user 消息结尾的非空列表")
+            return
+        mode = body.get("mode", "chat")
+        if mode not in MODES:
+            self._send_error(400, f"mode 必须是 {'/'.join(MODES)} 之一")
+            return
+        prompt = message_text(messages[-1].get("content"))
+        session_id = self.headers.get("X-Session-Id") or body.get("session_id")
+        cancel_event = threading.Event()
+
+        if mode == "rag":
+            # RAG 每次只根据检索结果回答，不使用对话历史；模型为服务启动时指定的模型
+            api, lock = self.server.rag_api, None
+            model = api.model
+            if api.rag_chain is None:
+                self._send_error(503, "索引尚未就绪")
+                return
+            stream = api.stream_rag_response(prompt, cancel_event, raise_errors=True)
+        else:
+            model = body.get("model") or self.server.rag_api.model
+            if session_id:
+                session = self.server.sessions.get(session_id)
+                api, lock = session.api, session.lock
+            else:
+                # 无状态请求：用请求中除最后一条之外的消息作为历史，不做后台摘要
+                api, lock = OllamaAPI(model), None
+                memory = api.chat_memory if mode == "chat" else api.generate_memory
+                memory.summarize_fn = None
+                for message in messages[:-1]:
+                    memory.add(message.get("role", "user"), message_text(message.get("content")))
+            fn = api.stream_chat_response if mode == "chat" else api.stream_generate_response
+            stream = None  # 在取得会话锁之后再创建
+
+        if lock is not None:
+            lock.acquire()
+        try:
+            if stream is None:
+                if api.model != model:
+                    api.change_model(model)  # 同一会话切换模型时清空历史（与界面中的行为一致）
+                stream = fn(prompt, cancel_event, raise_errors=True)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            if body.get("stream"):
+                self._stream_completion(stream, cancel_event, completion_id, model)
+            else:
+                answer = ""
+                try:
+                    for answer in stream:
+                        pass
+                except Exception as e:
+                    self._send_upstream_error(e)
+                    return
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0,
+                                 "message": {"role": "assistant", "content": answer},
+                                 "finish_reason": "stop"}],
+                }
+                stats = api.last_turn_stats if mode != "rag" else None
+                if stats and stats.get("prompt_tokens") is not None:
+                    payload["usage"] = {"prompt_tokens": stats["prompt_tokens"],
+                                        "completion_tokens": stats["completion_tokens"],
+                                        "total_tokens": stats["prompt_tokens"] + stats["completion_tokens"]}
+                self._send_json(200, payload)
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _stream_completion(self, stream, cancel_event, completion_id, model):
+        """以 SSE 发送 chat.completion.chunk；客户端断开时关闭生成器，Ollama 随即停止生成
+
+        等到第一个 token 才发送响应头，生成开始前的错误（模型不存在、Ollama 不可用）以普通的错误响应返回；
+        之后的错误发送一个 {"error": ...} 事件并结束流。
+        """
+        try:
+            first = next(stream, None)
+        except Exception as e:
+            self._send_upstream_error(e)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        created = int(time.time())
+
+        def send(payload):
+            self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        def send_delta(delta, finish_reason=None):
+            send({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                  "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+        try:
+            send_delta({"role": "assistant", "content": ""})
+            sent = ""
+            answers = stream if first is None else itertools.chain([first], stream)
+            try:
+                for answer in answers:
+                    # 流式接口产出累积的回答，这里只发送新增部分
+                    delta = answer[len(sent):] if answer.startswith(sent) else answer
+                    sent = answer
+                    if delta:
+                        send_delta({"content": delta})
+            except (BrokenPipeError, ConnectionResetError):
+                raise  # 写给客户端失败，不是生成出错
+            except Exception as e:
+                logger.warning("生成 %s 时出错: %s", completion_id, e)
+                status, error_type, code = upstream_error(e)
+                send({"error": {"message": f"生成失败: {e}", "type": error_type, "code": code or status}})
+                return
+            send_delta({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            cancel_event.set()
+            stream.close()
+            logger.info("客户端断开连接，已停止生成 %s", completion_id)
+
+    def _retrieve(self, body):
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            self._send_error(400, "query 必须是非空字符串")
+            return
+        api = self.server.rag_api
+        if api.rag_chain is None:
+            self._send_error(503, "索引尚未就绪")
+            return
+        start = time.perf_counter()
+        try:
+            docs = api.retrieve(query)
+            if body.get("pack"):
+                docs = api.pack_context(query, docs)
+        except Exception as e:
+            self._send_error(500, f"检索失败: {e}")
+            return
+        k = body.get("k")
+        if isinstance(k, int) and k > 0:
+            docs = docs[:k]
+        self._send_json(200, {
+            "query": query,
+            "documents": [{"id": doc.id, "content": doc.page_content, "metadata": doc.metadata} for doc in docs],
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+
+    def _authorized(self):
+        if not self.server.api_key:
+            return True
+        if self.headers.get("Authorization") == f"Bearer {self.server.api_key}":
+            return True
+        self._send_error(401, "API 密钥无效")
+        return False
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("请求体必须是 JSON 对象")
+        return body
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, error_type=None, code=None):
+        if error_type is None:
+            error_type = "invalid_request_error" if status < 500 else "server_error"
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": code or status}})
+
+    def _send_upstream_error(self, e):
+        status, error_type, code = upstream_error(e)
+        logger.warning("生成失败（返回 %s）: %s", status, e)
+        self._send_error(status, f"生成失败: {e}", error_type, code)
+
+
+class IndexUpdater:
+    """文档目录变化时在监视线程中增量更新共享索引；更新期间到达的变化合并到下一次更新"""
+
+    def __init__(self, api):
+        self.api = api
+        self._pending = set()
+        self._running = False
+        self._lock = threading.Lock()
+
+    def on_documents_changed(self, paths):
+        with self._lock:
+            self._pending.update(paths)
+            if self._running:
+                return
+            self._running = True
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                paths, self._pending = sorted(self._pending), set()
+            logger.info("文档变化，增量更新索引: %s", paths)
+            logger.info(self.api.rebuild_index_and_chain(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LocalLLM 的 OpenAI 兼容 HTTP 服务")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--model", default="gemma3n", help="默认模型（RAG 始终使用该模型）")
+    args = parser.parse_args()
+    configure_logging()
+    start_exporter()
+
+    rag_api = LangchainOllamaAPI(model=args.model, auto_index=False)
+    rag_api.warm_up()
+    logger.info("正在更新索引...")
+    logger.info(rag_api.rebuild_index_and_chain())
+
+    watcher = None
+    if settings.WATCH_DOCUMENTS:
+        watcher = DocumentWatcher(rag_api.get_documentes_dir(),
+                                  IndexUpdater(rag_api).on_documents_changed,
+                                  quiet_period=settings.WATCH_QUIET_PERIOD,
+                                  poll_interval=settings.WATCH_POLL_INTERVAL)
+        watcher.start()
+
+    sessions = SessionStore(lambda: Session(args.model),
+                            max_sessions=settings.SERVER_MAX_SESSIONS,
+                            ttl=settings.SERVER_SESSION_TTL)
+    server = LocalLLMServer((args.host, args.port), rag_api, sessions, api_key=settings.SERVER_API_KEY)
+    logger.info("服务已启动: http://%s:%s/v1", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher:
+            watcher.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+from langchain_core.documents import Document
+
+from core.context_packer import ContextPacker, merge_adjacent
+
+
+def chunk(chunk_id, text, start, source="a.pdf", page=0):
+    return Document(id=chunk_id, page_content=text, metadata={"source": source, "page": page, "start_index": start})
+
+
+def test_merges_overlapping_chunks_of_one_page():
+    docs = [chunk("b", "cdefgh", 2), chunk("a", "abcdef", 0)]
+    merged = merge_adjacent(docs)
+    assert len(merged) == 1
+    assert merged[0].page_content == "abcdefgh"
+    assert merged[0].metadata["chunk_ids"] == ["a", "b"]
+
+
+def test_does_not_merge_chunks_of_different_pdf_pages():
+    # start_index 是页内偏移：两页的块偏移重叠，但不是同一段文本
+    docs = [chunk("p1", "第一页的内容", 0, page=0), chunk("p2", "第二页的内容", 3, page=1)]
+    merged = merge_adjacent(docs)
+    assert [doc.page_content for doc in merged] == ["第一页的内容", "第二页的内容"]
+    assert all("chunk_ids" not in doc.metadata for doc in merged)
+
+
+def test_pack_keeps_text_of_every_page():
+    docs = [chunk("p1", "甲" * 20, 0, page=0), chunk("p2", "乙" * 20, 10, page=1)]
+    packed, stats = ContextPacker(token_budget=1000).pack(docs)
+    assert stats["merged"] == 0
+    assert {doc.page_content for doc in packed} == {"甲" * 20, "乙" * 20}
@@ -0,0 +1,45 @@
+from core.conversation_memory import ConversationMemory
+from core.utils import estimate_tokens
+
+
+def prompt_tokens(system, prompt):
+    return estimate_tokens(prompt) + (estimate_tokens(system) if system else 0)
+
+
+def test_prompt_includes_history_within_budget():
+    memory = ConversationMemory(max_tokens=200)
+    memory.add("user", "你好")
+    memory.add("assistant", "你好，有什么可以帮你？")
+    system, prompt = memory.prompt("介绍一下民法典")
+    assert system is None
+    assert prompt == "用户：你好\n\n助手：你好，有什么可以帮你？\n\n用户：介绍一下民法典\n助手："
+
+
+def test_pending_prompt_counts_against_budget():
+    memory = ConversationMemory(max_tokens=200)
+    for i in range(4):
+        memory.add("user", f"问题{i}" + "问" * 30)
+        memory.add("assistant", f"回答{i}" + "答" * 30)
+    window = memory.messages()
+
+    question = "请总结" + "长" * 100
+    system, prompt = memory.prompt(question)
+    assert prompt_tokens(system, prompt) <= 200
+    # 放不下时去掉的是较早的轮次，最近一轮仍在
+    assert "回答3" in prompt and "问题2" not in prompt
+    assert prompt.endswith(f"用户：{question}\n助手：")
+    # 只是这次不发送，窗口本身不变
+    assert memory.messages() == window
+
+
+def test_summary_is_dropped_before_recent_turns():
+    memory = ConversationMemory(max_tokens=200)
+    memory.summary = "摘" * 60
+    memory.add("user", "问" * 30)
+    memory.add("assistant", "答" * 30)
+    system, prompt = memory.prompt("短问题")
+    assert system is not None
+    system, prompt = memory.prompt("长" * 100)
+    assert system is None
+    assert "答" * 30 in prompt
+    assert prompt_tokens(system, prompt) <= 200
@@ -0,0 +1,54 @@
+from langchain_core.documents import Document
+
+from core.bm25_index import BM25Index
+from core.hybrid_retriever import HybridRetriever, exact_lookup_terms, lookup_terms
+
+ARTICLES = {
+    "1076": "第一千零七十六条　夫妻双方自愿离婚的，应当签订书面离婚协议，并亲自到婚姻登记机关申请离婚登记。",
+    "1077": "第一千零七十七条　自婚姻登记机关收到离婚登记申请之日起三十日内，任何一方不愿意离婚的，"
+            "可以向婚姻登记机关撤回离婚登记申请。",
+    "1078": "第一千零七十八条　婚姻登记机关查明双方确实是自愿离婚，并已经对子女抚养、财产以及债务处理等事项"
+            "协商一致的，予以登记，发给离婚证。",
+    "10": "第十条　处理民事纠纷，应当依照法律；法律没有规定的，可以适用习惯，但是不得违背公序良俗。",
+}
+
+
+class FakeVectorStore:
+    def __init__(self, docs):
+        self.docs = {doc.id: doc for doc in docs}
+        self.searches = 0
+
+    def get_by_ids(self, ids):
+        return [self.docs[i] for i in ids if i in self.docs]
+
+    def similarity_search(self, query, k=4):
+        self.searches += 1
+        return list(self.docs.values())[:k]
+
+
+def make_retriever():
+    docs = [Document(id=key, page_content=text) for key, text in ARTICLES.items()]
+    lexical_index = BM25Index()
+    lexical_index.add([doc.id for doc in docs], [doc.page_content for doc in docs])
+    return HybridRetriever(vector_store=FakeVectorStore(docs), lexical_index=lexical_index, k=3)
+
+
+def test_arabic_article_numbers_match_chinese_numerals():
+    assert lookup_terms("第1077条") == ["第1077条", "第一千零七十七条"]
+    assert lookup_terms("第10条和第110条") == ["第10条", "第十条", "第110条", "第一百一十条"]
+    assert lookup_terms("第1010条") == ["第1010条", "第一千零一十条"]
+    assert exact_lookup_terms("《民法典》第1260条的内容") == ["第1260条", "第一千二百六十条"]
+
+
+def test_documented_lookup_uses_fast_path_on_chinese_numeral_text():
+    retriever = make_retriever()
+    docs = retriever.invoke("第1077条")
+    assert docs[0].id == "1077"
+    assert retriever.vector_store.searches == 0
+
+
+def test_article_number_boosts_hybrid_search():
+    retriever = make_retriever()
+    docs = retriever.invoke("第10条讲的是什么原则，请举例说明")
+    assert docs[0].id == "10"
+    assert retriever.vector_store.searches == 1
@@ -0,0 +1,66 @@
+from langchain_core.documents import Document
+
+from core.index_manifest import IndexManifest
+from core.ingest_pipeline import IngestPipeline
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.docs = {}
+        self.added = []
+
+    def add_documents(self, documents, ids):
+        self.added.extend(ids)
+        self.docs.update(zip(ids, documents))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.docs.pop(chunk_id, None)
+
+
+def load(file_paths):
+    for path in file_paths:
+        with open(path, encoding="utf-8") as f:
+            yield path, [Document(page_content=f.read(), metadata={"source": path})]
+
+
+def split(documents):
+    return [Document(page_content=line, metadata=doc.metadata)
+            for doc in documents for line in doc.page_content.splitlines()]
+
+
+def index(documents_dir, manifest_path, vector_db, embedding_model):
+    manifest = IndexManifest(str(manifest_path), chunking={"chunk_size": 100, "embedding_model": embedding_model})
+    changed, deleted = manifest.scan(str(documents_dir))
+    vector_db.added.clear()
+    stats = IngestPipeline(load, split, vector_db, manifest).run(changed, deleted)
+    return manifest, stats
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "a.txt").write_text("第一段\n第二段\n", encoding="utf-8")
+    vector_db = FakeVectorStore()
+    index(tmp_path / "docs", tmp_path / "manifest.json", vector_db, "nomic-embed-text")
+
+    _, stats = index(tmp_path / "docs", tmp_path / "manifest.json", vector_db, "nomic-embed-text")
+    assert stats.files_total == 0
+    assert vector_db.added == []
+
+
+def test_changing_embedding_model_reembeds_unchanged_chunks(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "a.txt").write_text("第一段\n第二段\n", encoding="utf-8")
+    vector_db = FakeVectorStore()
+    first, _ = index(tmp_path / "docs", tmp_path / "manifest.json", vector_db, "nomic-embed-text")
+    chunk_ids = first.chunk_ids("a.txt")
+
+    manifest, stats = index(tmp_path / "docs", tmp_path / "manifest.json", vector_db, "bge-m3")
+    assert manifest.invalidated
+    assert sorted(vector_db.added) == sorted(chunk_ids)
+    assert stats.chunks_added == len(chunk_ids) == 2
+    assert manifest.embedded_chunk_ids("a.txt") == chunk_ids
+
+    # 重新嵌入后的记录是有效的：再次索引不做任何事
+    _, stats = index(tmp_path / "docs", tmp_path / "manifest.json", vector_db, "bge-m3")
+    assert stats.files_total == 0
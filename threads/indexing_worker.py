@@ -0,0 +1,33 @@
+import logging
+import threading
+from PyQt6.QtCore import QThread, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class IndexingWorker(QThread):
+    """在后台线程中增量更新知识库索引"""
+    progress = pyqtSignal(dict)  # 进度：已解析文件数、已嵌入块数、ETA 等
+    finished = pyqtSignal(str)   # 完成信号（索引结果描述）
+    error = pyqtSignal(str)      # 错误信号
+
+    def __init__(self, api, paths=None, parent=None):
+        super().__init__(parent)
+        self.api = api
+        self.paths = paths  # 只检查这些相对路径，None 表示扫描整个文档目录
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            result = self.api.rebuild_index_and_chain(
+                paths=self.paths,
+                progress_callback=self.progress.emit,
+                cancel_event=self.cancel_event
+            )
+            self.finished.emit(result)
+        except Exception as e:
+            logger.exception("索引错误: %s", e)
+            self.error.emit(f"索引错误: {str(e)}")
+
+    def cancel(self):
+        self.cancel_event.set()
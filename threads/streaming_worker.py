@@ -1,37 +1,95 @@
-from PyQt6.QtCore import QThread, pyqtSignal
+import logging
+import threading
+from contextlib import aclosing
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
 class StreamingWorker(QThread):
+    """在后台线程中消费流式回答（生成/对话/检索模式通用）
+
+    stream_fn(prompt, cancel_event) 返回逐步累积的回答文本的迭代器，例如 api.stream_generate_response、
+    api.stream_chat_response 或 api.stream_rag_response。cancel() 之后不再发出任何信号。
+    """
     # 自定义信号
     partial_response = pyqtSignal(str)  # 部分响应信号
     finished = pyqtSignal()             # 处理完成信号
     error = pyqtSignal(str)              # 错误信号
     
-    def __init__(self, api, prompt, parent=None):
+    def __init__(self, stream_fn, prompt, parent=None):
         super().__init__(parent)
-        self.api = api
+        self.stream_fn = stream_fn
         self.prompt = prompt
-        self.cancel_requested = False
+        self.cancel_event = threading.Event()
     
     def run(self):
         try:
             # 使用流式API生成响应
-            response_stream = self.api.stream_rag_response(self.prompt)
+            response_stream = self.stream_fn(self.prompt, self.cancel_event)
             
             # 处理流式响应
 
             for chunk in response_stream:
                 # print(f"接收到数据块: {chunk}")
-                if self.cancel_requested:
-                    self.partial_response.emit("已取消")
+                if self.cancel_event.is_set():
+                    response_stream.close()  # 关闭生成器及其下的 HTTP 流，放弃未完成的一轮
                     return
                 
                 if chunk and chunk.strip():  # 确保有有效内容
                     self.partial_response.emit(chunk)
             
-            self.finished.emit()
+            if not self.cancel_event.is_set():
+                self.finished.emit()
         
         except Exception as e:
-            print(f"处理错误: {str(e)}")
-            self.error.emit(f"处理错误: {str(e)}")
+            logger.exception("处理错误: %s", e)
+            if not self.cancel_event.is_set():
+                self.error.emit(f"处理错误: {str(e)}")
     
     def cancel(self):
-        self.cancel_requested = True
\ No newline at end of file
+        self.cancel_event.set()
+
+class AsyncStreamingTask(QObject):
+    """StreamingWorker 的 asyncio 版本：在 Qt 事件循环（qasync）上运行异步生成器，不占用额外线程
+
+    信号和 start/cancel/isRunning/wait 与 StreamingWorker 相同，界面代码可以不区分两者。
+    astream_fn(prompt) 返回产出逐步累积的回答文本的异步生成器；cancel() 取消任务，关闭 HTTP 流。
+    """
+    partial_response = pyqtSignal(str)
+    finished = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, astream_fn, prompt, parent=None):
+        super().__init__(parent)
+        self.astream_fn = astream_fn
+        self.prompt = prompt
+        self.task = None
+
+    def start(self):
+        import asyncio  # 只在异步模式下导入（asyncio 导入较慢，影响启动时间）
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        import asyncio
+        try:
+            async with aclosing(self.astream_fn(self.prompt)) as response_stream:
+                async for chunk in response_stream:
+                    if chunk and chunk.strip():
+                        self.partial_response.emit(chunk)
+            self.finished.emit()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.exception("处理错误: %s", e)
+            self.error.emit(f"处理错误: {str(e)}")
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def isRunning(self):
+        return self.task is not None and not self.task.done()
+
+    def wait(self):
+        # 任务在事件循环中运行，取消后不需要（也不能）阻塞等待
+        return True
@@ -1,5 +1,3 @@
-from vosk import Model, KaldiRecognizer
-import pyaudio
 from PyQt6.QtCore import QThread, pyqtSignal
 import json
 
@@ -10,6 +8,10 @@ class VoskVoiceInputThread(QThread):
 
     def run(self):
         try:
+            # vosk/pyaudio 只在第一次语音输入时导入，未安装时通过 error_occurred 报告
+            from vosk import Model, KaldiRecognizer
+            import pyaudio
+
             # 初始化模型（需要指定模型路径）
             model = Model("resources/vosk-model-small-cn-0.22")
             recognizer = KaldiRecognizer(model, 16000)
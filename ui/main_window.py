@@ -3,37 +3,89 @@ from PyQt6.QtWidgets import (
     QTextBrowser, QTextEdit, QPushButton,
     QHBoxLayout, QLabel, QComboBox, QMessageBox, QFileDialog, QInputDialog, QLineEdit
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QTextCursor
-from PyQt6.QtCore import pyqtSlot
-from threads.worker import GenerateWorker, ChatWorker
-from threads.streaming_worker import StreamingWorker
+from PyQt6.QtCore import pyqtSlot, pyqtSignal
+from threads.streaming_worker import StreamingWorker, AsyncStreamingTask
 from threads.voice_input import VoskVoiceInputThread
+from threads.indexing_worker import IndexingWorker
 from core.langchain_ollama_client import LangchainOllamaAPI
-import markdown  # 用于处理Markdown格式
-import pyttsx3  # 添加语音合成库
+from core.scheduler import get_scheduler
+from core.metrics import get_metrics
+from core.profiler import PROFILE_TARGETS, profiling_enabled, set_profiling
+from core.document_watcher import DocumentWatcher
+from config import settings
+# markdown、pyttsx3（语音合成）、vosk 在第一次使用时才导入
+import logging
 import re
 import os
 import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
 class ChatWindow(QMainWindow):
-    def __init__(self):
+    documents_changed = pyqtSignal(list)  # 目录监视器报告的变更路径（来自后台线程）
+
+    def __init__(self, async_ui=False):
+        """async_ui 为 True 时回答以协程在 Qt 事件循环（qasync）上运行，否则每条消息一个线程"""
         super().__init__()
         self.setWindowTitle("Ollama Chat")
         self.setGeometry(100, 100, 800, 600)
         self.current_response = ""  # 用于存储当前响应内容
-        # 初始化语音引擎
-        self.speaker = pyttsx3.init()
-        self.speaker.setProperty('rate', 150)  # 设置语速
-        self.speaker.setProperty('volume', 0.9)  # 设置音量
-        # 初始化API客户端
-        self.api = LangchainOllamaAPI()
+        self._render_markdown = False  # 当前流式回答完成后是否按 Markdown 渲染（生成/对话模式）
+        self._response_placeholder = ""  # 回答块中第一个 token 到达前的占位文字（"思考中..."）
+        self._response_cursor = None  # 指向流式回答块末尾的光标，第一次刷新时创建
+        self._response_start = 0  # 回答文本在文档中的起始位置
+        self._rendered_response = ""  # 已写入回答块的文本
+        self.worker = None
+        self._stopped_workers = []  # 已停止、正在关闭连接的回答线程/任务，结束前保留引用
+        self._speaker = None  # 语音引擎，第一次朗读时初始化
+        # 初始化API客户端（不导入 langchain，索引在窗口显示后由后台线程构建）
+        self.async_ui = async_ui
+        if async_ui:
+            from core.async_langchain_ollama_client import AsyncLangchainOllamaAPI
+            self.api = AsyncLangchainOllamaAPI(auto_index=False)
+        else:
+            self.api = LangchainOllamaAPI(auto_index=False)
+        self.index_worker = None
+        self._pending_index_paths = set()  # 索引进行中又发生变更的路径，完成后再索引一次
+        self.doc_watcher = None
+        self.documents_changed.connect(self._start_indexing)
+        self._services_started = False
         
         # 创建UI
         self._create_ui()
-        
+
+        # 快速启动时先让窗口完成首次绘制（见 paintEvent），再加载模型列表、启动索引和目录监视
+        if not settings.FAST_START:
+            self._get_speaker()
+            self._start_background_services()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._services_started:
+            QTimer.singleShot(0, self._start_background_services)
+            self._services_started = True
+
+    def _start_background_services(self):
+        self._services_started = True
         # 加载模型列表
         self._load_models()
 
+        # 后台增量更新知识库索引
+        self._start_indexing()
+
+        # 监视文档目录，其他程序写入的文件也会自动索引
+        if settings.WATCH_DOCUMENTS:
+            self.doc_watcher = DocumentWatcher(
+                self.api.get_documentes_dir(),
+                self.documents_changed.emit,
+                quiet_period=settings.WATCH_QUIET_PERIOD,
+                poll_interval=settings.WATCH_POLL_INTERVAL
+            )
+            self.doc_watcher.start()
+
     
     def _create_ui(self):
         # 主布局
@@ -59,6 +111,20 @@ class ChatWindow(QMainWindow):
         control_layout.addWidget(self.model_combo, 3)
         control_layout.addWidget(self.clear_btn)
         control_layout.addWidget(self.upload_btn)
+
+        # 取消索引按钮（仅在索引进行中可用）
+        self.cancel_index_btn = QPushButton("取消索引")
+        self.cancel_index_btn.clicked.connect(self._cancel_indexing)
+        self.cancel_index_btn.setEnabled(False)
+        control_layout.addWidget(self.cancel_index_btn)
+
+        # 性能分析开关：开启后每次问答和索引都写出 cProfile/tracemalloc 报告
+        self.profile_btn = QPushButton("性能分析")
+        self.profile_btn.setCheckable(True)
+        self.profile_btn.setChecked(all(profiling_enabled(target) for target in PROFILE_TARGETS))
+        self.profile_btn.setToolTip(f"分析每次问答和索引，报告写入 {settings.PROFILE_DIR}")
+        self.profile_btn.toggled.connect(self._toggle_profiling)
+        control_layout.addWidget(self.profile_btn)
         
         # 在控制栏添加语音按钮
         self.voice_btn = QPushButton("朗读")
@@ -93,6 +159,11 @@ class ChatWindow(QMainWindow):
         self.send_btn = QPushButton("发送")
         self.send_btn.clicked.connect(self._send_generate_message)
 
+        # 停止按钮（仅在回答进行中可用）：取消检索并关闭生成的 HTTP 流
+        self.stop_btn = QPushButton("停止")
+        self.stop_btn.clicked.connect(self._stop_generation)
+        self.stop_btn.setEnabled(False)
+
         # self.mode_display.setStyleSheet("font-weight: bold; color: #4ec9b0;")
         self.change_mode_btn = QPushButton("切换模式")
         self.change_mode_btn.clicked.connect(self._toggle_mode)
@@ -102,6 +173,7 @@ class ChatWindow(QMainWindow):
         mode_layout.addWidget(self.mode_display)
         mode_layout.addWidget(self.change_mode_btn)
         mode_layout.addWidget(self.send_btn)
+        mode_layout.addWidget(self.stop_btn)
 
         input_layout.addWidget(self.input_box, 8)
         input_layout.addLayout(mode_layout, 2)
@@ -110,15 +182,41 @@ class ChatWindow(QMainWindow):
         main_layout.addLayout(control_layout)
         main_layout.addWidget(self.output_area, 6)
         main_layout.addLayout(input_layout, 1)
+
+        # 状态栏右侧常驻显示各阶段耗时的中位数（检索、首个 token、生成、渲染）
+        self.metrics_label = QLabel()
+        self.statusBar().addPermanentWidget(self.metrics_label)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self._update_metrics_label)
+        self.metrics_timer.start(2000)
+
+        # 流式回答按帧刷新：部分回答到达时只记下文本，定时器到期后把新增部分追加到回答块
+        self._render_timer = QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.setInterval(round(1000 / settings.UI_RENDER_FPS))
+        self._render_timer.timeout.connect(self._render_partial_response)
     
     def _load_models(self):
-        response_list = self.api.get_model_list()
+        try:
+            response_list = self.api.get_model_list()
+        except Exception as e:
+            self.statusBar().showMessage(f"获取模型列表失败: {str(e)}", 5000)
+            return
         for m in response_list.models:
             if m.model == "nomic-embed-text:latest":
                 pass
             else:
                 self.model_combo.addItem(m.model)
     
+    def _get_speaker(self):
+        """初始化语音引擎（pyttsx3 导入和初始化都较慢，只在需要时进行）"""
+        if self._speaker is None:
+            import pyttsx3
+            self._speaker = pyttsx3.init()
+            self._speaker.setProperty('rate', 150)  # 设置语速
+            self._speaker.setProperty('volume', 0.9)  # 设置音量
+        return self._speaker
+
     def _speak_output(self):
         """朗读输出区域的内容"""
         try:
@@ -133,15 +231,16 @@ class ChatWindow(QMainWindow):
 
             plain_text = re.sub(r'\s+', ' ', plain_text).strip()  # 合并多余空格
 
-            print(f"朗读内容: {plain_text}")  # 调试输出
+            logger.debug("朗读内容: %s", plain_text)
             # plain_text = self.output_area.toPlainText()
             if not plain_text.strip():
                 self.statusBar().showMessage("没有内容可朗读", 2000)
                 return
                 
             # 朗读内容
-            self.speaker.say(plain_text)
-            self.speaker.runAndWait()
+            speaker = self._get_speaker()
+            speaker.say(plain_text)
+            speaker.runAndWait()
             self.statusBar().showMessage("朗读完成", 2000)
             
         except Exception as e:
@@ -196,6 +295,10 @@ class ChatWindow(QMainWindow):
     
     @pyqtSlot()
     def _send_generate_message_stream(self):
+        self._send_stream_message("rag")
+
+    def _send_stream_message(self, mode, render_markdown=False):
+        """三种模式共用的流式发送：回答逐步显示，完成后在状态栏显示首个 token 延迟和生成速度"""
         prompt = self.input_box.toPlainText().strip()
         if not prompt:
             return
@@ -211,36 +314,98 @@ class ChatWindow(QMainWindow):
         
         # 重置当前响应
         self.current_response = ""
+        self._render_markdown = render_markdown
         
-        # 显示初始的"思考中..."消息
-        self._append_ai_message("思考中...")
+        # 显示初始的"思考中..."消息；模型正忙时显示前面排队的请求数
+        llm = get_scheduler().stats()["llm"]
+        if llm["active"] >= llm["capacity"]:
+            self._response_placeholder = (f"排队中（{llm['active']} 个回答正在生成，"
+                                          f"{llm['queued_interactive']} 个问题在等待）...")
+        else:
+            self._response_placeholder = "思考中..."
+        self._append_ai_message(self._response_placeholder)
 
-        # 创建工作线程
-        self.worker = StreamingWorker(self.api, prompt)
+        # 创建工作线程（异步模式下为事件循环中的任务）：使用 api 的 stream_<mode>_response / astream_<mode>_response
+        if self.async_ui:
+            self.worker = AsyncStreamingTask(getattr(self.api, f"astream_{mode}_response"), prompt)
+        else:
+            self.worker = StreamingWorker(getattr(self.api, f"stream_{mode}_response"), prompt)
         self.worker.partial_response.connect(self._update_partial_response)
         self.worker.finished.connect(self._on_stream_finished)
         self.worker.error.connect(self._show_stream_error)
         self.worker.start()
+        self._stopped_workers = [worker for worker in self._stopped_workers if worker.isRunning()]
         
         # 禁用按钮防止重复发送
         self.send_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+
+    def _stop_generation(self):
+        """停止当前回答：已显示的部分保留，这一轮不计入对话记忆"""
+        worker = self.worker
+        if worker is None:
+            return
+        # 线程在检索结束或下一个 token 到达时关闭 HTTP 流并退出，之后不再发出信号
+        worker.cancel()
+        self._stopped_workers.append(worker)
+        self._remove_last_ai_message()
+        self._append_ai_message(f"{self.current_response} <i style='color: gray;'>（已停止）</i>")
+        self._finish_stream()
+        self.statusBar().showMessage("已停止生成", 2000)
 
     @pyqtSlot(str)
     def _update_partial_response(self, response):
-        """更新部分响应 - 替换最后一条AI消息"""
-        # 移除之前的"思考中..."消息
-        self._remove_last_ai_message()
-        
-        # 更新当前响应
+        """更新部分响应：记下最新的完整回答，由 _render_timer 合并到下一帧显示"""
+        if self.sender() is not self.worker:
+            return  # 已停止的线程在取消前发出、尚未处理的信号
         self.current_response = response
-        # 显示新内容
-        self._append_ai_message(response)
+        if not self._render_timer.isActive():
+            self._render_timer.start()
+
+    def _render_partial_response(self):
+        """把上一帧以来新增的文本追加到回答块末尾（不重建整条消息，耗时只与新增文本有关）"""
+        if self.worker is None:
+            return
+        start = time.perf_counter()
+        response = self.current_response
+        cursor = self._response_cursor
+        if cursor is None:
+            # 第一帧：用回答替换占位文字，沿用占位文字的字符格式（"AI:" 是粗体）
+            cursor = QTextCursor(self.output_area.document())
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            block = cursor.block()
+            self._response_start = block.position() + block.text().rfind(self._response_placeholder)
+            cursor.setPosition(self._response_start + 1)
+            self._response_format = cursor.charFormat()
+            self._rendered_response = self._response_placeholder
+            self._response_cursor = cursor
+        if response.startswith(self._rendered_response):
+            delta = response[len(self._rendered_response):]
+        else:
+            # 不是在已显示文本后追加（例如占位文字或错误信息），重写整个回答
+            cursor.setPosition(self._response_start)
+            cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock, QTextCursor.MoveMode.KeepAnchor)
+            delta = response
+        # 换行用行分隔符，整条回答保持在一个块中（完成或停止时 _remove_last_ai_message 删除这个块）
+        cursor.insertText(delta.replace("\n", "\u2028"), self._response_format)
+        self._rendered_response = response
+        self._scroll_to_bottom()
+        get_metrics().observe("render", time.perf_counter() - start)
 
     @pyqtSlot()
     def _on_stream_finished(self):
         """流式处理完成"""
+        if self.sender() is not self.worker:
+            return
         # 确保最后一条消息是最终结果（而不是"思考中..."）
         self._remove_last_ai_message()
+        if self._render_markdown:
+            # 生成/对话模式：完成后按 Markdown 渲染完整回答
+            import markdown
+            self._append_ai_message(markdown.markdown(self.current_response))
+            self._finish_stream()
+            self._show_turn_stats()
+            return
         # print(f"最终响应内容: {self.current_response}")  # 调试输出
         plain_text = re.sub(r'<[^>]+>', '', self.current_response)  # 移除所有HTML标签
         # print(f"最终响应内容: {plain_text}")  # 调试输出
@@ -248,20 +413,28 @@ class ChatWindow(QMainWindow):
         # print(f"最终响应内容: {plain_text}")  # 调试输出
         plain_text = re.sub(r'\s+', ' ', plain_text).strip()  # 合并多余空格
         self.current_response = plain_text  # 更新当前响应为纯文本
-        print(f"最终响应内容: {self.current_response}")  # 调试输出
+        logger.debug("最终响应内容: %s", self.current_response)
         self._append_ai_message(self.current_response)
-        
+        self._finish_stream()
+        self._show_turn_stats()
+
+    def _finish_stream(self):
         # 清理资源
         self.worker = None
         self.current_response = ""
+        self._render_timer.stop()
+        self._response_cursor = None
         self.send_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
     
     @pyqtSlot(str)
     def _show_stream_error(self, error_msg):
         """显示错误信息"""
+        if self.sender() is not self.worker:
+            return
         self._remove_last_ai_message()
         self._append_ai_message(f"<span style='color: red;'>{error_msg}</span>")
-        self._on_stream_finished()
+        self._finish_stream()
 
     def _append_user_message(self, text):
         """添加用户消息"""
@@ -313,50 +486,46 @@ class ChatWindow(QMainWindow):
         scrollbar.setValue(scrollbar.maximum())
 
     def _send_generate_message(self):
-        prompt = self.input_box.toPlainText().strip()
-        if not prompt:
-            return
-            
-        self.output_area.append(f"<b>You:</b> {prompt}")
-        self.input_box.clear()
-        
-        # 创建工作线程
-        self.worker = GenerateWorker(self.api, prompt)
-        self.worker.finished.connect(self._show_response)
-        self.worker.error.connect(self._show_error)
-        self.worker.start()
-        
-        # 禁用按钮防止重复发送
-        self.send_btn.setEnabled(False)
+        self._send_stream_message("generate", render_markdown=True)
 
     def _send_chat_message(self):
-        prompt = self.input_box.toPlainText().strip()
-        if not prompt:
-            return
-            
-        self.output_area.append(f"<b>You:</b> {prompt}")
-        self.input_box.clear()
-        
-        # 创建工作线程
-        self.worker = ChatWorker(self.api, prompt)
-        self.worker.finished.connect(self._show_response)
-        self.worker.error.connect(self._show_error)
-        self.worker.start()
-        
-        # 禁用按钮防止重复发送
-        self.send_btn.setEnabled(False)
+        self._send_stream_message("chat", render_markdown=True)
 
-    def _show_response(self, response):
-
-        # 处理Markdown转换
-        html_response = markdown.markdown(response)
-        self.current_response = html_response      
-        self.output_area.append(f"<b>AI:</b> {html_response}")
-        self.send_btn.setEnabled(True)
+    def _show_turn_stats(self):
+        """在状态栏显示最近一轮的提示长度、耗时和历史窗口大小"""
+        stats = self.api.last_turn_stats
+        if not stats:
+            return
+        # 检索模式没有 Ollama 的 token 统计，显示估计值
+        prompt_tokens = stats['prompt_tokens'] or f"约 {stats['estimated_prompt_tokens']}"
+        message = (f"提示 {prompt_tokens} tokens，生成 {stats['completion_tokens']} tokens，"
+                   f"耗时 {stats['latency']:.1f} 秒")
+        if stats['queue_wait'] >= 0.1:
+            message += f"，排队 {stats['queue_wait']:.1f} 秒"
+        if stats['time_to_first_token'] is not None:
+            message += f"，首个 token {stats['time_to_first_token']:.2f} 秒"
+        if stats['tokens_per_second']:
+            message += f"（{stats['tokens_per_second']:.1f} tokens/秒）"
+        if 'window_messages' not in stats:
+            self.statusBar().showMessage(message, 8000)
+            return
+        message += f"，历史 {stats['window_messages']} 条消息"
+        if stats['summarized_messages']:
+            message += f"（另有 {stats['summarized_messages']} 条已摘要）"
+        self.statusBar().showMessage(message, 8000)
     
-    def _show_error(self, error_msg):
-        self.output_area.append(f"<b style='color:red'>错误:</b> {error_msg}")
-        self.send_btn.setEnabled(True)
+    def _toggle_profiling(self, enabled):
+        for target in PROFILE_TARGETS:
+            set_profiling(target, enabled)
+        if enabled:
+            self.statusBar().showMessage(f"已开启性能分析，报告写入 {os.path.abspath(settings.PROFILE_DIR)}", 5000)
+        else:
+            self.statusBar().showMessage("已关闭性能分析", 2000)
+
+    def _update_metrics_label(self):
+        summary = get_metrics().status_summary()
+        self.metrics_label.setText(summary)
+        self.metrics_label.setToolTip("最近各阶段耗时的中位数" if summary else "")
 
     def _toggle_mode(self):
         """切换聊天/生成模式"""
@@ -453,13 +622,13 @@ class ChatWindow(QMainWindow):
             # 复制文件到目标目录
             shutil.copyfile(file_path, target_path)
             
-            # 更新索引
-            self.api.rebuild_index_and_chain()
-            
             # 显示成功消息
             self.output_area.append(
-                f"<div style='color: green;'>已成功上传文档: {file_name}</div>"
+                f"<div style='color: green;'>已成功上传文档: {file_name}，正在后台更新索引...</div>"
             )
+
+            # 在后台更新索引（只检查上传的文件）
+            self._start_indexing([file_name])
             
             # 滚动到底部
             self.output_area.verticalScrollBar().setValue(
@@ -470,3 +639,67 @@ class ChatWindow(QMainWindow):
             self.output_area.append(
                 f"<div style='color: red;'>上传失败: {str(e)}</div>"
             )
+
+
+    def _start_indexing(self, paths=None):
+        """在后台线程中增量更新索引，检索模式在此期间继续使用已提交的索引
+
+        paths 为相对文档目录的路径列表，None 表示扫描整个目录。
+        """
+        paths = [""] if paths is None else paths  # "" 表示整个文档目录
+        if self.index_worker and self.index_worker.isRunning():
+            self._pending_index_paths.update(paths)
+            return
+
+        self._pending_index_paths.clear()
+        self.index_worker = IndexingWorker(self.api, sorted(paths))
+        self.index_worker.progress.connect(self._on_index_progress)
+        self.index_worker.finished.connect(self._on_index_finished)
+        self.index_worker.error.connect(self._on_index_error)
+        self.index_worker.start()
+        self.cancel_index_btn.setEnabled(True)
+        self.statusBar().showMessage("正在更新知识库索引...")
+
+    def _cancel_indexing(self):
+        if self.index_worker and self.index_worker.isRunning():
+            self._pending_index_paths.clear()
+            self.index_worker.cancel()
+            self.cancel_index_btn.setEnabled(False)
+            self.statusBar().showMessage("正在取消索引...")
+
+    @pyqtSlot(dict)
+    def _on_index_progress(self, progress):
+        """在状态栏显示索引进度"""
+        message = (f"索引中: 已解析 {progress['files_parsed']}/{progress['files_total']} 个文件，"
+                   f"已嵌入 {progress['chunks_embedded']} 个块")
+        if progress['eta'] is not None:
+            message += f"，预计剩余 {progress['eta']:.0f} 秒"
+        self.statusBar().showMessage(message)
+
+    @pyqtSlot(str)
+    def _on_index_finished(self, result):
+        self.cancel_index_btn.setEnabled(False)
+        self.statusBar().showMessage(result, 5000)
+        if self._pending_index_paths:
+            self.index_worker.wait()  # finished 在 run() 返回前发出，等待线程真正结束
+            self._start_indexing(list(self._pending_index_paths))
+
+    @pyqtSlot(str)
+    def _on_index_error(self, error_msg):
+        self.cancel_index_btn.setEnabled(False)
+        self.statusBar().showMessage(error_msg, 5000)
+        self.output_area.append(f"<div style='color: red;'>{error_msg}</div>")
+
+    def closeEvent(self, event):
+        """关闭窗口前停止目录监视和后台索引，已提交的部分保留在索引中"""
+        if self.doc_watcher:
+            self.doc_watcher.stop()
+        if self.index_worker and self.index_worker.isRunning():
+            self.index_worker.cancel()
+            self.index_worker.wait()
+        if self.worker is not None:
+            self.worker.cancel()
+            self._stopped_workers.append(self.worker)
+        for worker in self._stopped_workers:
+            worker.wait()
+        super().closeEvent(event)